@@ -1,13 +1,19 @@
 """
 This file exposes 'app' to the module.
+
+Everything is imported lazily (on first attribute access), so `import verysimpletransformers` is fast.
 """
 
 # SPDX-FileCopyrightText: 2023-present Robin van der Noord <robinvandernoord@gmail.com>
 #
 # SPDX-License-Identifier: MIT
 
-from .cli import app
-from .core import bundle_model, dump_to_disk, from_vst, load_model, to_vst
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .cli import app
+    from .core import bundle_model, dump_to_disk, from_vst, load_model, to_vst
 
 __all__ = [
     # cli
@@ -19,3 +25,22 @@ __all__ = [
     "bundle_model",
     "dump_to_disk",
 ]
+
+_LAZY_IMPORTS = {
+    "app": ".cli",
+    "to_vst": ".core",
+    "from_vst": ".core",
+    "load_model": ".core",
+    "bundle_model": ".core",
+    "dump_to_disk": ".core",
+}
+
+
+def __getattr__(name: str) -> typing.Any:
+    """
+    Import the public functions on first use.
+    """
+    if module := _LAZY_IMPORTS.get(name):
+        return getattr(importlib.import_module(module, __name__), name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
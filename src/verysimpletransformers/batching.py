@@ -0,0 +1,294 @@
+"""
+Dynamic micro-batching for the server: concurrent requests are merged into one `model.predict` call.
+
+A forward pass over a batch of 32 inputs is much faster than 32 passes over a single input, so instead of predicting
+per request, every request is put on a shared queue. A worker thread takes the first waiting request, keeps
+collecting requests until `max_batch` inputs are gathered or `max_wait` seconds have passed, predicts all inputs at
+once and gives every request its own slice of the results.
+
+Admission control: with `max_queue`, requests are rejected (QueueFullException) instead of queued when that many \
+inputs are already waiting, and requests with a deadline that passes while they wait are dropped before the model \
+sees them (DeadlineExceededException). Under overload, the server then answers quickly with "try again later" instead \
+of spending its compute on answers that nobody waits for anymore.
+
+Usage:
+    with MicroBatcher(predict, max_batch=32, max_wait=0.005) as batcher:
+        outputs = batcher.predict(["first input", "second input"])  # from any thread
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+import typing
+from concurrent.futures import Future
+
+from typing_extensions import Self
+
+from .exceptions import DeadlineExceededException, QueueFullException
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .metrics import ServerMetrics
+
+Prediction = str | int
+PredictFunction = typing.Callable[[list[str]], list[Prediction]]
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT = 0.005  # seconds
+
+
+class PendingRequest:
+    """
+    Inputs of one request, waiting to be predicted in a batch. The result (or exception) is set on `future`.
+    """
+
+    def __init__(self, inputs: list[str], deadline: float | None = None) -> None:
+        """
+        The future is resolved with exactly one output per input.
+
+        The deadline (in `time.monotonic()` seconds) is when the client stops waiting for the outputs.
+        """
+        self.inputs = inputs
+        self.deadline = deadline
+        self.future: Future[list[Prediction]] = Future()
+        self.queued_at = time.perf_counter()
+
+    def expired(self, now: float | None = None) -> bool:
+        """
+        Whether the deadline has passed.
+        """
+        return self.deadline is not None and (time.monotonic() if now is None else now) >= self.deadline
+
+
+class MicroBatcher:
+    """
+    Worker thread that collects requests from a queue and predicts them in batches.
+
+    A single request with more than max_batch inputs is predicted on its own, it is never split. \
+        Requests whose future is cancelled before their batch starts are not predicted. \
+        The predict function can be replaced with `swap` (e.g. to serve a new version of the model), which takes \
+        effect between two batches. With `max_queue`, at most that many inputs wait at the same time (a single \
+        request with more inputs is only accepted when nothing is waiting).
+    """
+
+    def __init__(
+        self,
+        predict: PredictFunction,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        metrics: ServerMetrics | None = None,
+        max_queue: int | None = None,
+    ) -> None:
+        """
+        `predict` is called with the inputs of a whole batch and should return one output per input.
+
+        With metrics, the queue time of every request, the duration and size of every batch, the amount of queued \
+            inputs and the rejected requests are recorded. Without max_queue, the queue is unbounded.
+        """
+        if max_batch < 1:
+            raise ValueError(f"max_batch should be at least 1, got {max_batch}.")
+        if max_queue is not None and max_queue < 1:
+            raise ValueError(f"max_queue should be at least 1, got {max_queue}.")
+
+        self._predict = predict
+        self._predict_lock = threading.Lock()  # held while a batch is predicted
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max(max_wait, 0.0)
+        self._queue: queue.Queue[PendingRequest | None] = queue.Queue()
+        self._carry: PendingRequest | None = None  # request that did not fit in the previous batch
+        self.max_queue = max_queue
+        self._queued = 0  # inputs that are submitted, but whose batch has not started yet
+        self._queued_lock = threading.Lock()
+        self._seconds_per_input = 0.0  # moving average of the predict time, to estimate when the queue has room
+        self._thread = threading.Thread(target=self._run, name="vst-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def queued(self) -> int:
+        """
+        Amount of inputs waiting for their batch.
+        """
+        return self._queued
+
+    @property
+    def full(self) -> bool:
+        """
+        Whether new requests are rejected right now.
+        """
+        return self.max_queue is not None and self._queued >= self.max_queue
+
+    def retry_after(self) -> float:
+        """
+        Estimate of how long it takes until the queued inputs are predicted (in seconds, at least 1).
+        """
+        return max(self._queued * self._seconds_per_input, 1.0)
+
+    def _reject(self, request: PendingRequest, error: Exception, reason: str) -> None:
+        if self.metrics:
+            self.metrics.rejected.inc(label=reason)
+        request.future.set_exception(error)
+
+    def submit(
+        self, inputs: list[str], deadline: float | None = None, bounded: bool = True
+    ) -> Future[list[Prediction]]:
+        """
+        Queue inputs for prediction, the returned future resolves with their outputs.
+
+        The future fails with QueueFullException if the queue is full (unless `bounded` is False, e.g. for a stream \
+            that was already accepted) and with DeadlineExceededException if the deadline (`time.monotonic()` \
+            seconds) passes before the batch of these inputs starts.
+        """
+        request = PendingRequest(list(inputs), deadline)
+        if not request.inputs:
+            request.future.set_result([])
+            return request.future
+
+        if request.expired():
+            self._reject(request, DeadlineExceededException("The deadline passed before it was queued."), "deadline")
+            return request.future
+
+        with self._queued_lock:
+            # a request that is larger than the whole queue is still accepted when nothing else waits:
+            overflows = self.max_queue is not None and self._queued + len(request.inputs) > self.max_queue
+            if bounded and overflows and self._queued:
+                self._reject(request, QueueFullException(self.retry_after()), "queue_full")
+                return request.future
+            self._queued += len(request.inputs)
+
+        if self.metrics:
+            self.metrics.queued.inc(len(request.inputs))
+        self._queue.put(request)
+        return request.future
+
+    def swap(self, predict: PredictFunction) -> PredictFunction:
+        """
+        Use another predict function from the next batch on, waits until the running batch (if any) is done.
+
+        Returns the previous predict function, which is not used anymore.
+        """
+        with self._predict_lock:
+            previous, self._predict = self._predict, predict
+        return previous
+
+    def predict(self, inputs: list[str], deadline: float | None = None, bounded: bool = True) -> list[Prediction]:
+        """
+        Queue inputs and wait for their outputs (see `submit`).
+        """
+        return self.submit(inputs, deadline, bounded).result()
+
+    def _next(self, timeout: float | None = None) -> PendingRequest | None:
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self) -> list[PendingRequest] | None:
+        """
+        Wait for a first request, then gather more until the batch is full or max_wait has passed.
+
+        Returns None when the batcher is closed.
+        """
+        if (first := self._next()) is None:
+            return None
+
+        batch, size = [first], len(first.inputs)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            try:
+                request = self._next(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+
+            if request is None:
+                # closing: finish this batch first
+                self._queue.put(None)
+                break
+
+            if size + len(request.inputs) > self.max_batch:
+                self._carry = request
+                break
+
+            batch.append(request)
+            size += len(request.inputs)
+
+        return batch
+
+    def _dequeue(self, batch: list[PendingRequest]) -> list[PendingRequest]:
+        """
+        Take the requests of a batch off the queue, and drop those that nobody waits for anymore.
+        """
+        amount = sum(len(request.inputs) for request in batch)
+        with self._queued_lock:
+            self._queued -= amount
+        if self.metrics:
+            self.metrics.queued.dec(amount)
+
+        now = time.monotonic()
+        live = []
+        for request in batch:
+            # requests that were cancelled while waiting (e.g. the client disconnected) are skipped:
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            if request.expired(now):
+                self._reject(request, DeadlineExceededException("The deadline passed while it was queued."), "deadline")
+                continue
+            live.append(request)
+        return live
+
+    def _run_batch(self, batch: list[PendingRequest]) -> None:
+        if not (batch := self._dequeue(batch)):
+            return
+
+        inputs = [text for request in batch for text in request.inputs]
+        started = time.perf_counter()
+        if self.metrics:
+            for request in batch:
+                self.metrics.stages.observe(started - request.queued_at, "queue")
+
+        try:
+            with self._predict_lock:
+                outputs = self._predict(inputs)
+            elapsed = time.perf_counter() - started
+            if self.metrics:
+                self.metrics.record_batch(len(inputs), elapsed)
+            per_input = elapsed / len(inputs)
+            self._seconds_per_input = (
+                0.8 * self._seconds_per_input + 0.2 * per_input if self._seconds_per_input else per_input
+            )
+            if len(outputs) != len(inputs):
+                raise ValueError(f"Expected {len(inputs)} predictions, got {len(outputs)}.")
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        start = 0
+        for request in batch:
+            end = start + len(request.inputs)
+            request.future.set_result(list(outputs[start:end]))
+            start = end
+
+    def _run(self) -> None:
+        while (batch := self._collect()) is not None:
+            self._run_batch(batch)
+
+    def close(self) -> None:
+        """
+        Stop the worker after the queued requests are done.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> Self:
+        """
+        The worker already runs, context manager usage closes it afterwards.
+        """
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """
+        Stop the worker.
+        """
+        self.close()
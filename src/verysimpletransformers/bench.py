@@ -0,0 +1,445 @@
+"""
+Benchmark saving and loading of `.vst` files, to choose compression settings and catch format regressions.
+
+Synthetic models (BenchModel) with real tensors of a given size are saved with `to_vst` and loaded with `from_vst`
+for every combination of payload format and compression. For each case, the time, throughput, file size and peak
+memory (RSS) are measured and collected as BenchResult rows, which can be written as CSV or JSON.
+
+Usage:
+    vst bench --size 10MB,1GB --compression zlib:1,zstd:3 --output results.csv
+
+Notes:
+    - the file was just written, so loading is measured with a warm page cache.
+    - random tensor data is (like real model weights) hard to compress, so ratios are close to real models.
+
+The inference of a real model can be benchmarked with `bench_predict` (`vst bench-predict model.vst`): the model is
+loaded once and `model.predict` is called for every combination of batch size and input length, after a few warmup
+iterations. The latency percentiles and throughput are collected as PredictResult rows.
+"""
+from __future__ import annotations
+
+import csv
+import gc
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import typing
+from pathlib import Path
+
+from typing_extensions import Self
+
+from .compression import CODECS, available_codecs, parse_compression
+from .support import RedirectStdStreams, devnull
+from .types import PAYLOAD_FORMATS, UNCOMPRESSED_PAYLOAD_FORMATS, DummyModel, PayloadFormat
+
+MB = 1024 * 1024
+DEFAULT_SIZES = ("10MB", "100MB")
+# biggest single tensor of a BenchModel, like the largest layers of a transformer:
+MAX_TENSOR_SIZE = 64 * MB
+
+# a few levels per codec, from fastest to smallest:
+DEFAULT_LEVELS: dict[str, tuple[int, ...]] = {
+    "none": (0,),
+    "zlib": (0, 1, 6, 9),
+    "zstd": (1, 3, 9, 19),
+    "lz4": (0, 9, 16),
+}
+
+UNITS = {"B": 1, "KB": 1024, "MB": MB, "GB": 1024 * MB}
+
+
+def parse_size(size: str | int) -> int:
+    """
+    Convert a human-readable size ('10MB', '5GB', '1024') to an amount of bytes.
+    """
+    if isinstance(size, int):
+        return size
+
+    text = size.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text.removesuffix(unit)) * UNITS[unit])
+
+    return int(text)
+
+
+class BenchModel(DummyModel):
+    """
+    DummyModel that carries `size` bytes of (random, float32) tensors, split like the layers of a real model.
+    """
+
+    def __init__(self, size: int) -> None:
+        """
+        Create random tensors of at most MAX_TENSOR_SIZE bytes each, with a total of (roughly) `size` bytes.
+        """
+        import torch
+
+        generator = torch.Generator().manual_seed(size)
+        self.weights: dict[str, torch.Tensor] = {}
+        remaining = size
+        while remaining > 0:
+            nbytes = min(remaining, MAX_TENSOR_SIZE)
+            name = f"layer.{len(self.weights)}.weight"
+            self.weights[name] = torch.randn(max(nbytes // 4, 1), generator=generator)
+            remaining -= nbytes
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of the tensors.
+        """
+        return sum(tensor.nbytes for tensor in self.weights.values())
+
+
+def default_compressions() -> list[str]:
+    """
+    All default levels of the codecs that are installed, e.g. 'zlib:6'.
+    """
+    return [f"{codec}:{level}" for codec in available_codecs() for level in DEFAULT_LEVELS.get(codec, (0,))]
+
+
+def all_compressions() -> list[str]:
+    """
+    Every level of every installed codec.
+    """
+    return [f"{name}:{level}" for name in available_codecs() for level in CODECS[name].levels]
+
+
+def current_rss() -> int:
+    """
+    Resident memory of this process in bytes.
+
+    Read from /proc on Linux, elsewhere the peak RSS of the process is used (which never decreases).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):  # pragma: no cover
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS:
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """
+    Context manager that samples the RSS on a background thread, to find the peak memory use during a block.
+
+    'peak' is the highest RSS in bytes and 'delta' how much that is above the RSS at the start of the block.
+    """
+
+    def __init__(self, interval: float = 0.001) -> None:
+        """
+        Sample every `interval` seconds.
+        """
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="vst-bench-rss", daemon=True)
+
+    @property
+    def delta(self) -> int:
+        """
+        Extra memory at the peak, compared to the start.
+        """
+        return max(self.peak - self.start, 0)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self) -> Self:
+        """
+        Start sampling.
+        """
+        self.start = self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """
+        Stop sampling (and take a final sample).
+        """
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class BenchResult(typing.NamedTuple):
+    """
+    Measurements of saving and loading one model with one payload format and compression.
+
+    Sizes are in bytes, times in seconds, throughput in MB (of tensor data) per second.
+    """
+
+    model_size: int
+    payload_format: str
+    codec: str
+    level: int
+    file_size: int
+    ratio: float
+    save_seconds: float
+    load_seconds: float
+    save_mb_per_second: float
+    load_mb_per_second: float
+    save_peak_rss_delta: int
+    load_peak_rss_delta: int
+
+
+def _throughput(size: int, seconds: float) -> float:
+    return size / MB / seconds if seconds else 0.0
+
+
+def run_case(
+    model: BenchModel,
+    path: Path,
+    payload_format: PayloadFormat,
+    compression: str,
+    workers: int | None = None,
+) -> BenchResult:
+    """
+    Save the model to path and load it again, while measuring time and memory.
+
+    'mmap' payloads are stored uncompressed and loaded with mmap=True.
+    """
+    from .core import from_vst, to_vst
+
+    codec, level = parse_compression(compression)
+    if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS:
+        codec, level = CODECS["none"], 0
+
+    size = model.nbytes
+    gc.collect()
+
+    with RedirectStdStreams(stdout=devnull, stderr=devnull):
+        with PeakMemory() as save_memory:
+            start = time.perf_counter()
+            to_vst(model, path, compression=f"{codec.name}:{level}", payload_format=payload_format, workers=workers)
+            save_seconds = time.perf_counter() - start
+
+        gc.collect()
+        with PeakMemory() as load_memory:
+            start = time.perf_counter()
+            loaded = from_vst(path, device="cpu", mmap=payload_format == "mmap", workers=workers)
+            load_seconds = time.perf_counter() - start
+
+    del loaded
+    file_size = path.stat().st_size
+    path.unlink()
+
+    return BenchResult(
+        model_size=size,
+        payload_format=payload_format,
+        codec=codec.name,
+        level=level,
+        file_size=file_size,
+        ratio=round(file_size / size, 4) if size else 0.0,
+        save_seconds=round(save_seconds, 4),
+        load_seconds=round(load_seconds, 4),
+        save_mb_per_second=round(_throughput(size, save_seconds), 1),
+        load_mb_per_second=round(_throughput(size, load_seconds), 1),
+        save_peak_rss_delta=save_memory.delta,
+        load_peak_rss_delta=load_memory.delta,
+    )
+
+
+def run_benchmark(
+    sizes: typing.Iterable[str | int] = DEFAULT_SIZES,
+    payload_formats: typing.Iterable[PayloadFormat] = PAYLOAD_FORMATS,
+    compressions: typing.Iterable[str] | None = None,
+    directory: str | Path | None = None,
+    workers: int | None = None,
+) -> typing.Generator[BenchResult, None, None]:
+    """
+    Benchmark every combination of model size, payload format and compression (default: `default_compressions`).
+
+    Uncompressed payload formats ('mmap') are only run once per size. Files are written to a temporary directory \
+        (in `directory`, default: the system's temp dir). Results are yielded as soon as each case is done.
+    """
+    compressions = list(compressions or default_compressions())
+    payload_formats = list(payload_formats)
+
+    with tempfile.TemporaryDirectory(prefix="vst-bench-", dir=directory) as tmp:
+        path = Path(tmp) / "bench.vst"
+        for size in sizes:
+            model = BenchModel(parse_size(size))
+            for payload_format in payload_formats:
+                uncompressed = payload_format in UNCOMPRESSED_PAYLOAD_FORMATS
+                for compression in compressions[:1] if uncompressed else compressions:
+                    yield run_case(model, path, payload_format, compression, workers=workers)
+
+            del model
+
+
+DEFAULT_BATCH_SIZES = (1, 8, 32)
+DEFAULT_INPUT_LENGTHS = (16, 128)  # in words
+
+# vocabulary for synthetic inputs:
+WORDS = (
+    "the", "model", "was", "trained", "on", "a", "large", "amount", "of", "text", "and", "can", "now", "be", "used",
+    "to", "predict", "labels", "for", "new", "sentences", "while", "server", "keeps", "running", "with", "low",
+    "latency", "every", "request", "that", "comes", "in", "from", "users", "around", "world",
+)
+
+
+class PredictResult(typing.NamedTuple):
+    """
+    Latency (per `model.predict` call with batch_size inputs) and throughput for one batch size and input length.
+
+    input_length is in words, or 0 when the samples were used as-is.
+    """
+
+    batch_size: int
+    input_length: int
+    iterations: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    items_per_second: float
+
+
+def percentile(values: typing.Sequence[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of some values.
+    """
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(int(-(-percent * len(ordered) // 100)), 1)  # ceil
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def synthetic_inputs(amount: int, length: int, seed: int = 0) -> list[str]:
+    """
+    Generate `amount` sentences of `length` random words.
+    """
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=length)) for _ in range(amount)]
+
+
+def fit_inputs(samples: typing.Sequence[str], amount: int, length: int = 0) -> list[str]:
+    """
+    Take `amount` inputs from the samples (repeated if there are not enough).
+
+    With a length, every sample is truncated or repeated to exactly that many words.
+    """
+    if not samples:
+        raise ValueError("No samples to benchmark with.")
+
+    inputs = list(itertools.islice(itertools.cycle(samples), amount))
+    if not length:
+        return inputs
+
+    return [" ".join(itertools.islice(itertools.cycle(text.split() or ["."]), length)) for text in inputs]
+
+
+def read_samples(path: str | Path) -> list[str]:
+    """
+    Read the non-empty lines of a text file as samples.
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def measure_predict(
+    model: typing.Any, inputs: list[str], iterations: int = 20, warmup: int = 3
+) -> tuple[list[float], float]:
+    """
+    Call model.predict(inputs) `warmup` times unmeasured, then `iterations` times.
+
+    Returns the latency of each call (in seconds) and the total time.
+    """
+    with RedirectStdStreams(stdout=devnull, stderr=devnull):
+        # model prints (e.g. progress bars) are hidden
+        for _ in range(warmup):
+            model.predict(inputs)
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call_start = time.perf_counter()
+            model.predict(inputs)
+            latencies.append(time.perf_counter() - call_start)
+        total = time.perf_counter() - start
+
+    return latencies, total
+
+
+def bench_predict(
+    model: typing.Any,
+    batch_sizes: typing.Iterable[int] = DEFAULT_BATCH_SIZES,
+    input_lengths: typing.Iterable[int] = DEFAULT_INPUT_LENGTHS,
+    samples: typing.Sequence[str] | None = None,
+    iterations: int = 20,
+    warmup: int = 3,
+) -> typing.Generator[PredictResult, None, None]:
+    """
+    Benchmark model.predict for every combination of batch size and input length (in words).
+
+    Inputs are taken from `samples` or generated (synthetic_inputs). With samples, an input length of 0 uses the \
+        samples as-is. Results are yielded as soon as each combination is done.
+    """
+    if iterations < 1:
+        raise ValueError(f"At least one iteration is required, got {iterations}.")
+
+    for batch_size, length in itertools.product(batch_sizes, input_lengths):
+        if samples:
+            inputs = fit_inputs(samples, batch_size, length)
+        else:
+            inputs = synthetic_inputs(batch_size, length or DEFAULT_INPUT_LENGTHS[0], seed=batch_size * length)
+
+        latencies, total = measure_predict(model, inputs, iterations=iterations, warmup=warmup)
+        yield PredictResult(
+            batch_size=batch_size,
+            input_length=length,
+            iterations=iterations,
+            p50_ms=round(percentile(latencies, 50) * 1000, 3),
+            p95_ms=round(percentile(latencies, 95) * 1000, 3),
+            p99_ms=round(percentile(latencies, 99) * 1000, 3),
+            mean_ms=round(total / iterations * 1000, 3),
+            items_per_second=round(batch_size * iterations / total, 1) if total else 0.0,
+        )
+
+
+AnyResult = typing.TypeVar("AnyResult", BenchResult, PredictResult)
+
+
+def write_csv(results: typing.Iterable[AnyResult], file: typing.TextIO) -> None:
+    """
+    Write results as CSV (with a header row), one row per result as soon as it is available.
+    """
+    writer = csv.writer(file)
+    header_written = False
+    for result in results:
+        if not header_written:
+            writer.writerow(result._fields)
+            header_written = True
+        writer.writerow(result)
+        file.flush()
+
+
+def write_json(results: typing.Iterable[AnyResult], file: typing.TextIO) -> None:
+    """
+    Write results as a JSON list of objects.
+    """
+    json.dump([result._asdict() for result in results], file, indent=2)
+    file.write("\n")
+
+
+def format_results(results: typing.Sequence[AnyResult]) -> str:
+    """
+    Plain text table of results, with right-aligned columns.
+    """
+    if not results:
+        return ""
+
+    rows = [results[0]._fields, *(tuple(str(value) for value in result) for result in results)]
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
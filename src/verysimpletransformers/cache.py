@@ -0,0 +1,185 @@
+"""
+In-process LRU cache of predictions, for servers where a small set of inputs makes up most of the queries.
+
+Inputs are normalized (unicode NFC, surrounding whitespace stripped and inner whitespace collapsed) before they are
+used as key, so trivially different queries share an entry. The cache is bounded by an amount of entries and/or an
+approximate amount of bytes, evicts the least recently used entries first and can expire entries after a TTL.
+
+Usage:
+    cache = PredictionCache(max_entries=10_000, ttl=3600)
+    outputs = cache.predict(inputs, predict)  # only the inputs that are not cached are passed to predict
+    print(cache.stats())
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import typing
+import unicodedata
+from collections import OrderedDict
+
+from .batching import Prediction
+
+MISSING: typing.Any = object()
+
+
+def normalize(text: str) -> str:
+    """
+    Cache key of an input.
+    """
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+def entry_size(key: str, prediction: Prediction) -> int:
+    """
+    Approximate memory usage of an entry in bytes.
+    """
+    return sys.getsizeof(key) + sys.getsizeof(prediction)
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of predictions, with optional TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_entries: int | None = None, max_bytes: int | None = None, ttl: float | None = None) -> None:
+        """
+        Without max_entries and max_bytes, the cache is unbounded. A ttl (in seconds) expires entries.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Prediction, float, int]] = OrderedDict()  # prediction, time, size
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0  # incremented by clear, so predictions that were started before it are not stored
+
+    def __len__(self) -> int:
+        """
+        Amount of entries (including expired ones that were not looked up yet).
+        """
+        return len(self._entries)
+
+    def _pop(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def lookup(self, inputs: typing.Sequence[str]) -> list[Prediction]:
+        """
+        Get the cached prediction for every input, or MISSING.
+        """
+        now = time.monotonic()
+        results: list[Prediction] = []
+        with self._lock:
+            for text in inputs:
+                key = normalize(text)
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    self._pop(key)
+                    entry = None
+
+                if entry is None:
+                    self.misses += 1
+                    results.append(MISSING)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    results.append(entry[0])
+
+        return results
+
+    def store(
+        self, inputs: typing.Sequence[str], predictions: typing.Sequence[Prediction], generation: int | None = None
+    ) -> None:
+        """
+        Add predictions to the cache, evicting the least recently used entries when it's full.
+
+        With the generation of the lookup (see misses_of), predictions are dropped if the cache was cleared since \
+            (e.g. they may come from the model that was replaced by a reload).
+        """
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            for text, prediction in zip(inputs, predictions):
+                key = normalize(text)
+                if key in self._entries:
+                    self._pop(key)
+
+                size = entry_size(key, prediction)
+                if self.max_bytes is not None and size > self.max_bytes:
+                    continue
+
+                self._entries[key] = (prediction, now, size)
+                self.bytes += size
+                self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def misses_of(self, inputs: typing.Sequence[str]) -> tuple[list[Prediction], list[str], int]:
+        """
+        Look up inputs, returning the (partial) results, the unique inputs that still need to be predicted and the \
+            generation to store their predictions with.
+        """
+        generation = self.generation
+        results = self.lookup(inputs)
+        todo = {normalize(text): text for text, result in zip(inputs, results) if result is MISSING}
+        return results, list(todo.values()), generation
+
+    @staticmethod
+    def merge(
+        inputs: typing.Sequence[str], results: list[Prediction], todo: list[str], predictions: list[Prediction]
+    ) -> list[Prediction]:
+        """
+        Fill the MISSING results with the predictions of the `todo` inputs.
+        """
+        predicted = {normalize(text): prediction for text, prediction in zip(todo, predictions)}
+        return [predicted[normalize(text)] if result is MISSING else result for text, result in zip(inputs, results)]
+
+    def predict(
+        self, inputs: typing.Sequence[str], predict: typing.Callable[[list[str]], list[Prediction]]
+    ) -> list[Prediction]:
+        """
+        Get a prediction for every input, only the inputs that are not cached are passed to `predict` (once each).
+        """
+        results, todo, generation = self.misses_of(inputs)
+        if not todo:
+            return results
+
+        predictions = predict(todo)
+        self.store(todo, predictions, generation)
+        return self.merge(inputs, results, todo, predictions)
+
+    def clear(self) -> None:
+        """
+        Remove all entries, the counters are kept. Predictions that are still running are not stored anymore.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.generation += 1
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Counters and size of the cache, e.g. for JSON.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
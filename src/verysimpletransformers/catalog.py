@@ -0,0 +1,116 @@
+"""
+Quick overview of many `.vst` files, by only reading their metadata (the first few hundred bytes of each file).
+"""
+from __future__ import annotations
+
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .compression import DEFAULT_CODEC
+from .core import read_metadata
+from .metadata_schema import Metadata, Version
+from .streams import default_workers
+from .support import find_vst_files
+from .types import DEFAULT_PAYLOAD_FORMAT
+
+
+class CatalogEntry(typing.NamedTuple):
+    """
+    Metadata of a single file, or the reason why it could not be read.
+    """
+
+    path: Path
+    file_size: int
+    metadata: Metadata | None
+    error: str = ""
+
+
+def read_entry(path: Path) -> CatalogEntry:
+    """
+    Read only the metadata of a file, errors are stored in the entry instead of raised.
+    """
+    try:
+        with path.open("rb") as f:
+            return CatalogEntry(path, path.stat().st_size, read_metadata(f))
+    except Exception as e:
+        size = path.stat().st_size if path.is_file() else 0
+        return CatalogEntry(path, size, None, f"{type(e).__name__}: {e}")
+
+
+def scan(paths: typing.Iterable[str | Path], workers: int | None = None) -> list[CatalogEntry]:
+    """
+    Read the metadata of many files concurrently, directories are searched for .vst files.
+    """
+    with ThreadPoolExecutor(workers or default_workers(), thread_name_prefix="vst-catalog") as executor:
+        return list(executor.map(read_entry, find_vst_files(paths)))
+
+
+def format_size(size: float) -> str:
+    """
+    Human-readable file size.
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _format_version(version: Version | None) -> str:
+    return f"{version.major}.{version.minor}.{version.patch}" if version else "-"
+
+
+def _compression(metadata: Metadata) -> str:
+    header = metadata.meta_header
+    level = getattr(header, "compression_level", None)
+    if level is None:
+        return "-"
+
+    codec = getattr(header, "codec", None) or DEFAULT_CODEC
+    chunks = getattr(header, "chunk_count", 0)
+    return f"{codec}:{level}" + (f" ({chunks} chunks)" if chunks else "")
+
+
+COLUMNS = ("file", "meta", "vst", "transformers", "torch", "device", "compression", "format", "payload", "size")
+RIGHT_ALIGNED = ("payload", "size")
+
+
+def catalog_row(entry: CatalogEntry) -> tuple[str, ...]:
+    """
+    Convert an entry into a row of strings, for each of COLUMNS.
+    """
+    if not (metadata := entry.metadata):
+        return str(entry.path), "invalid", *["-"] * 7, format_size(entry.file_size)
+
+    header = metadata.meta_header
+    return (
+        str(entry.path),
+        f"v{metadata.meta_version}",
+        _format_version(getattr(header, "verysimpletransformers_version", None)),
+        _format_version(getattr(header, "transformers_version", None)),
+        getattr(header, "torch_version", None) or "-",
+        getattr(header, "device", None) or "-",
+        _compression(metadata),
+        getattr(header, "payload_format", None) or DEFAULT_PAYLOAD_FORMAT,
+        format_size(metadata.content_length),
+        format_size(entry.file_size),
+    )
+
+
+def format_catalog(entries: typing.Iterable[CatalogEntry]) -> str:
+    """
+    Build a plain text table with the versions, device, compression and sizes of each file.
+
+    Plain text (instead of a rich Table) keeps this fast for thousands of files.
+    """
+    rows = [COLUMNS, *map(catalog_row, entries)]
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(COLUMNS))]
+
+    return "\n".join(
+        "  ".join(
+            cell.rjust(width) if column in RIGHT_ALIGNED else cell.ljust(width)
+            for column, cell, width in zip(COLUMNS, row, widths)
+        ).rstrip()
+        for row in rows
+    )
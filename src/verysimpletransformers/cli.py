@@ -1,30 +1,29 @@
-"""This file contains all Typer Commands."""
+"""
+This file contains all Typer Commands.
+
+Most imports happen inside the commands, so `vst --help` (and cheap commands like `vst show`) start quickly.
+"""
+from __future__ import annotations
+
 import os
+import signal
 import sys
 import typing
 
-import questionary
 import typer
-from configuraptor.helpers import as_binaryio
 from rich import print
 
-from .core import (
-    DEFAULT_COMPRESSION,
-    ZeroThroughNine,
-    _from_vst,
-    dump_to_disk,
-    from_vst_with_metadata,
-    simple_load,
-    upgrade_metadata,
-)
+from .compression import CODECS, DEFAULT_COMPRESSION, CompressionOption
 from .exceptions import CorruptedModelException, custom_excepthook
 from .interactive import input_with_history
-from .metadata import print_metadata
-from .serve import _handle_predictions
+from .streams import DEFAULT_CHUNK_SIZE
 from .support import RedirectStdStreams, devnull, has_stdin
-from .types import SimpleTransformerProtocol
+from .timings import TimingReport
+from .types import PayloadFormat, SimpleTransformerProtocol
 
 if typing.TYPE_CHECKING:  # pragma: no cover
+    import questionary
+
     from .types import AllSimpletransformersModels
 
     ModelOrFilename = typing.Union[str, AllSimpletransformersModels]
@@ -43,6 +42,8 @@ def generate_custom_style(
 
     Primary and secondary color can be changed, other styles stay the same for consistency.
     """
+    import questionary
+
     return questionary.Style(
         [
             ("qmark", f"fg:{main_color} bold"),  # token in front of the question
@@ -59,17 +60,47 @@ def generate_custom_style(
     )
 
 
-def run_interactive(filename: ModelOrFilename) -> None:  # pragma: no cover
+def print_timings(timings: TimingReport) -> None:
+    """
+    Show the time, bytes and throughput per stage of loading or saving a model.
+    """
+    # not via rich, which would interpret the brackets:
+    sys.stderr.write(timings.format() + "\n")
+
+
+def _simple_load(filename: ModelOrFilename, timings: bool = False) -> tuple[typing.Any, str]:  # pragma: no cover
+    """
+    Quietly load a model via `simple_load`, optionally printing the timing report afterwards.
+    """
+    from .core import simple_load
+
+    if not timings:
+        return simple_load(filename)
+
+    report = TimingReport()
+    result = simple_load(filename, timings=report)
+    print_timings(report)
+    return result
+
+
+def run_interactive(filename: ModelOrFilename, timings: bool = False) -> None:  # pragma: no cover
     """
     Keep querying the user and process every 'prompt'.
 
     If an empty line is entered, the user will be prompted if they want to leave.
     The user can also exit with ctrl-d or ctrl-c.
     """
-    clear()
-    model, model_name = simple_load(filename)
+    import questionary
+
+    from .serve import _handle_predictions
 
     clear()
+    model, model_name = _simple_load(filename, timings)
+
+    if not timings:
+        # with timings, the report stays on screen
+        clear()
+
     print("Running", model, f"({model_name})" if model_name and model_name != str(model) else "")
 
     ask = input_with_history()
@@ -89,11 +120,13 @@ def run_interactive(filename: ModelOrFilename) -> None:  # pragma: no cover
             return
 
 
-def run_stdin(filename: str) -> None:  # pragma: no cover
+def run_stdin(filename: str, timings: bool = False) -> None:  # pragma: no cover
     """
     If the program immediatly gets data, process line by line and print predictions.
     """
-    model, model_name = simple_load(filename)
+    from .serve import _handle_predictions
+
+    model, model_name = _simple_load(filename, timings)
 
     for prompt in sys.stdin:
         with RedirectStdStreams(stdout=devnull, stderr=devnull):
@@ -106,27 +139,205 @@ DEFAULT_PORT = 8000
 DEFAULT_HOST = "localhost"
 
 
-def serve(filename: ModelOrFilename, port: int = DEFAULT_PORT, host: str = DEFAULT_HOST) -> None:  # pragma: no cover
+DEFAULT_MAX_BATCH = 1
+DEFAULT_MAX_WAIT_MS = 5.0
+
+
+def serve(
+    filename: ModelOrFilename,
+    port: int = DEFAULT_PORT,
+    host: str = DEFAULT_HOST,
+    timings: bool = False,
+    max_batch: int = DEFAULT_MAX_BATCH,
+    max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    use_async: bool = False,
+    workers: int | None = None,
+    cache_size: int | None = None,
+    cache_bytes: str | None = None,
+    cache_ttl: float | None = None,
+    warmup_rounds: int = 0,
+    warmup_batch_sizes: str | None = None,
+    warmup_lengths: str | None = None,
+    warmup_samples: str | None = None,
+    memory_budget: str | None = None,
+    reload: bool = False,
+    max_queue: int | None = None,
+) -> None:  # pragma: no cover
     """
     Start a simple HTTP server that responds to queries with model outputs.
+
+    With max_batch > 1, concurrent requests are merged into one `predict` call.
+    With use_async, the asyncio based server is used instead of the threaded one.
+    With workers > 1, the model is loaded once into shared memory and served by that many forked processes.
+    With cache_size (entries) and/or cache_bytes (e.g. '100MB'), predictions are cached (LRU), optionally for at most \
+        cache_ttl seconds.
+    With warmup_rounds (or any other warmup option, then 1 round), every combination of warmup_batch_sizes (default: \
+        1 and max_batch) and warmup_lengths (comma separated, in words) is predicted that many times before \
+        predictions are served, with inputs from warmup_samples (one per line) or generated. GET /readyz answers 200 \
+        when that's done. Without, the server is ready right away.
+    If filename is a directory, every `<name>.vst` in it is served at /models/<name>/predict. Models are loaded on \
+        first use and the least recently used ones are unloaded when they need more than memory_budget (e.g. '4GB').
+    With reload, new versions of the model file are loaded in the background and swapped in without downtime, when \
+        the file changes, on SIGHUP or on POST /admin/reload.
+    With max_queue, at most that many inputs wait for the model: other requests are answered 503 with Retry-After. \
+        Requests with an X-Deadline-Ms header are dropped (504) when the deadline passes before they are predicted.
     """
     # only local import to reduce overhead on other commands.
-    from .serve import MachineLearningModelServer
-
-    model, model_name = simple_load(filename)
-
-    print(f"Now serving [bright_magenta]{model_name}[/bright_magenta] on [cyan]http://{host}:{port}[/cyan]")
-    MachineLearningModelServer(host, port).serve_forever(model)
+    from .bench import DEFAULT_INPUT_LENGTHS, parse_size, read_samples
+    from .cache import PredictionCache
+    from .pool import ModelPool
+    from .reload import ModelReloader
+    from .serve import AsyncModelServer, MachineLearningModelServer
+    from .warmup import Warmup
+
+    cache = None
+    if cache_size or cache_bytes:
+        cache = PredictionCache(
+            max_entries=cache_size or None, max_bytes=parse_size(cache_bytes) if cache_bytes else None, ttl=cache_ttl
+        )
+
+    def split(value: str | None) -> tuple[int, ...]:
+        return tuple(int(_) for _ in value.split(",") if _.strip()) if value else ()
+
+    if not warmup_rounds and (warmup_batch_sizes or warmup_lengths or warmup_samples):
+        warmup_rounds = 1
+
+    warmup_spec = None
+    if warmup_rounds > 0:
+        samples = tuple(read_samples(warmup_samples)) if warmup_samples else ()
+        warmup_spec = Warmup(
+            batch_sizes=split(warmup_batch_sizes) or tuple(sorted({1, max_batch})),
+            input_lengths=split(warmup_lengths) or ((0,) if samples else DEFAULT_INPUT_LENGTHS),
+            rounds=warmup_rounds,
+            samples=samples,
+        )
+
+    pool = None
+    if isinstance(filename, str) and os.path.isdir(filename):
+        pool = ModelPool(
+            filename,
+            memory_budget=parse_size(memory_budget) if memory_budget else None,
+            max_batch=max_batch,
+            max_wait_ms=max_wait_ms,
+            cache=cache,
+            max_queue=max_queue,
+            warmup=warmup_spec,
+        )
+
+    from .prefork import PreforkServer, load_shared
+
+    if workers and workers > 1 and not hasattr(os, "fork"):
+        print("[yellow]--workers requires a POSIX system (os.fork), serving with one process.[/yellow]")
+        workers = None
+
+    model: typing.Any = None
+    if pool is not None:
+        print(
+            f"Now serving {len(pool.available())} models from [bright_magenta]{filename}[/bright_magenta] "
+            f"on [cyan]http://{host}:{port}/models/<name>/predict[/cyan]"
+        )
+    else:
+        if workers and workers > 1:
+            report = TimingReport() if timings else None
+            model, model_name = load_shared(filename, timings=report)
+            if report:
+                print_timings(report)
+        else:
+            model, model_name = _simple_load(filename, timings)
+
+        print(f"Now serving [bright_magenta]{model_name}[/bright_magenta] on [cyan]http://{host}:{port}[/cyan]")
+    if max_batch > 1:
+        print(f"Batching up to {max_batch} inputs, waiting at most {max_wait_ms}ms per batch.")
+    if warmup_spec and pool is not None:
+        print(f"Warming up every model with {len(list(warmup_spec.batches()))} batches when it's loaded.")
+    elif warmup_spec:
+        print(f"Warming up with {len(list(warmup_spec.batches()))} batches, see GET /readyz.")
+    if max_queue:
+        print(f"Queueing at most {max_queue} inputs, more requests are answered 503 (with Retry-After).")
+
+    reloader = None
+    if reload and pool is not None:
+        print("[yellow]--reload only applies to a single model file, not to a directory.[/yellow]")
+    elif reload and isinstance(filename, str):
+        prefork = bool(workers and workers > 1)
+        reloader = ModelReloader(filename, load=(lambda f: load_shared(f)[0]) if prefork else None)
+        if not prefork and hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *_: reloader.request())
+        print("Reloading when the model file changes, on SIGHUP or on POST /admin/reload.")
+
+    options: dict[str, typing.Any] = dict(
+        max_batch=max_batch,
+        max_wait_ms=max_wait_ms,
+        cache=cache,
+        warmup=warmup_spec,
+        pool=pool,
+        reloader=reloader,
+        max_queue=max_queue or None,
+    )
+    if workers and workers > 1:
+        print(f"Using {workers} worker processes.")
+        PreforkServer(host, port, workers, use_async=use_async, **options).serve_forever(model)
+    elif use_async:
+        AsyncModelServer(host, port, **options).run(model)
+    else:
+        MachineLearningModelServer(host, port, **options).serve_forever(model)
 
 
 def upgrade(
-    filename: str, output_file: str = None, compression: ZeroThroughNine | int = DEFAULT_COMPRESSION
+    filename: str,
+    output_file: str = None,
+    compression: CompressionOption | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int | None = None,
+    full: bool = False,
 ) -> None:  # pragma: no cover
     """
     Upgrade the metadata of a model to the latest version.
+
+    By default, only the header is rewritten and the payload is copied as-is.
+    With `full`, the model is loaded and saved again. Only then compression can be a level (0 - 9), a codec name \
+        or both ('zstd:9'). None keeps the current compression.
     """
+    from .core import upgrade_metadata
+
+    output_file = output_file or filename
+    upgrade_metadata(
+        filename, output_file, compression=compression, chunk_size=chunk_size, workers=workers, full=full
+    )
+
+
+def recompress(
+    filename: str,
+    output_file: str = None,
+    compression: CompressionOption | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int | None = None,
+) -> None:
+    """
+    Change the compression of a model, without loading it.
+
+    Compression can be a level (0 - 9), a codec name or both ('zstd:9').
+    """
+    from pathlib import Path
+
+    from .catalog import format_size
+    from .core import recompress as recompress_vst
+
     output_file = output_file or filename
-    upgrade_metadata(filename, output_file, compression=typing.cast(ZeroThroughNine, compression))
+    old_size = Path(filename).stat().st_size
+    metadata = recompress_vst(
+        filename,
+        output_file,
+        compression=DEFAULT_COMPRESSION if compression is None else compression,
+        chunk_size=chunk_size,
+        workers=workers,
+    )
+
+    header = metadata.meta_header
+    print(
+        f"Recompressed {filename} with {getattr(header, 'codec')}:{getattr(header, 'compression_level')}: "
+        f"{format_size(old_size)} -> {format_size(Path(output_file).stat().st_size)}"
+    )
 
 
 def dump(
@@ -136,29 +347,178 @@ def dump(
     """
     Dump the vst model back into the original model files.
     """
+    from .core import dump_to_disk
+
     output_file = output_file or "./outputs"
     dump_to_disk(filename, output_file)
     print(f"Saved {filename} to {output_file}", file=sys.stderr)
 
 
-def show_info(filename: str) -> None:
+def show_info(filename: str, load: bool = False, timings: bool = False) -> None:
     """
     Show metadata info about this model.
+
+    Only the header is read, unless 'load' is passed: then the model is also loaded to check if it works.
+    With 'timings', the time per stage of loading the model is shown as well.
     """
+    from configuraptor.helpers import as_binaryio
+
+    from .core import _from_vst, from_vst_with_metadata
+    from .metadata import print_metadata
+
     error = ""
-    try:
-        model, meta, valid = from_vst_with_metadata(filename)
-    except CorruptedModelException as e:
+    model = None
+    report = TimingReport()
+    if load:
+        try:
+            model, meta, valid = from_vst_with_metadata(filename, timings=report)
+        except CorruptedModelException as e:
+            error = str(e)
+
+    if model is None:
         # just load metadata
-        error = str(e)
         with as_binaryio(filename) as f:
-            model, meta, valid = _from_vst(f, with_metadata=True, with_model=False)
+            model, meta, valid = _from_vst(f, with_metadata=True, with_model=False, with_progress=load)
 
-    print("[yellow]model class[/yellow] =", type(model))
+    if load:
+        print("[yellow]model class[/yellow] =", type(model))
     print_metadata(meta)
-    print("[yellow]model loaded properly:[/yellow]", isinstance(model, SimpleTransformerProtocol))
+    print("[yellow]metadata up-to-date:[/yellow]", valid)
+    if load:
+        print("[yellow]model loaded properly:[/yellow]", isinstance(model, SimpleTransformerProtocol))
     if error:
         print("[red]error:[/red]", error)
+    if load and timings:
+        print_timings(report)
+
+
+def list_catalog(paths: list[str], workers: int | None = None) -> None:
+    """
+    Show a table with the metadata of all .vst files in some directories (or files), without loading any model.
+    """
+    from .catalog import format_catalog, format_size, scan
+
+    entries = scan(paths, workers=workers)
+    # not via rich, which is too slow for big tables:
+    sys.stdout.write(format_catalog(entries) + "\n")
+
+    for entry in entries:
+        if entry.error:
+            print(f"[red]invalid:[/red] {entry.path} ({entry.error})")
+
+    print(f"{len(entries)} files, {format_size(sum(entry.file_size for entry in entries))} in total.")
+
+
+def verify(filenames: list[str], workers: int | None = None) -> None:
+    """
+    Check the integrity of models (or directories with models) without loading them.
+
+    Files are checked concurrently, exits with code 1 if any of them is corrupted.
+    """
+    from .verify import verify_files
+
+    total = failed = 0
+    for path, valid, description in verify_files(filenames, workers=workers):
+        total += 1
+        if valid:
+            print(f"[green]OK[/green]     {path} [dim]({description})[/dim]")
+        else:
+            failed += 1
+            print(f"[red]FAILED[/red] {path}: {description}")
+
+    print(f"{total - failed}/{total} files are valid.")
+    if failed:
+        raise typer.Exit(1)
+
+
+def bench(
+    sizes: str | None = None,
+    payload_formats: str | None = None,
+    compressions: str | None = None,
+    output_file: str | None = None,
+    workers: int | None = None,
+) -> None:  # pragma: no cover
+    """
+    Benchmark saving and loading synthetic models for each payload format and compression.
+
+    Sizes, payload formats and compressions are comma separated lists, compressions can also be 'all' \
+        (every level of every codec). Results are written as CSV to stdout or output_file (JSON for a .json file).
+    """
+    from .bench import DEFAULT_SIZES, all_compressions, run_benchmark, write_csv, write_json
+    from .types import PAYLOAD_FORMATS
+
+    def split(value: str | None) -> list[str]:
+        return [_.strip() for _ in value.split(",") if _.strip()] if value else []
+
+    results = run_benchmark(
+        sizes=split(sizes) or DEFAULT_SIZES,
+        payload_formats=typing.cast(list[PayloadFormat], split(payload_formats)) or PAYLOAD_FORMATS,
+        compressions=all_compressions() if compressions == "all" else split(compressions),
+        workers=workers,
+    )
+
+    if not output_file:
+        return write_csv(results, sys.stdout)
+
+    with open(output_file, "w", newline="") as f:
+        write = write_json if output_file.endswith(".json") else write_csv
+        write(results, f)
+
+    print(f"Wrote benchmark results to {output_file}")
+
+
+def bench_predict(
+    filename: str,
+    batch_sizes: str | None = None,
+    input_lengths: str | None = None,
+    samples_file: str | None = None,
+    iterations: int = 20,
+    warmup: int = 3,
+    output_file: str | None = None,
+) -> None:  # pragma: no cover
+    """
+    Load a model once and benchmark its inference latency and throughput.
+
+    Batch sizes and input lengths (in words) are comma separated lists. Inputs are read from samples_file (one per \
+        line) or generated. Results are shown as a table and written to output_file (JSON or CSV for a .csv file).
+    """
+    from .bench import (
+        DEFAULT_BATCH_SIZES,
+        DEFAULT_INPUT_LENGTHS,
+        format_results,
+        read_samples,
+        write_csv,
+        write_json,
+    )
+    from .bench import bench_predict as run_bench_predict
+
+    def split(value: str | None) -> list[int]:
+        return [int(_) for _ in value.split(",") if _.strip()] if value else []
+
+    model, _ = _simple_load(filename)
+    samples = read_samples(samples_file) if samples_file else None
+
+    results = []
+    for result in run_bench_predict(
+        model,
+        batch_sizes=split(batch_sizes) or DEFAULT_BATCH_SIZES,
+        # samples are used as-is by default:
+        input_lengths=split(input_lengths) or ([0] if samples else DEFAULT_INPUT_LENGTHS),
+        samples=samples,
+        iterations=iterations,
+        warmup=warmup,
+    ):
+        print(f"batch size {result.batch_size}, length {result.input_length}: {result.p50_ms} ms", file=sys.stderr)
+        results.append(result)
+
+    sys.stdout.write(format_results(results) + "\n")
+
+    if output_file:
+        with open(output_file, "w", newline="") as f:
+            write = write_csv if output_file.endswith(".csv") else write_json
+            write(results, f)
+
+        print(f"Wrote benchmark results to {output_file}")
 
 
 def show_help(with_welcome: bool = True) -> None:
@@ -187,10 +547,33 @@ def show_help(with_welcome: bool = True) -> None:
     # Explanation of available <action> options
     print("\nAvailable <action> options:")
     print("- 'run': Run the model interactively by typing prompts.")
-    print("- 'serve': Start a simple HTTP server to serve model outputs.")
+    print("- 'serve': Start a simple HTTP server (HTTP/1.1, concurrent connections) to serve model outputs.")
     print("  Options for 'serve':")
     print("    --port <PORT>, -p <PORT>     Specify the port number (default: 8000)")
     print("    --host <HOST>, -h <HOST>     Specify the host (default: 'localhost')")
+    print("    --max-batch <N>              Predict up to N inputs of concurrent requests at once (default: 1)")
+    print("    --max-wait-ms <MS>           How long a batch may wait to fill up (default: 5)")
+    print("    --max-queue <N>              Answer 503 (with Retry-After) when N inputs are already waiting")
+    print("                                 (requests with an 'X-Deadline-Ms: <MS>' header: 504 after MS)")
+    print("    --async                      Use the asyncio based server (many idle connections, pipelining)")
+    print("    --workers <N>, -w <N>        Serve with N processes that share the model's memory (default: 1)")
+    print("    --cache-size <N>             Cache the predictions of up to N distinct inputs (LRU)")
+    print("    --cache-bytes <SIZE>         Limit the prediction cache to about SIZE (e.g. 100MB)")
+    print("    --cache-ttl <SECONDS>        Expire cached predictions after SECONDS; stats at GET /cache")
+    print("    --warmup-rounds <N>          Predict every warmup batch N times before serving (default: 0 = off)")
+    print("    --warmup-batch-size <N,...>  Warmup batch sizes (default: 1 and --max-batch)")
+    print("    --warmup-length <WORDS,...>  Warmup input lengths in words (default: 16,128)")
+    print("    --warmup-samples <FILE>      Warm up with these inputs (one per line) instead of generated ones")
+    print("                                 (with a directory: every model is warmed up when it's loaded)")
+    print("    --reload                     Swap in new versions of the model file without downtime (when the file")
+    print("                                 changes, on SIGHUP or on POST /admin/reload)")
+    print("  'serve' with a directory serves every <name>.vst in it at /models/<name>/predict, loaded on first use:")
+    print("    --memory-budget <SIZE>       Unload the least recently used models above SIZE (e.g. 4GB)")
+    print("  POST /predict/stream predicts a body line by line and streams the outputs back as NDJSON.")
+    print("  GET /metrics shows request, latency, batch size and memory metrics in the Prometheus format.")
+    print("  GET /healthz answers when the server is up, GET /readyz when the warmup is done (503 until then).")
+    print("  Options for 'run', 'serve' and 'show --load':")
+    print("    --timings                             Show the time, size and throughput of each stage of loading")
     print("- 'upgrade': Upgrade the metadata of a model to the latest version.")
     print("  Options for 'upgrade':")
     print(
@@ -198,16 +581,51 @@ def show_help(with_welcome: bool = True) -> None:
         "(default: overwrite input file)"
     )
     print(
-        f"    --compression <LEVEL>, -c <LEVEL>     Specify the level of compression "
-        f"(default: {DEFAULT_COMPRESSION} or previous value)"
+        "    --full                                Load and save the model again, instead of only rewriting the header"
+    )
+    print(
+        f"    --compression <LEVEL>, -c <LEVEL>     Specify the level (0-9), codec ({', '.join(CODECS)}) "
+        f"or both (e.g. 'zstd:9') of compression, with --full (default: previous value or {DEFAULT_COMPRESSION})"
     )
+    print(
+        "    --chunk-size <BYTES>                  Size of the independently compressed chunks, 0 to disable "
+        f"(default: {DEFAULT_CHUNK_SIZE})"
+    )
+    print("    --workers <N>,         -w <N>         Amount of (de)compression threads (default: one per core)")
+    print("- 'recompress': Change the compression of a model, without loading it.")
+    print("  Options for 'recompress':")
+    print(
+        "    --output <FILE>,       -o <FILE>      Specify which file the recompressed model will be written to "
+        "(default: overwrite input file)"
+    )
+    print(
+        f"    --compression <LEVEL>, -c <LEVEL>     Specify the level (0-9), codec ({', '.join(CODECS)}) "
+        f"or both (e.g. 'zstd:9') of compression (default: {DEFAULT_COMPRESSION})"
+    )
+    print("    --chunk-size <BYTES>, --workers <N>   See 'upgrade'")
     print("- 'dump': Restore the original model files from this vst file.")
     print("  Options for 'dump':")
     print(
         "    --output <FILE>,       -o <FILE>      Specify which directory the files will be written to "
         "(default: 'outputs')"
     )
-    print("- 'show': Show the metadata stored in the model file.")
+    print("- 'show': Show the metadata stored in the model file (only reads the header).")
+    print("  Options for 'show':")
+    print("    --load                                Also load the model to check if it works")
+    print("- 'bench': Benchmark saving and loading synthetic models with each payload format and compression.")
+    print(
+        "  Usage: vst bench [--size 10MB,1GB] [--format dill,tensors,mmap] [-c zlib:1,zstd:3 | all] "
+        "[-o results.csv|results.json]"
+    )
+    print("- 'bench-predict': Benchmark the inference latency (p50/p95/p99) and throughput of a model.")
+    print(
+        "  Usage: vst bench-predict model.vst [--batch-size 1,8,32] [--length 16,128] [--samples inputs.txt] "
+        "[--iterations 20] [--warmup 3] [-o results.json]"
+    )
+    print("- 'ls': Show a table with the metadata of all models in one or more directories (default: current).")
+    print("  Usage: vst ls models/ [--workers <N>]")
+    print("- 'verify': Check the integrity of one or more model files (or directories) without loading them.")
+    print("  Usage: vst verify model.vst other.vst models/ [--workers <N>]")
 
     print("\nExample:")
     print("$ vst serve ./classification.vst")
@@ -240,6 +658,10 @@ def prompt_user(args: list[str]) -> None:  # pragma: no cover
     """
     If a model was passed to the cli without an action, the user gets a dropdown of options.
     """
+    import questionary
+
+    from .core import from_vst_with_metadata
+
     clear()
     model_name = args[0]
     questionary.print(model_name, style="bold italic fg:green")
@@ -283,7 +705,32 @@ def main(
     port: typing.Annotated[int, typer.Option("--port", "-p")] = DEFAULT_PORT,
     host: typing.Annotated[str, typer.Option("--host", "-h")] = DEFAULT_HOST,
     output: typing.Annotated[str, typer.Option("--output", "-o")] = None,
-    compression: typing.Annotated[int, typer.Option("--compression", "-c")] = DEFAULT_COMPRESSION,
+    compression: typing.Annotated[str, typer.Option("--compression", "-c")] = None,
+    chunk_size: typing.Annotated[int, typer.Option("--chunk-size")] = DEFAULT_CHUNK_SIZE,
+    workers: typing.Annotated[int, typer.Option("--workers", "-w")] = None,
+    load: typing.Annotated[bool, typer.Option("--load")] = False,
+    full: typing.Annotated[bool, typer.Option("--full")] = False,
+    timings: typing.Annotated[bool, typer.Option("--timings")] = False,
+    size: typing.Annotated[str, typer.Option("--size")] = None,
+    payload_format: typing.Annotated[str, typer.Option("--format")] = None,
+    batch_size: typing.Annotated[str, typer.Option("--batch-size")] = None,
+    length: typing.Annotated[str, typer.Option("--length")] = None,
+    samples: typing.Annotated[str, typer.Option("--samples")] = None,
+    iterations: typing.Annotated[int, typer.Option("--iterations")] = 20,
+    warmup: typing.Annotated[int, typer.Option("--warmup")] = 3,
+    warmup_rounds: typing.Annotated[int, typer.Option("--warmup-rounds")] = 0,
+    warmup_batch_size: typing.Annotated[str, typer.Option("--warmup-batch-size")] = None,
+    warmup_length: typing.Annotated[str, typer.Option("--warmup-length")] = None,
+    warmup_samples: typing.Annotated[str, typer.Option("--warmup-samples")] = None,
+    max_batch: typing.Annotated[int, typer.Option("--max-batch")] = DEFAULT_MAX_BATCH,
+    max_wait_ms: typing.Annotated[float, typer.Option("--max-wait-ms")] = DEFAULT_MAX_WAIT_MS,
+    use_async: typing.Annotated[bool, typer.Option("--async")] = False,
+    cache_size: typing.Annotated[int, typer.Option("--cache-size")] = None,
+    cache_bytes: typing.Annotated[str, typer.Option("--cache-bytes")] = None,
+    cache_ttl: typing.Annotated[float, typer.Option("--cache-ttl")] = None,
+    memory_budget: typing.Annotated[str, typer.Option("--memory-budget")] = None,
+    reload: typing.Annotated[bool, typer.Option("--reload")] = False,
+    max_queue: typing.Annotated[int, typer.Option("--max-queue")] = None,
 ) -> None:  # pragma: no cover
     """
     Cli entrypoint.
@@ -291,7 +738,39 @@ def main(
     sys.excepthook = custom_excepthook
 
     if has_stdin():
-        return run_stdin(args[0])
+        return run_stdin(args[0], timings=timings)
+
+    serve_options: dict[str, typing.Any] = dict(
+        port=port,
+        host=host,
+        timings=timings,
+        max_batch=max_batch,
+        max_wait_ms=max_wait_ms,
+        use_async=use_async,
+        workers=workers,
+        cache_size=cache_size,
+        cache_bytes=cache_bytes,
+        cache_ttl=cache_ttl,
+        warmup_rounds=warmup_rounds,
+        warmup_batch_sizes=warmup_batch_size,
+        warmup_lengths=warmup_length,
+        warmup_samples=warmup_samples,
+        memory_budget=memory_budget,
+        reload=reload,
+        max_queue=max_queue,
+    )
+
+    match args:
+        case ["serve", directory] | [directory, "serve"] if os.path.isdir(directory):
+            return serve(directory, **serve_options)
+        case ["verify", *filenames] if filenames:
+            return verify(filenames, workers=workers)
+        case ["ls", *paths]:
+            return list_catalog(paths or ["."], workers=workers)
+        case ["bench"]:
+            return bench(size, payload_format, compression, output_file=output, workers=workers)
+        case ["bench-predict", filename] | [filename, "bench-predict"]:
+            return bench_predict(filename, batch_size, length, samples, iterations, warmup, output_file=output)
 
     file = ".".join(args or ())
 
@@ -305,22 +784,32 @@ def main(
             prompt_user(args)
 
         case ["run", _, "vst"]:
-            run_interactive(args[1])
+            run_interactive(args[1], timings=timings)
 
         case [_, "vst", "run"]:
-            run_interactive(args[0])
+            run_interactive(args[0], timings=timings)
 
         case ["serve", _, "vst"]:
-            serve(args[1], port=port, host=host)
+            serve(args[1], **serve_options)
 
         case [_, "vst", "serve"]:
-            serve(args[0], port=port, host=host)
+            serve(args[0], **serve_options)
 
         case ["upgrade", _, "vst"]:
-            upgrade(args[1], output_file=output, compression=compression)
+            upgrade(
+                args[1], output_file=output, compression=compression, chunk_size=chunk_size, workers=workers, full=full
+            )
 
         case [_, "vst", "upgrade"]:
-            upgrade(args[0], output_file=output, compression=compression)
+            upgrade(
+                args[0], output_file=output, compression=compression, chunk_size=chunk_size, workers=workers, full=full
+            )
+
+        case ["recompress", _, "vst"]:
+            recompress(args[1], output_file=output, compression=compression, chunk_size=chunk_size, workers=workers)
+
+        case [_, "vst", "recompress"]:
+            recompress(args[0], output_file=output, compression=compression, chunk_size=chunk_size, workers=workers)
 
         case ["dump", _, "vst"]:
             dump(args[1], output_file=output)
@@ -329,10 +818,13 @@ def main(
             dump(args[0], output_file=output)
 
         case ["show", _, "vst"]:
-            show_info(args[1])
+            show_info(args[1], load=load, timings=timings)
 
         case [_, "vst", "show"]:
-            show_info(args[0])
+            show_info(args[0], load=load, timings=timings)
+
+        case [_, "vst", "verify"]:
+            verify([args[0]], workers=workers)
 
         case _:
             default(args)
@@ -0,0 +1,347 @@
+"""
+Registry of compression codecs for the payload of a `.vst` file.
+
+The codec name is stored in the metadata (since MetaHeader version 3), so `_from_vst` can pick the right decoder.
+Payloads with an older header are always zlib compressed (except for the uncompressed 'mmap' payload format).
+
+zstd and lz4 are much faster than zlib, but require an extra: `pip install verysimpletransformers[zstd]`.
+Their libraries are only imported when they are actually used, so importing this module (e.g. for `vst --help`) stays
+cheap.
+"""
+from __future__ import annotations
+
+import functools
+import importlib.util
+import typing
+import zlib
+
+from .exceptions import CodecError, ExtraNotInstalledError
+
+
+@functools.cache
+def is_installed(module: str) -> bool:
+    """
+    Whether a (top-level) module can be imported, without importing it.
+    """
+    return importlib.util.find_spec(module) is not None
+
+
+def _zstandard() -> typing.Any:
+    import zstandard
+
+    return zstandard
+
+
+def _lz4_frame() -> typing.Any:
+    import lz4.frame
+
+    return lz4.frame
+
+
+DEFAULT_CODEC = "zlib"
+
+ZeroThroughNine = typing.Literal[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+DEFAULT_COMPRESSION: ZeroThroughNine = 1
+
+
+class Compressor(typing.Protocol):
+    """
+    Incremental compressor, like the result of zlib.compressobj().
+    """
+
+    def compress(self, data: bytes | memoryview) -> bytes | memoryview:
+        """
+        Compress a piece of data, returns (possibly empty) compressed output.
+        """
+
+    def flush(self) -> bytes:
+        """
+        Return the remaining compressed output, after which the stream is complete.
+        """
+
+
+class Decompressor(typing.Protocol):
+    """
+    Incremental decompressor, like the result of zlib.decompressobj().
+    """
+
+    @property
+    def eof(self) -> bool:
+        """
+        Whether the end of the compressed stream was reached.
+        """
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Decompress a piece of data, returns (possibly empty) decompressed output.
+        """
+
+
+class Codec:
+    """
+    Stores data as-is. Subclasses define actual compression.
+
+    'levels' is the range of valid compression levels, out of range levels are clamped.
+    """
+
+    name = "none"
+    extra: typing.Optional[typing.Literal["zstd", "lz4"]] = None
+    module: str | None = None  # library that is required for this codec
+    levels = range(0, 1)
+    default_level = 0
+    # exceptions raised by the library on invalid data:
+    errors: tuple[typing.Type[Exception], ...] = ()
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether the library for this codec is installed.
+        """
+        return self.module is None or is_installed(self.module)
+
+    def clamp(self, level: int) -> int:
+        """
+        Make sure the level is within the range of this codec.
+        """
+        return max(min(level, self.levels[-1]), self.levels[0])
+
+    def compressor(self, level: int) -> Compressor:  # noqa: ARG002
+        """
+        Get a new incremental compressor.
+        """
+        return _Passthrough()
+
+    def decompressor(self) -> Decompressor:
+        """
+        Get a new incremental decompressor.
+        """
+        return _Passthrough()
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        """
+        Compress a complete piece of data at once (used for independent chunks).
+        """
+        compressor = self.compressor(level)
+        return bytes(compressor.compress(data)) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Decompress a complete piece of compressed data at once.
+
+        Raises a CodecError if the data is invalid or truncated.
+        """
+        decompressor = self.decompressor()
+        try:
+            result = decompressor.decompress(data)
+        except self.errors as e:
+            raise CodecError(f"Could not decompress {self.name} data: {e}") from e
+
+        if not decompressor.eof:
+            raise CodecError(f"Compressed {self.name} data is truncated.")
+
+        return result
+
+    def __repr__(self) -> str:
+        """
+        Show the codec name.
+        """
+        return f"Codec<{self.name}>"
+
+
+class _Passthrough:
+    """
+    (De)compressor for the 'none' codec.
+
+    It can not detect the end of a stream, so 'eof' is always True: any amount of data is valid.
+    """
+
+    eof = True
+
+    def compress(self, data: bytes | memoryview) -> bytes | memoryview:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class ZlibCodec(Codec):
+    """
+    The default (and before MetaHeader v3, only) codec.
+    """
+
+    name = "zlib"
+    levels = range(0, 10)
+    default_level = 1
+    errors = (zlib.error,)
+
+    def compressor(self, level: int) -> Compressor:
+        """
+        Get a zlib compressobj. Level 0 still adds zlib headers!
+        """
+        return zlib.compressobj(self.clamp(level))
+
+    def decompressor(self) -> Decompressor:
+        """
+        Get a zlib decompressobj.
+        """
+        return zlib.decompressobj()
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard: much faster than zlib and with a better ratio. Compression uses all cores.
+    """
+
+    name = "zstd"
+    extra = "zstd"
+    module = "zstandard"
+    levels = range(1, 23)
+    default_level = 3
+
+    @property
+    def errors(self) -> tuple[typing.Type[Exception], ...]:  # type: ignore
+        """
+        Only available when zstandard is installed.
+        """
+        return (_zstandard().ZstdError,) if self.available else ()
+
+    def compressor(self, level: int) -> Compressor:
+        """
+        Get a (multithreaded) zstandard compressobj.
+        """
+        compressor = _zstandard().ZstdCompressor(level=self.clamp(level), threads=-1)
+        return typing.cast(Compressor, compressor.compressobj())
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        """
+        Single-threaded, since chunks are already compressed in parallel.
+        """
+        return typing.cast(bytes, _zstandard().ZstdCompressor(level=self.clamp(level)).compress(data))
+
+    def decompressor(self) -> Decompressor:
+        """
+        Get a zstandard decompressobj.
+        """
+        return typing.cast(Decompressor, _zstandard().ZstdDecompressor().decompressobj())
+
+
+class _Lz4Compressor:
+    """
+    Gives the LZ4 frame compressor the same interface as zlib's compressobj.
+    """
+
+    def __init__(self, level: int) -> None:
+        self._compressor = _lz4_frame().LZ4FrameCompressor(compression_level=level)
+        self._header: bytes | None = self._compressor.begin()
+
+    def compress(self, data: bytes | memoryview) -> bytes:
+        header, self._header = self._header or b"", None
+        return header + typing.cast(bytes, self._compressor.compress(data))
+
+    def flush(self) -> bytes:
+        header, self._header = self._header or b"", None
+        return header + typing.cast(bytes, self._compressor.flush())
+
+
+class Lz4Codec(Codec):
+    """
+    LZ4: the fastest codec, with a lower compression ratio.
+    """
+
+    name = "lz4"
+    extra = "lz4"
+    module = "lz4"
+    levels = range(0, 17)
+    default_level = 0
+    errors = (RuntimeError,)
+
+    def compressor(self, level: int) -> Compressor:
+        """
+        Get an LZ4 frame compressor.
+        """
+        return _Lz4Compressor(self.clamp(level))
+
+    def decompressor(self) -> Decompressor:
+        """
+        Get an LZ4 frame decompressor.
+        """
+        return typing.cast(Decompressor, _lz4_frame().LZ4FrameDecompressor())
+
+
+CODECS: dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec) -> Codec:
+    """
+    Add a codec to the registry, so it can be used by name in `to_vst` and is recognized in metadata.
+    """
+    CODECS[codec.name] = codec
+    return codec
+
+
+for _codec in (Codec(), ZlibCodec(), ZstdCodec(), Lz4Codec()):
+    register_codec(_codec)
+
+
+def available_codecs() -> list[str]:
+    """
+    Names of the codecs that can be used on this system.
+    """
+    return [name for name, codec in CODECS.items() if codec.available]
+
+
+def get_codec(codec: str | Codec) -> Codec:
+    """
+    Find a codec by name.
+
+    Raises a CodecError for unknown codecs and ExtraNotInstalledError if the required library is missing.
+    """
+    if isinstance(codec, Codec):
+        return codec
+
+    if codec not in CODECS:
+        raise CodecError(f"Unknown compression codec '{codec}'. Choose from {list(CODECS)}.")
+
+    found = CODECS[codec]
+    if not found.available:  # pragma: no cover
+        raise ExtraNotInstalledError(typing.cast(typing.Literal["zstd", "lz4"], found.extra))
+
+    return found
+
+
+CompressionOption = bool | int | str
+
+
+def parse_compression(compression: CompressionOption) -> tuple[Codec, int]:
+    """
+    Convert a compression option into a codec and level.
+
+    Options:
+        - a zlib level: 0 - 9 (int or str)
+        - a codec name, with its default level: 'none', 'zlib', 'zstd', 'lz4'
+        - a codec name and level: 'zstd:9'
+
+    Raises a CodecError for unknown codecs or invalid levels, so nothing is written with another compression than \
+        the one that was asked for.
+    """
+    if isinstance(compression, bool | int):
+        codec = CODECS[DEFAULT_CODEC]
+        return codec, codec.clamp(int(compression))
+
+    name, _, level = compression.strip().lower().partition(":")
+    if name.isdigit():
+        name, level = DEFAULT_CODEC, name
+
+    codec = get_codec(name)
+
+    if not level:
+        return codec, codec.default_level
+
+    if not level.isdigit():
+        raise CodecError(f"Invalid compression level '{level}' in '{compression}', expected a number.")
+
+    return codec, codec.clamp(int(level))
@@ -1,42 +1,65 @@
 """
 Core functionality of this library.
+
+Heavy dependencies (torch, dill, tqdm) are only imported when a model is actually saved or loaded,
+so reading metadata (e.g. `vst show`) stays fast.
 """
 from __future__ import annotations
 
+import contextlib
+import io
+import os
+import shutil
 import struct
 import sys
+import tempfile
 import typing
 import warnings
-import zlib
 from pathlib import Path
 from pickle import UnpicklingError  # nosec
 
-import dill  # nosec
-import torch
 from configuraptor import asbytes
 from configuraptor.helpers import as_binaryio
-from tqdm import tqdm
 
-from .exceptions import BaseVSTException, CorruptedModelException
+from .compression import (  # noqa: F401 (ZeroThroughNine: backwards compatible import location)
+    DEFAULT_CODEC,
+    DEFAULT_COMPRESSION,
+    Codec,
+    CompressionOption,
+    ZeroThroughNine,
+    get_codec,
+    parse_compression,
+)
+from .exceptions import BaseVSTException, CodecError, CorruptedModelException
 from .metadata import (
     as_version,
     compare_versions,
     get_metadata,
     get_simpletransformers_version,
+    get_torch_version,
     get_transformers_version,
     get_verysimpletransformers_version,
 )
 from .metadata_schema import Metadata, MetaHeader
+from .streams import (
+    CHUNK_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    ChunkedWriter,
+    CompressedWriter,
+    PayloadWriter,
+    copy_stream,
+    open_payload,
+)
 from .support import (
-    CudaUnpickler,
     DummyTqdm,
     RedirectStdStreams,
     TqdmProgress,
     devnull,
     dummy_tqdm,
-    write_bundle,
+    write_bundle,  # noqa: F401 (backwards compatible import location)
 )
-from .types import SimpleTransformerProtocol
+from .timings import TimedReader, TimedWriter, TimingReport
+from .types import DEFAULT_PAYLOAD_FORMAT, UNCOMPRESSED_PAYLOAD_FORMATS, PayloadFormat, SimpleTransformerProtocol
 from .versioning import get_version
 
 if typing.TYPE_CHECKING:  # pragma: no cover
@@ -47,47 +70,195 @@ if typing.TYPE_CHECKING:  # pragma: no cover
 else:
     SimpleTransformer = typing.Union[SimpleTransformerProtocol, "AllSimpletransformersModels"]
 
-ZeroThroughNine = typing.Literal[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+HASHBANG = b"#!/usr/bin/env verysimpletransformers\n"
+
+
+def _stream_payload(
+    output_file: typing.BinaryIO,
+    model: SimpleTransformer,
+    compression: int,
+    payload_format: PayloadFormat,
+    position: int,
+    codec: Codec,
+    chunk_size: int = 0,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
+    progress: TqdmProgress = dummy_tqdm,
+) -> PayloadWriter:
+    """
+    Pickle the model straight into a compressor that writes to output_file.
+
+    Position is where the payload starts in the output file.
+    With a chunk_size, the payload is compressed in independent chunks on `workers` threads.
+    The pickle, compress and write stages are measured in `timings`, progress is updated per byte written.
+    Returns the finished writer, which knows the amount of (compressed) bytes and chunks and their checksum.
+    """
+    from .payload import dump_payload
+
+    timings = timings or TimingReport()
+    target = typing.cast(typing.BinaryIO, TimedWriter(output_file, timings, "write", progress))
+    writer = _payload_writer(target, compression, codec, chunk_size, workers)
+
+    with timings.stage("pickle") as stage:
+        compressing = typing.cast(typing.BinaryIO, TimedWriter(writer, timings, "compress"))
+        dump_payload(model, compressing, payload_format, position, timings)
+        stage.bytes += writer.bytes_in
+
+    with timings.stage("compress"):
+        writer.finish()
 
-DEFAULT_COMPRESSION: ZeroThroughNine = 1
+    return writer
+
+
+def _payload_writer(
+    output_file: typing.BinaryIO, compression: int, codec: Codec, chunk_size: int, workers: int | None
+) -> PayloadWriter:
+    """
+    Compress in independent chunks of chunk_size bytes on `workers` threads, or as a single stream if chunk_size=0.
+    """
+    if chunk_size:
+        return ChunkedWriter(output_file, compression, codec, chunk_size=chunk_size, workers=workers)
+
+    return CompressedWriter(output_file, level=compression, codec=codec)
+
+
+def _update_metadata(metadata: Metadata, writer: PayloadWriter) -> None:
+    """
+    Store the properties of the written payload in the metadata.
+    """
+    metadata.content_length = writer.bytes_out
+    metadata.meta_header.chunk_count = writer.chunk_count
+    metadata.meta_header.checksum = writer.checksum
+
+
+def _is_seekable(file: typing.BinaryIO) -> bool:
+    try:
+        return bool(file.seekable())
+    except (AttributeError, ValueError):  # pragma: no cover
+        return False
+
+
+def write_vst(
+    output_file: typing.BinaryIO,
+    model: SimpleTransformer,
+    compression: int,
+    payload_format: PayloadFormat = DEFAULT_PAYLOAD_FORMAT,
+    codec: str | Codec = DEFAULT_CODEC,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
+    progress: TqdmProgress = dummy_tqdm,
+) -> None:
+    """
+    Write hashbang, metadata and the compressed model to an (open) output file.
+
+    Compression is the level for the codec (see `compression.py`).
+    The payload is split into chunks of chunk_size bytes, which are compressed in parallel by `workers` threads \
+        (default: one per core). chunk_size=0 writes a single compressed stream instead.
+
+    The model is never fully pickled or compressed in memory: the metadata is written with a placeholder \
+        content length first, which is patched in after the payload has been streamed to the file.
+    If the output file can not seek (e.g. a pipe), the payload is spooled to a temporary file on disk instead.
+    The time and bytes per stage (pickle, compress, write) are added to `timings`, if passed.
+    """
+    if chunk_size < 0:
+        raise ValueError(f"Chunk size can not be negative, got {chunk_size}.")
+
+    if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS:
+        codec, chunk_size = "none", 0
+
+    codec = get_codec(codec)
+    compression = codec.clamp(compression)
+
+    metadata = get_metadata(
+        0,
+        compression_level=compression,
+        device=str(model.device),
+        payload_format=payload_format,
+        codec=codec.name,
+        chunk_size=chunk_size,
+    )
+
+    timings = timings or TimingReport()
+
+    if not _is_seekable(output_file):  # pragma: no cover
+        with tempfile.TemporaryFile() as spool:
+            position = len(HASHBANG) + len(asbytes(metadata))
+            writer = _stream_payload(
+                spool, model, compression, payload_format, position, codec, chunk_size, workers, timings, progress
+            )
+            _update_metadata(metadata, writer)
+            spool.seek(0)
+            with timings.stage("write"):
+                output_file.write(HASHBANG)
+                output_file.write(asbytes(metadata))
+                shutil.copyfileobj(spool, output_file, CHUNK_SIZE)
+        return
+
+    output_file.write(HASHBANG)
+    metadata_position = output_file.tell()
+    output_file.write(asbytes(metadata))
+
+    position = output_file.tell()
+    writer = _stream_payload(
+        output_file, model, compression, payload_format, position, codec, chunk_size, workers, timings, progress
+    )
+    _update_metadata(metadata, writer)
+
+    # content length has a fixed size, so the metadata can be overwritten in place:
+    end_position = output_file.tell()
+    output_file.seek(metadata_position)
+    output_file.write(asbytes(metadata))
+    output_file.seek(end_position)
 
 
 def to_vst(
     model: SimpleTransformer,
     output_file: str | Path | typing.BinaryIO | None,
-    compression: bool | ZeroThroughNine = DEFAULT_COMPRESSION,
+    compression: CompressionOption = DEFAULT_COMPRESSION,
+    payload_format: PayloadFormat = DEFAULT_PAYLOAD_FORMAT,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
 ) -> typing.BinaryIO:
     """
     Convert a trained Simple Transformers model into a .vst file.
 
     If output_file is None, it is returned as a BytesIO instead.
+    Compression is a zlib level (0 - 9), a codec name ('none', 'zlib', 'zstd', 'lz4') or both ('zstd:9').
+    With payload_format='tensors', the raw tensor data is stored next to the pickle instead of inside of it, \
+        which is faster to save and load for models with many parameters (see `payload.py`).
+    payload_format='mmap' does the same, but uncompressed and page-aligned so it can be loaded with mmap=True.
+    The payload is compressed in independent chunks of chunk_size bytes on `workers` threads (default: one per core).
+    Pass a TimingReport as `timings` to measure the time and bytes per stage (see `timings.py`).
 
     Also known as 'bundle'
     """
     if not model:
         raise ValueError("No model provided!")
 
-    print("Starting dump...", file=sys.stderr)
+    from tqdm import tqdm
 
-    with tqdm(total=100) as progress:
-        progress.update(10)
-        pickled = dill.dumps(model)
-        progress.update(40)
-        if not isinstance(compression, int):
-            # weird, but just set to disable.
-            compression = 0
+    print("Starting dump...", file=sys.stderr)
 
-        pickled = zlib.compress(pickled, level=int(compression))  # compression of 0 still slightly changes the bytes!
-        progress.update(30)
+    codec, level = parse_compression(compression)
 
+    # the final size is unknown up front, so the progress bar counts the bytes written:
+    with tqdm(unit="B", unit_scale=True, unit_divisor=1024) as progress:
         output_file = as_binaryio(output_file, "wb")
-
-        hashbang = b"#!/usr/bin/env verysimpletransformers\n"
-        metadata = asbytes(get_metadata(len(pickled), compression_level=compression, device=str(model.device)))
-        progress.update(10)
-
-        write_bundle(output_file, hashbang, metadata, pickled)
-        progress.update(10)
+        with output_file as f_out:
+            # compression of 0 still slightly changes the bytes (unless the codec is 'none')!
+            write_vst(
+                f_out,
+                model,
+                compression=level,
+                payload_format=payload_format,
+                codec=codec,
+                chunk_size=chunk_size,
+                workers=workers,
+                timings=timings,
+                progress=progress,
+            )
 
     print("Finished dump, wrote file!", file=sys.stderr)
     return output_file
@@ -96,30 +267,78 @@ def to_vst(
 bundle_model = to_vst
 
 
-def load_compressed_model(compressed: bytes, device: str, progress: TqdmProgress = dummy_tqdm) -> SimpleTransformer:
+def load_compressed_stream(
+    open_file: typing.BinaryIO,
+    content_length: int,
+    device: str,
+    progress: TqdmProgress = dummy_tqdm,
+    payload_format: str = DEFAULT_PAYLOAD_FORMAT,
+    mmap: bool = False,
+    codec: str = DEFAULT_CODEC,
+    chunked: bool = False,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
+) -> SimpleTransformer:
     """
-    Load compressed bytes into an actual simple transformers model, move cuda settings around.
+    Load the next content_length compressed bytes of an open file into an actual simple transformers model.
+
+    The payload is decompressed while it is being unpickled, so no full-size copy of it is ever kept in memory.
+    Chunked payloads are decompressed ahead by `workers` threads.
+    With mmap and the 'mmap' payload format, the tensor data is not read at all but memory mapped.
+    The read, decompress, unpickle and device move stages are measured in `timings`.
+    Progress is updated for every (compressed) byte that is read, up to content_length.
     """
-    try:
-        compressed = zlib.decompress(compressed)
-    except zlib.error as e:
-        raise CorruptedModelException("compression", e) from e
+    from .payload import get_unpickler, load_mmap_payload
 
-    progress.update(30)
+    timings = timings or TimingReport()
+    reader = TimedReader(open_file, timings, "read", progress)
+    source = typing.cast(typing.BinaryIO, reader)
 
     # load + fix cuda (pt1):
     try:
-        result: SimpleTransformer = CudaUnpickler.loads(compressed, device=device)
+        result: SimpleTransformer
+        with timings.stage("unpickle") as stage:
+            if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS:
+                # memory mapping needs the actual file:
+                result = load_mmap_payload(open_file if mmap else source, device, use_mmap=mmap, timings=timings)
+            else:
+                with open_payload(source, content_length, codec, chunked=chunked, workers=workers) as payload:
+                    decompressed = TimedReader(payload, timings, "decompress")
+                    unpickler = get_unpickler(payload_format)(
+                        typing.cast(typing.BinaryIO, decompressed), device=device, timings=timings
+                    )
+                    result = unpickler.load()
+                    stage.bytes += decompressed.bytes_read
+
+            stage.bytes += content_length if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS else 0
+    except CodecError as e:
+        raise CorruptedModelException("compression", e) from e
     except UnpicklingError as e:
         raise CorruptedModelException("pickling", e) from e
 
     # fix cuda (pt2):
     result.device = device
 
-    progress.update(20)
+    # memory mapped data is not read:
+    progress.update(max(content_length - reader.bytes_read, 0))
     return result
 
 
+def load_compressed_model(
+    compressed: bytes,
+    device: str,
+    progress: TqdmProgress = dummy_tqdm,
+    payload_format: str = DEFAULT_PAYLOAD_FORMAT,
+    codec: str = DEFAULT_CODEC,
+) -> SimpleTransformer:
+    """
+    Load compressed bytes into an actual simple transformers model, move cuda settings around.
+    """
+    return load_compressed_stream(
+        io.BytesIO(compressed), len(compressed), device, progress, payload_format, codec=codec
+    )
+
+
 def _run_metadata_checks(data: bytes, cls: typing.Type[MetaHeader]) -> tuple[bool, MetaHeader]:
     metadata: MetaHeader = cls.load(data)
     # metadata is versioned, so properties can change. Use 'getattr' to prevent issues!
@@ -142,11 +361,31 @@ def _run_metadata_checks(data: bytes, cls: typing.Type[MetaHeader]) -> tuple[boo
     }
 
     if torch_version := getattr(metadata, "torch_version", None):
-        results.add(compare_versions("torch", as_version(torch_version), as_version(torch.__version__)))
+        results.add(compare_versions("torch", as_version(torch_version), get_torch_version()))
 
     return all(results), metadata
 
 
+def read_metadata(open_file: typing.BinaryIO) -> Metadata:
+    """
+    Read only the metadata of an open .vst file, without running any checks on it.
+
+    Afterwards, the file is positioned at the start of the payload.
+    If the MetaHeader version is unknown (e.g. from a newer version of this library), the header is left empty.
+    """
+    next(open_file)  # skip first line (hashbang)
+    version, meta_length, content_length = struct.unpack("H H Q", open_file.read(16))
+    header_bytes = open_file.read(meta_length)
+
+    metadata = Metadata()
+    metadata.meta_version = version
+    metadata.meta_length = meta_length
+    metadata.content_length = content_length
+    cls = get_version(MetaHeader, version)
+    metadata.meta_header = cls.load(header_bytes) if cls else MetaHeader()
+    return metadata
+
+
 def run_metadata_checks(
     open_file: typing.BinaryIO, meta_length: int, version: int | typing.Literal["latest"] = "latest"
 ) -> tuple[bool, MetaHeader | None]:
@@ -196,6 +435,9 @@ if typing.TYPE_CHECKING:  # pragma: no cover
         with_model: typing.Literal[True] = True,
         with_progress: bool = True,
         device: str = "auto",
+        mmap: bool = False,
+        workers: int | None = None,
+        timings: TimingReport | None = None,
     ) -> tuple[SimpleTransformer, Metadata, bool]:
         ...
 
@@ -206,6 +448,9 @@ if typing.TYPE_CHECKING:  # pragma: no cover
         with_model: typing.Literal[True] = True,
         with_progress: bool = True,
         device: str = "auto",
+        mmap: bool = False,
+        workers: int | None = None,
+        timings: TimingReport | None = None,
     ) -> tuple[SimpleTransformer, None, bool]:
         ...
 
@@ -216,6 +461,9 @@ if typing.TYPE_CHECKING:  # pragma: no cover
         with_model: typing.Literal[False] = False,
         with_progress: bool = True,
         device: str = "auto",
+        mmap: bool = False,
+        workers: int | None = None,
+        timings: TimingReport | None = None,
     ) -> tuple[None, Metadata, bool]:
         ...
 
@@ -226,6 +474,9 @@ if typing.TYPE_CHECKING:  # pragma: no cover
         with_model: typing.Literal[False] = False,
         with_progress: bool = True,
         device: str = "auto",
+        mmap: bool = False,
+        workers: int | None = None,
+        timings: TimingReport | None = None,
     ) -> tuple[None, None, bool]:
         ...
 
@@ -236,6 +487,9 @@ def _from_vst(
     with_model: bool = True,
     with_progress: bool = True,
     device: str = "auto",
+    mmap: bool = False,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
 ) -> tuple[typing.Optional[SimpleTransformer], typing.Optional[Metadata], bool]:
     """
     Load the model from a (possibly compressed) dill.
@@ -244,34 +498,64 @@ def _from_vst(
     with_model can be set to False with with_metadata=True to only return the metadata.
 
     Device (cpu, cuda) will be chosen based on availability if device is set to 'auto'.
+    mmap=True backs the model parameters with a memory map of the file (only for the 'mmap' payload format).
+    Chunked payloads are decompressed by `workers` threads (default: one per core).
+    Pass a TimingReport as `timings` to measure the time and bytes per stage (see `timings.py`).
 
-    By default, a progress bar will be shown. Use with_progress = False to disable this.
+    By default, a progress bar (of the bytes read) will be shown. Use with_progress = False to disable this.
     """
-    _progress = tqdm(total=100) if with_progress else DummyTqdm()
+    timings = timings or TimingReport()
 
     try:
-        with _progress as progress:
-            progress.update(10)
+        with timings.stage("read") as stage:
             next(open_file)  # skip first line (hashbang)
 
             # extract lengths before actually loading meta header object,
             # because its variable!
             version, meta_length, content_length = struct.unpack("H H Q", open_file.read(16))
+            stage.bytes += len(HASHBANG) + 16 + meta_length
 
             meta_check_passed, meta_header = run_metadata_checks(open_file, meta_length, version)
 
-            if device == "auto":
-                device = "cuda" if torch.cuda.is_available() else "cpu"
+        if with_progress and with_model:
+            from tqdm import tqdm
 
-            progress.update(20)
+            _progress = tqdm(total=content_length, unit="B", unit_scale=True, unit_divisor=1024)
+        else:
+            _progress = DummyTqdm()
 
+        with _progress as progress:
             if with_model:
-                pickled = open_file.read(content_length)
-                progress.update(20)
-                model = load_compressed_model(pickled, device, progress)
+                if device == "auto":
+                    import torch
+
+                    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+                payload_format = getattr(meta_header, "payload_format", DEFAULT_PAYLOAD_FORMAT)
+                if mmap and payload_format not in UNCOMPRESSED_PAYLOAD_FORMATS:
+                    warnings.warn(
+                        f"mmap=True requires a model saved with payload_format='mmap', not '{payload_format}'. "
+                        "Loading normally."
+                    )
+
+                # headers before version 3 have no codec, these were always compressed with zlib:
+                codec = getattr(meta_header, "codec", None) or DEFAULT_CODEC
+                # headers before version 4 are never chunked:
+                chunked = bool(getattr(meta_header, "chunk_size", 0))
+                model = load_compressed_stream(
+                    open_file,
+                    content_length,
+                    device,
+                    progress,
+                    payload_format,
+                    mmap,
+                    codec=codec,
+                    chunked=chunked,
+                    workers=workers,
+                    timings=timings,
+                )
             else:
                 model = None
-                progress.update(70)  # 20 from pickling + 50 from `load_compressed_model`
 
         if with_metadata:
             metadata = Metadata()
@@ -301,14 +585,25 @@ def _from_vst(
         raise CorruptedModelException("unknown", e) from e
 
 
-def from_vst(input_file: str | Path | typing.BinaryIO, device: str = "auto") -> SimpleTransformer:
+def from_vst(
+    input_file: str | Path | typing.BinaryIO,
+    device: str = "auto",
+    mmap: bool = False,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
+) -> SimpleTransformer:
     """
     Given a file path-like object, load the Simple Transformers model back into memory.
+
+    For models saved with payload_format='mmap', mmap=True loads (nearly) instantly: the parameters are backed by \
+        a memory map of the file, so they are only paged in when used and shared between processes.
+    Workers is the amount of threads used for decompression (default: one per core).
+    Pass a TimingReport as `timings` to measure the time and bytes per stage (see `timings.py`).
     """
     print("Starting load", file=sys.stderr)
 
     with as_binaryio(input_file) as f:
-        result, _, _ = _from_vst(f, device=device)
+        result, _, _ = _from_vst(f, device=device, mmap=mmap, workers=workers, timings=timings)
 
     print("Finished load!", file=sys.stderr)
     return result
@@ -325,7 +620,11 @@ def dump_to_disk(model: SimpleTransformer | str | Path | typing.BinaryIO, output
 
 
 def from_vst_with_metadata(
-    input_file: str | Path | typing.BinaryIO, device: str = "auto"
+    input_file: str | Path | typing.BinaryIO,
+    device: str = "auto",
+    mmap: bool = False,
+    workers: int | None = None,
+    timings: TimingReport | None = None,
 ) -> tuple[SimpleTransformer, Metadata, bool]:
     """
     Given a file path-like object, load the Simple Transformers model back into memory.
@@ -335,24 +634,121 @@ def from_vst_with_metadata(
     print("Starting load", file=sys.stderr)
 
     with as_binaryio(input_file) as f:
-        result = _from_vst(f, device=device, with_metadata=True)
+        result = _from_vst(f, device=device, with_metadata=True, mmap=mmap, workers=workers, timings=timings)
 
     print("Finished load!", file=sys.stderr)
     return result
 
 
+@contextlib.contextmanager
+def _replace_when_done(
+    output_file: str | Path | typing.BinaryIO, mode_from: str | Path | typing.BinaryIO
+) -> typing.Generator[typing.BinaryIO, None, None]:
+    """
+    Write to a temporary file next to output_file, which only replaces output_file when writing succeeded.
+
+    This way a file can be upgraded in place, without reading from the file that is being written.
+    The permissions (e.g. the executable bit) of `mode_from` are kept. Binary IO is written to directly.
+    """
+    if not isinstance(output_file, str | Path):
+        with as_binaryio(output_file, "wb") as f_out:
+            yield f_out
+        return
+
+    output_path = Path(output_file)
+    temp_path = output_path.with_name(f".{output_path.name}.tmp")
+    try:
+        with temp_path.open("wb") as f_out:
+            yield f_out
+
+        if isinstance(mode_from, str | Path):
+            shutil.copymode(mode_from, temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _upgraded_metadata(old: Metadata) -> Metadata:
+    """
+    Build the latest version of the metadata, based on the properties of the payload stored in the old metadata.
+    """
+    header = old.meta_header
+    payload_format = getattr(header, "payload_format", None) or DEFAULT_PAYLOAD_FORMAT
+    # headers before version 3 have no codec, these were always compressed with zlib (except 'mmap'):
+    default_codec = "none" if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS else DEFAULT_CODEC
+
+    metadata = get_metadata(
+        old.content_length,
+        compression_level=getattr(header, "compression_level", DEFAULT_COMPRESSION),
+        device=getattr(header, "device", None) or "cpu",
+        payload_format=typing.cast(PayloadFormat, payload_format),
+        codec=getattr(header, "codec", None) or default_codec,
+        chunk_size=getattr(header, "chunk_size", 0),
+    )
+    metadata.meta_header.chunk_count = getattr(header, "chunk_count", 0)
+    return metadata
+
+
+def _write_upgraded(input_file: typing.BinaryIO, output_file: typing.BinaryIO, old: Metadata) -> None:
+    """
+    Write the latest metadata to output_file and stream-copy the (compressed) payload that follows the old metadata.
+
+    'mmap' payloads are re-aligned for their new position, other payloads are copied byte for byte.
+    """
+    metadata = _upgraded_metadata(old)
+    payload_format = getattr(metadata.meta_header, "payload_format", DEFAULT_PAYLOAD_FORMAT)
+
+    output_file.write(HASHBANG)
+    metadata_position = output_file.tell()
+    output_file.write(asbytes(metadata))
+
+    # the 'none' codec is only used to count the bytes and calculate the checksum:
+    writer = CompressedWriter(output_file, level=0, codec="none")
+    try:
+        if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS:
+            from .payload import copy_mmap_payload
+
+            copy_mmap_payload(input_file, writer, old.content_length, output_file.tell())
+        else:
+            copy_stream(input_file, writer, old.content_length)
+    except (EOFError, UnpicklingError) as e:
+        raise CorruptedModelException("unknown", e) from e
+
+    writer.finish()
+
+    old_checksum = getattr(old.meta_header, "checksum", None)
+    if payload_format not in UNCOMPRESSED_PAYLOAD_FORMATS and old_checksum not in (None, writer.checksum):
+        raise CorruptedModelException("unknown", ValueError("Checksum of the payload does not match."))
+
+    metadata.content_length = writer.bytes_out
+    metadata.meta_header.checksum = writer.checksum
+
+    end_position = output_file.tell()
+    output_file.seek(metadata_position)
+    output_file.write(asbytes(metadata))
+    output_file.seek(end_position)
+
+
 def upgrade_metadata(
     input_file: str | Path | typing.BinaryIO,
     output_file: str | Path | typing.BinaryIO,
-    compression: ZeroThroughNine | None = DEFAULT_COMPRESSION,
+    compression: CompressionOption | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int | None = None,
+    full: bool = False,
 ) -> bool:
     """
     Set the input_file's metadata to the latest version (on this system) and save it in output_file.
 
+    By default, only the metadata is rewritten: the (compressed) payload is copied as-is, so the model is never \
+        loaded and the upgrade is as fast as copying the file. output_file can be the same as input_file.
+    With full=True, the model is loaded and saved again with `to_vst` (which requires the model to fit in memory).
+    Compression (a zlib level, codec name or both, see `to_vst`), chunk size and workers are only used for a full \
+        upgrade. None keeps the codec and level of the input.
     Returns a bool that indicates whether an update was executed.
     """
     with as_binaryio(input_file) as f, RedirectStdStreams(stdout=devnull, stderr=devnull):
-        model, metadata, valid_meta = _from_vst(f, with_metadata=True, with_model=True, with_progress=False)
+        _, metadata, valid_meta = _from_vst(f, with_metadata=True, with_model=False, with_progress=False)
 
     if valid_meta:
         # nothing to do!
@@ -361,25 +757,142 @@ def upgrade_metadata(
 
     print("Starting upgrade on", input_file, file=sys.stderr)
 
-    if compression is None:
-        compression_level = typing.cast(
-            ZeroThroughNine, getattr(metadata.meta_header, "compression_level", DEFAULT_COMPRESSION)
-        )
-        compression = compression_level if isinstance(compression_level, int) else DEFAULT_COMPRESSION
+    if full:
+        _full_upgrade(input_file, output_file, metadata, compression, chunk_size, workers)
+    else:
+        if compression is not None:
+            warnings.warn("Compression can only be changed with a full upgrade, keeping the current compression.")
 
-    compression = min(compression, 9)
-    compression = max(compression, 0)
-    to_vst(model, output_file, compression=typing.cast(ZeroThroughNine, compression))
+        with as_binaryio(input_file) as f_in, _replace_when_done(output_file, mode_from=input_file) as f_out:
+            old_metadata = read_metadata(f_in)
+            _write_upgraded(f_in, f_out, old_metadata)
 
     print(f"Completed upgrade on {input_file}. Wrote to {output_file}.", file=sys.stderr)
     return True
 
 
+def _full_upgrade(
+    input_file: str | Path | typing.BinaryIO,
+    output_file: str | Path | typing.BinaryIO,
+    metadata: Metadata,
+    compression: CompressionOption | None,
+    chunk_size: int,
+    workers: int | None,
+) -> None:
+    """
+    Load the model and save it again with the latest metadata.
+    """
+    with as_binaryio(input_file) as f, RedirectStdStreams(stdout=devnull, stderr=devnull):
+        model, _, _ = _from_vst(f, with_metadata=False, with_model=True, with_progress=False, workers=workers)
+
+    if compression is None:
+        compression_level = getattr(metadata.meta_header, "compression_level", DEFAULT_COMPRESSION)
+        codec = getattr(metadata.meta_header, "codec", None) or DEFAULT_CODEC
+        compression = f"{codec}:{compression_level}" if isinstance(compression_level, int) else DEFAULT_COMPRESSION
+
+    payload_format = getattr(metadata.meta_header, "payload_format", None) or DEFAULT_PAYLOAD_FORMAT
+    to_vst(
+        model,
+        output_file,
+        compression=compression,
+        payload_format=typing.cast(PayloadFormat, payload_format),
+        chunk_size=chunk_size,
+        workers=workers,
+    )
+
+
+def _write_recompressed(
+    input_file: typing.BinaryIO,
+    output_file: typing.BinaryIO,
+    old: Metadata,
+    codec: Codec,
+    level: int,
+    chunk_size: int,
+    workers: int | None,
+) -> Metadata:
+    """
+    Write the latest metadata to output_file, followed by the payload of input_file with another compression.
+
+    The payload is only decompressed and compressed again, the pickled model itself is copied as-is.
+    An up-to-date header is reused (so torch is not needed), an older header is upgraded like in `upgrade_metadata`.
+    """
+    # headers before version 3 have no codec, these were always compressed with zlib:
+    old_codec = getattr(old.meta_header, "codec", None) or DEFAULT_CODEC
+    # headers before version 4 are never chunked:
+    chunked = bool(getattr(old.meta_header, "chunk_size", 0))
+
+    latest_version = getattr(get_version(MetaHeader, "latest"), "__version__", None)
+    metadata = old if old.meta_version == latest_version else _upgraded_metadata(old)
+    metadata.meta_header.codec = codec.name
+    metadata.meta_header.compression_level = level
+    metadata.meta_header.chunk_size = chunk_size
+
+    output_file.write(HASHBANG)
+    metadata_position = output_file.tell()
+    output_file.write(asbytes(metadata))
+
+    writer = _payload_writer(output_file, level, codec, chunk_size, workers)
+    try:
+        with open_payload(input_file, old.content_length, old_codec, chunked=chunked, workers=workers) as payload:
+            shutil.copyfileobj(payload, writer, CHUNK_SIZE)
+    except CodecError as e:
+        raise CorruptedModelException("compression", e) from e
+
+    writer.finish()
+    _update_metadata(metadata, writer)
+
+    end_position = output_file.tell()
+    output_file.seek(metadata_position)
+    output_file.write(asbytes(metadata))
+    output_file.seek(end_position)
+    return metadata
+
+
+def recompress(
+    input_file: str | Path | typing.BinaryIO,
+    output_file: str | Path | typing.BinaryIO,
+    compression: CompressionOption = DEFAULT_COMPRESSION,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int | None = None,
+) -> Metadata:
+    """
+    Change the compression of a .vst file, without loading the model.
+
+    Compression is a zlib level (0 - 9), a codec name ('none', 'zlib', 'zstd', 'lz4') or both ('zstd:9').
+    The payload is streamed through the old and new codec, so dill and torch are never used and the model does \
+        not have to fit in memory. The metadata is upgraded to the latest version along the way.
+    output_file can be the same as input_file. Returns the new metadata.
+    """
+    if chunk_size < 0:
+        raise ValueError(f"Chunk size can not be negative, got {chunk_size}.")
+
+    codec, level = parse_compression(compression)
+
+    print("Starting recompress on", input_file, file=sys.stderr)
+
+    with as_binaryio(input_file) as f_in:
+        old_metadata = read_metadata(f_in)
+        payload_format = getattr(old_metadata.meta_header, "payload_format", None) or DEFAULT_PAYLOAD_FORMAT
+        if payload_format in UNCOMPRESSED_PAYLOAD_FORMATS:
+            raise ValueError(f"The '{payload_format}' payload format is always stored uncompressed.")
+
+        with _replace_when_done(output_file, mode_from=input_file) as f_out:
+            metadata = _write_recompressed(f_in, f_out, old_metadata, codec, level, chunk_size, workers)
+
+    print(f"Completed recompress on {input_file}. Wrote to {output_file}.", file=sys.stderr)
+    return metadata
+
+
 load_model = from_vst
 load_model_with_metadata = from_vst_with_metadata
 
 
-def simple_load(filename: str | SimpleTransformer) -> tuple[SimpleTransformer, str]:
+def simple_load(
+    filename: str | SimpleTransformer,
+    timings: TimingReport | None = None,
+    device: str = "auto",
+    mmap: bool = False,
+) -> tuple[SimpleTransformer, str]:
     """
     Helper function for the cli.
 
@@ -389,7 +902,7 @@ def simple_load(filename: str | SimpleTransformer) -> tuple[SimpleTransformer, s
     if isinstance(filename, str):
         print("Loading model", filename, "...", file=sys.stderr)
         with RedirectStdStreams(stdout=devnull, stderr=devnull):
-            model = from_vst(filename)
+            model = from_vst(filename, device=device, mmap=mmap, timings=timings)
         print(f"Done loading {model}!", file=sys.stderr)
     elif isinstance(filename, SimpleTransformerProtocol):
         model = filename
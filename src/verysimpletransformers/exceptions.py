@@ -38,7 +38,52 @@ class CorruptedModelException(BaseVSTException, ValueError):
         super().__init__(msg)
 
 
-extras = typing.Literal["drive"]
+class CodecError(BaseVSTException, ValueError):
+    """
+    Raised for unknown compression codecs, or data that could not be decompressed with a codec.
+    """
+
+
+class PayloadFormatError(BaseVSTException, ValueError):
+    """
+    Raised for a payload format that can't be read (e.g. of a file that was written by a newer version).
+    """
+
+
+class UnknownModelException(BaseVSTException, LookupError):
+    """
+    Raised when a model is requested by name that does not exist (e.g. in the models directory of a ModelPool).
+    """
+
+
+class QueueFullException(BaseVSTException):
+    """
+    Raised when the inference queue of a server is full, so a request is rejected instead of waiting.
+    """
+
+    retry_after: float
+
+    def __init__(self, retry_after: float) -> None:
+        """
+        Provide an estimate of when the queue has room again (in seconds).
+        """
+        self.retry_after = retry_after
+        super().__init__(f"The inference queue is full, try again in {retry_after:.1f}s.")
+
+
+class DeadlineExceededException(BaseVSTException, TimeoutError):
+    """
+    Raised for a request whose deadline passed before its inputs were predicted (so they are not predicted anymore).
+    """
+
+
+class WorkersCrashingException(BaseVSTException, RuntimeError):
+    """
+    Raised when the workers of a pre-fork server crash too often to keep restarting them (e.g. failing at startup).
+    """
+
+
+extras = typing.Literal["drive", "zstd", "lz4"]
 
 
 class ExtraNotInstalledError(BaseVSTException):  # pragma: no cover
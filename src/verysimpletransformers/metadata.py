@@ -2,20 +2,18 @@
 Functions to deal with metadata of `.vst` files.
 """
 
-import re
-import sys
+import functools
+import importlib.metadata
 import warnings
 from typing import Any
 
-import torch
-import transformers
 from configuraptor import BinaryConfig
-from plumbum import local
-from plumbum.cmd import grep
 from rich import print
 
 from .__about__ import __version__
+from .compression import DEFAULT_CODEC
 from .metadata_schema import Metadata, MetaHeader, Version
+from .types import DEFAULT_PAYLOAD_FORMAT, PayloadFormat
 from .versioning import get_version
 
 
@@ -54,15 +52,21 @@ def compare_versions(pkg: str, version1: Version | None, version2: Version | Non
     return True
 
 
+@functools.cache
+def _package_version(package: str) -> str:
+    """
+    Get the installed version of a package from its metadata, without importing it.
+
+    Cached, since the installed version does not change while running.
+    """
+    return importlib.metadata.version(package)
+
+
 def _simpletransformers_version() -> str:
     """
     Get the installed ST version.
     """
-    _python = sys.executable
-    python = local["python"]
-    options = (python["-m", "pip", "freeze"] | grep["simpletransformers"])()
-
-    return next(re.finditer(r"simpletransformers==(\d+\.\d+\.\d+)", options)).group(1)
+    return _package_version("simpletransformers")
 
 
 def get_simpletransformers_version() -> Version:
@@ -83,7 +87,7 @@ def _transformers_version() -> str:
     """
     Get the installed transformers version.
     """
-    return str(transformers.__version__)
+    return _package_version("transformers")
 
 
 def get_transformers_version() -> Version:
@@ -93,7 +97,21 @@ def get_transformers_version() -> Version:
     return as_version(_transformers_version())
 
 
-def get_metadata(content_length: int, compression_level: int, device: str) -> Metadata:
+def get_torch_version() -> Version:
+    """
+    Get the installed torch version as a binary Version object, without importing torch.
+    """
+    return as_version(_package_version("torch"))
+
+
+def get_metadata(
+    content_length: int,
+    compression_level: int,
+    device: str,
+    payload_format: PayloadFormat = DEFAULT_PAYLOAD_FORMAT,
+    codec: str = DEFAULT_CODEC,
+    chunk_size: int = 0,
+) -> Metadata:
     """
     Build the binary metadata object that is prefixed before the model data.
 
@@ -118,11 +136,19 @@ def get_metadata(content_length: int, compression_level: int, device: str) -> Me
     header.simpletransformers_version = get_simpletransformers_version()
     header.verysimpletransformers_version = get_verysimpletransformers_version()
 
+    import torch  # only imported when a model is saved, so torch is already loaded anyway.
+
     header.torch_version = torch.__version__
     header.cuda_available = torch.cuda.is_available()
     header.device = device
 
     header.compression_level = compression_level
+    header.payload_format = payload_format
+    header.codec = codec
+    header.chunk_size = chunk_size
+    # filled in after the payload is written:
+    header.chunk_count = 0
+    header.checksum = 0
 
     meta = Metadata()
 
@@ -66,6 +66,144 @@ class MetaHeader(BinaryConfig):  # type: ignore
         return f"{result[:-2]}>"
 
 
+@define_version(2)
+class MetaHeader(BinaryConfig):  # type: ignore
+    """
+    Version 2 adds the payload format.
+
+    'dill' (the only format in version 1) pickles the whole model,
+    'tensors' stores the raw data of torch storages after the pickle.
+    See `payload.py`.
+    """
+
+    welcome_text = BinaryField(str, length=256)
+
+    transformers_version = BinaryField(Version)
+    simpletransformers_version = BinaryField(Version)
+    verysimpletransformers_version = BinaryField(Version)
+
+    torch_version = BinaryField(str, length=16)  # includes cpu/cuda so store as str
+    cuda_available = BinaryField(bool)
+    device = BinaryField(str, length=8)
+
+    compression_level = BinaryField(int, format="H")
+    payload_format = BinaryField(str, length=8)
+
+    def __repr__(self) -> str:
+        """
+        Pretty representation of the meta header data.
+        """
+        result = "MetaHeader<"
+        for name, field in self._fields.items():
+            value = getattr(self, name)
+            result += f"{name}={value}, "
+        return f"{result[:-2]}>"
+
+
+@define_version(3)
+class MetaHeader(BinaryConfig):  # type: ignore
+    """
+    Version 3 adds the compression codec.
+
+    Older versions were always compressed with zlib ('none' for the 'mmap' payload format).
+    The compression level is specific to the codec. See `compression.py`.
+    """
+
+    welcome_text = BinaryField(str, length=256)
+
+    transformers_version = BinaryField(Version)
+    simpletransformers_version = BinaryField(Version)
+    verysimpletransformers_version = BinaryField(Version)
+
+    torch_version = BinaryField(str, length=16)  # includes cpu/cuda so store as str
+    cuda_available = BinaryField(bool)
+    device = BinaryField(str, length=8)
+
+    compression_level = BinaryField(int, format="H")
+    payload_format = BinaryField(str, length=8)
+    codec = BinaryField(str, length=8)
+
+    def __repr__(self) -> str:
+        """
+        Pretty representation of the meta header data.
+        """
+        result = "MetaHeader<"
+        for name, field in self._fields.items():
+            value = getattr(self, name)
+            result += f"{name}={value}, "
+        return f"{result[:-2]}>"
+
+
+@define_version(4)
+class MetaHeader(BinaryConfig):  # type: ignore
+    """
+    Version 4 adds the chunk index: the payload can consist of independently compressed chunks.
+
+    chunk_size is the (uncompressed) size of each chunk, 0 means the payload is a single compressed stream
+    (which older versions always are). Every chunk is prefixed with its compressed size, see `streams.py`.
+    """
+
+    welcome_text = BinaryField(str, length=256)
+
+    transformers_version = BinaryField(Version)
+    simpletransformers_version = BinaryField(Version)
+    verysimpletransformers_version = BinaryField(Version)
+
+    torch_version = BinaryField(str, length=16)  # includes cpu/cuda so store as str
+    cuda_available = BinaryField(bool)
+    device = BinaryField(str, length=8)
+
+    compression_level = BinaryField(int, format="H")
+    payload_format = BinaryField(str, length=8)
+    codec = BinaryField(str, length=8)
+    chunk_size = BinaryField(int, format="Q")
+    chunk_count = BinaryField(int, format="Q")
+
+    def __repr__(self) -> str:
+        """
+        Pretty representation of the meta header data.
+        """
+        result = "MetaHeader<"
+        for name, field in self._fields.items():
+            value = getattr(self, name)
+            result += f"{name}={value}, "
+        return f"{result[:-2]}>"
+
+
+@define_version(5)
+class MetaHeader(BinaryConfig):  # type: ignore
+    """
+    Version 5 adds a crc32 checksum of the (compressed) payload, so it can be verified without loading it.
+    """
+
+    welcome_text = BinaryField(str, length=256)
+
+    transformers_version = BinaryField(Version)
+    simpletransformers_version = BinaryField(Version)
+    verysimpletransformers_version = BinaryField(Version)
+
+    torch_version = BinaryField(str, length=16)  # includes cpu/cuda so store as str
+    cuda_available = BinaryField(bool)
+    device = BinaryField(str, length=8)
+
+    compression_level = BinaryField(int, format="H")
+    payload_format = BinaryField(str, length=8)
+    codec = BinaryField(str, length=8)
+    chunk_size = BinaryField(int, format="Q")
+    chunk_count = BinaryField(int, format="Q")
+    checksum = BinaryField(int, format="I")
+
+    def __repr__(self) -> str:
+        """
+        Pretty representation of the meta header data.
+        """
+        result = "MetaHeader<"
+        for name, field in self._fields.items():
+            value = getattr(self, name)
+            result += f"{name}={value}, "
+        return f"{result[:-2]}>"
+
+
 class Metadata(BinaryConfig):
     """
     MetaHeader can be versioned but for backwards compatiblity we assume this stays the same!
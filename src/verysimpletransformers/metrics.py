@@ -0,0 +1,330 @@
+"""
+Low-overhead in-process metrics of the server, exposed at GET /metrics in the Prometheus text format.
+
+Recording a value is a dict lookup and a few additions under a lock (histograms find their bucket with bisect), all
+formatting only happens when /metrics is scraped. No external client library is needed.
+
+Usage:
+    metrics = ServerMetrics()
+    metrics.stages.observe(0.012, "predict")
+    print(metrics.render())
+
+Note: with pre-forked workers, every process has its own metrics; a scrape shows those of the worker that answers it.
+"""
+from __future__ import annotations
+
+import bisect
+import collections
+import contextlib
+import math
+import threading
+import time
+import typing
+
+# latency buckets in seconds: 0.1ms .. 10s
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+STAGES = ("parse", "queue", "predict", "serialize")
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(pairs: dict[str, str]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
+
+
+class Metric:
+    """
+    Base for a named metric, optionally with one label.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label: str | None = None) -> None:
+        """
+        Name and documentation are used for the HELP and TYPE lines, `label` is the name of the optional label.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._lock = threading.Lock()
+
+    def _label_pairs(self, value: str) -> dict[str, str]:
+        return {self.label: value} if self.label else {}
+
+    def samples(self) -> list[str]:  # pragma: no cover
+        """
+        Sample lines of this metric.
+        """
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        """
+        HELP, TYPE and sample lines.
+        """
+        return "\n".join(
+            [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        )
+
+
+class Counter(Metric):
+    """
+    Value that only goes up.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label: str | None = None) -> None:
+        """
+        Start at zero.
+        """
+        super().__init__(name, documentation, label)
+        self.values: dict[str, float] = {} if label else {"": 0}
+
+    def inc(self, amount: float = 1, label: str = "") -> None:
+        """
+        Increase the value (for a label value).
+        """
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def get(self, label: str = "") -> float:
+        """
+        Current value (for a label value).
+        """
+        return self.values.get(label, 0)
+
+    def samples(self) -> list[str]:
+        """
+        One line per label value.
+        """
+        with self._lock:
+            snapshot = sorted(self.values.items())
+
+        return [f"{self.name}{_labels(self._label_pairs(label))} {_format_value(value)}" for label, value in snapshot]
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, or is computed by a function when scraped.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, function: typing.Callable[[], float] | None = None
+    ) -> None:
+        """
+        With a function, the value is only computed when the metrics are rendered.
+        """
+        super().__init__(name, documentation)
+        self.function = function
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increase the value.
+        """
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        """
+        Decrease the value.
+        """
+        with self._lock:
+            self.value -= amount
+
+    def get(self) -> float:
+        """
+        Current value.
+        """
+        return self.function() if self.function else self.value
+
+    def samples(self) -> list[str]:
+        """
+        A single line.
+        """
+        return [f"{self.name} {_format_value(self.get())}"]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+        label: str | None = None,
+    ) -> None:
+        """
+        Buckets are the (sorted) upper bounds, +Inf is added automatically.
+        """
+        super().__init__(name, documentation, label)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[str, list[int]] = {}  # per label: non-cumulative count per bucket (+Inf last)
+        self._sums: dict[str, float] = {}
+
+    def observe(self, value: float, label: str = "") -> None:
+        """
+        Add a value (for a label value).
+        """
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if (counts := self._counts.get(label)) is None:
+                counts = self._counts[label] = [0] * (len(self.buckets) + 1)
+                self._sums[label] = 0.0
+            counts[idx] += 1
+            self._sums[label] += value
+
+    def count(self, label: str = "") -> int:
+        """
+        Amount of observed values (for a label value).
+        """
+        return sum(self._counts.get(label, ()))
+
+    def sum(self, label: str = "") -> float:
+        """
+        Sum of observed values (for a label value).
+        """
+        return self._sums.get(label, 0.0)
+
+    def samples(self) -> list[str]:
+        """
+        Cumulative bucket lines, sum and count per label value.
+        """
+        with self._lock:
+            snapshot = sorted((label, list(counts), self._sums[label]) for label, counts in self._counts.items())
+
+        lines = []
+        for label, counts, total in snapshot:
+            pairs = self._label_pairs(label)
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels({**pairs, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    A collection of metrics that are rendered together.
+    """
+
+    def __init__(self) -> None:
+        """
+        Start without metrics.
+        """
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> typing.Any:
+        """
+        Add a metric and return it.
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text format.
+        """
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class ServerMetrics(Registry):
+    """
+    The metrics of a model server: requests, stage latencies, batch sizes, throughput, queue, shed load and memory.
+    """
+
+    def __init__(self, rate_window: float = 60.0) -> None:
+        """
+        Items per second is computed over the last `rate_window` seconds.
+        """
+        from .bench import current_rss
+
+        super().__init__()
+        self.rate_window = rate_window
+        self.started = time.monotonic()
+        self._recent: collections.deque[tuple[float, int]] = collections.deque()  # (time, amount of items)
+        self._recent_lock = threading.Lock()
+
+        self.requests: Counter = self.register(Counter("vst_requests_total", "HTTP requests by status.", "status"))
+        self.in_flight: Gauge = self.register(Gauge("vst_requests_in_flight", "Requests that are being handled."))
+        self.stages: Histogram = self.register(
+            Histogram("vst_request_stage_seconds", "Time spent per stage of a request.", LATENCY_BUCKETS, "stage")
+        )
+        self.batch_size: Histogram = self.register(
+            Histogram("vst_batch_size", "Amount of inputs per model.predict call.", BATCH_SIZE_BUCKETS)
+        )
+        self.items: Counter = self.register(Counter("vst_predicted_items_total", "Inputs predicted by the model."))
+        self.queued: Gauge = self.register(Gauge("vst_queued_inputs", "Inputs waiting for the inference worker."))
+        self.rejected: Counter = self.register(
+            Counter("vst_rejected_requests_total", "Requests that were shed instead of predicted, by reason.", "reason")
+        )
+        self.items_per_second: Gauge = self.register(
+            Gauge(
+                "vst_predicted_items_per_second",
+                f"Inputs predicted per second, over the last {rate_window:g} seconds.",
+                self.recent_rate,
+            )
+        )
+        self.rss: Gauge = self.register(
+            Gauge("process_resident_memory_bytes", "Resident memory of this process.", lambda: float(current_rss()))
+        )
+
+    def record_batch(self, size: int, seconds: float) -> None:
+        """
+        One model.predict call with `size` inputs took `seconds`.
+        """
+        self.stages.observe(seconds, "predict")
+        self.batch_size.observe(size)
+        self.items.inc(size)
+        now = time.monotonic()
+        with self._recent_lock:
+            self._recent.append((now, size))
+            # also when /metrics is never scraped, only the batches of the rate window are kept:
+            self._forget(now)
+
+    def _forget(self, now: float) -> None:
+        """
+        Drop the batches that are older than the rate window (with the lock held).
+        """
+        while self._recent and now - self._recent[0][0] > self.rate_window:
+            self._recent.popleft()
+
+    def recent_rate(self) -> float:
+        """
+        Inputs predicted per second over the rate window (or since the start, if that's shorter).
+        """
+        now = time.monotonic()
+        with self._recent_lock:
+            self._forget(now)
+            items = sum(size for _, size in self._recent)
+
+        return items / max(min(self.rate_window, now - self.started), 1e-9)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> typing.Generator[None, None, None]:
+        """
+        Measure the duration of this block as stage `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(time.perf_counter() - start, name)
@@ -0,0 +1,228 @@
+"""
+Streaming predictions: newline-delimited inputs in, newline-delimited JSON (NDJSON) predictions out.
+
+POST /predict/stream accepts a body with one input per line (a JSON value per line for NDJSON/JSON content types,
+otherwise plain text lines), sent with a Content-Length or with chunked transfer encoding. The body is read in blocks
+as it arrives, complete lines are predicted in batches of at most STREAM_BATCH_SIZE and every batch is sent back
+right away as a chunk of NDJSON lines (one prediction per input line, in order). Memory usage is constant: only one
+block, the unfinished line (at most MAX_LINE_BYTES) and one batch are kept.
+
+A line that can't be parsed gets `{"error": "..."}` as its output line, the other lines are still predicted.
+The status is only sent with the first results: a line that is too long (413) or invalid chunked framing (400) before
+that gets an error response. Afterwards, the stream ends with an `{"error": "..."}` line and the connection is closed.
+
+Note: clients should read the response while sending the body (like `curl -T -`), since results are sent while the
+request is still being received.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import typing
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from email.message import Message
+
+STREAM_PATH = "/predict/stream"
+STREAM_BATCH_SIZE = 64
+READ_SIZE = 64 * 1024
+MAX_LINE_BYTES = 1024 * 1024
+JSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json")
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+class InvalidLine(typing.NamedTuple):
+    """
+    An input line that could not be parsed.
+    """
+
+    error: str
+
+
+Item = typing.Union[str, InvalidLine]
+
+
+class LineTooLong(ValueError):
+    """
+    A line of the body is longer than the decoder accepts.
+    """
+
+
+def is_json_lines(content_type: str | None) -> bool:
+    """
+    Whether every line of a body with this content type is a JSON value (instead of plain text).
+    """
+    return (content_type or "").split(";", 1)[0].strip().lower() in JSON_CONTENT_TYPES
+
+
+class LineDecoder:
+    """
+    Incrementally split a body into input lines, keeping only the last unfinished line in memory.
+    """
+
+    def __init__(self, json_lines: bool, max_line: int = MAX_LINE_BYTES) -> None:
+        """
+        With json_lines, every line is parsed as a JSON value, otherwise it's used as text.
+
+        Lines longer than max_line bytes raise LineTooLong.
+        """
+        self.json_lines = json_lines
+        self.max_line = max_line
+        self._rest = bytearray()
+
+    def _check(self, line: bytes | bytearray) -> None:
+        if len(line) > self.max_line:
+            raise LineTooLong(f"Line is longer than {self.max_line} bytes")
+
+    def _parse(self, line: bytes) -> Item | None:
+        line = line.rstrip(b"\r")
+        if not line.strip():
+            return None
+
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            return InvalidLine("Line is not valid UTF-8")
+
+        if not self.json_lines:
+            return text
+
+        try:
+            return typing.cast(str, json.loads(text))
+        except json.JSONDecodeError as e:
+            return InvalidLine(f"Invalid JSON: {e}")
+
+    def feed(self, data: bytes) -> list[Item]:
+        """
+        Add a block of the body, returns the inputs of the lines that are now complete (empty lines are skipped).
+
+        Only the new block is searched for newlines, so a long line costs linear time.
+        """
+        *lines, rest = data.split(b"\n")
+        if not lines:
+            self._rest += rest
+            self._check(self._rest)
+            return []
+
+        lines[0] = bytes(self._rest) + lines[0]
+        self._rest = bytearray(rest)
+        for line in (*lines, rest):
+            self._check(line)
+        return [item for line in lines if (item := self._parse(line)) is not None]
+
+    def finish(self) -> list[Item]:
+        """
+        The body is done, returns the input of the last line if it had no newline.
+        """
+        rest, self._rest = bytes(self._rest), bytearray()
+        return [item] if (item := self._parse(rest)) is not None else []
+
+
+def batches(items: list[Item], size: int = STREAM_BATCH_SIZE) -> typing.Iterator[list[Item]]:
+    """
+    Split items into lists of at most `size`.
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def valid_inputs(items: list[Item]) -> list[str]:
+    """
+    Only the inputs that were parsed successfully, which are sent to the model.
+    """
+    return [item for item in items if not isinstance(item, InvalidLine)]
+
+
+def encode_lines(items: list[Item], predictions: list[typing.Any]) -> bytes:
+    """
+    One NDJSON line per item: the prediction, or an error object for lines that could not be parsed.
+    """
+    outputs = iter(predictions)
+    return "".join(
+        json.dumps({"error": item.error} if isinstance(item, InvalidLine) else next(outputs)) + "\n" for item in items
+    ).encode()
+
+
+def error_line(error: Exception | str) -> bytes:
+    """
+    The NDJSON line that ends a stream that can't be continued.
+    """
+    return json.dumps({"error": str(error)}).encode() + b"\n"
+
+
+def chunk(data: bytes) -> bytes:
+    """
+    Frame data as one chunk of a response with chunked transfer encoding.
+    """
+    return b"%X\r\n" % len(data) + data + b"\r\n"
+
+
+def chunk_size(line: bytes) -> int:
+    """
+    The size of a chunk from its size line (ignoring extensions), raises ValueError for invalid sizes.
+    """
+    try:
+        return int(line.split(b";", 1)[0], 16)
+    except ValueError as e:
+        raise ValueError("Invalid chunk size") from e
+
+
+def iter_body(
+    rfile: io.BufferedIOBase | typing.BinaryIO, headers: Message[str, str] | typing.Mapping[str, str]
+) -> typing.Iterator[bytes]:
+    """
+    Read the body of a request in blocks as they arrive, either chunked or with a Content-Length.
+
+    Raises ValueError for an invalid chunk size or Content-Length.
+    """
+    read = getattr(rfile, "read1", rfile.read)
+    if "chunked" in (headers.get("Transfer-Encoding") or "").lower():
+        while size := chunk_size(rfile.readline()):
+            while size > 0:
+                if not (data := read(min(size, READ_SIZE))):
+                    return
+                size -= len(data)
+                yield data
+            rfile.readline()  # \r\n after every chunk
+
+        # skip trailers:
+        while rfile.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        return
+
+    remaining = int(headers.get("Content-Length") or 0)
+    while remaining > 0 and (data := read(min(remaining, READ_SIZE))):
+        remaining -= len(data)
+        yield data
+
+
+async def aiter_body(reader: asyncio.StreamReader, headers: typing.Mapping[str, str]) -> typing.AsyncIterator[bytes]:
+    """
+    Read the body of a request from an asyncio stream in blocks as they arrive (headers have lowercase names).
+
+    Raises ValueError for an invalid chunk size or Content-Length and asyncio.IncompleteReadError if the client
+    disconnects before the body is complete.
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while size := chunk_size(await reader.readuntil(b"\r\n")):
+            while size > 0:
+                if not (data := await reader.read(min(size, READ_SIZE))):
+                    raise asyncio.IncompleteReadError(b"", size)
+                size -= len(data)
+                yield data
+            await reader.readexactly(2)  # \r\n after every chunk
+
+        # skip trailers:
+        while (await reader.readuntil(b"\r\n")) != b"\r\n":
+            pass
+        return
+
+    remaining = int(headers.get("content-length") or 0)
+    while remaining > 0:
+        if not (data := await reader.read(min(remaining, READ_SIZE))):
+            raise asyncio.IncompleteReadError(b"", remaining)
+        remaining -= len(data)
+        yield data
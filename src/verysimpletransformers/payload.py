@@ -0,0 +1,457 @@
+"""
+Payload formats for the model data in a `.vst` file.
+
+- 'dill': the whole model is pickled with dill.
+    Every torch storage becomes a nested `torch.save` blob, which is loaded again via `CudaUnpickler`.
+- 'tensors': the model is pickled with dill, but torch storages are replaced by a reference (persistent id).
+    The raw bytes of these storages are written right after the pickle, in the same (compressed) stream,
+    and are read directly into freshly allocated storages on load.
+- 'mmap': like 'tensors', but uncompressed and with every storage aligned to a page (ALIGNMENT) in the file.
+    The payload starts with the pickle length and the offset of the tensor data, so the storages can be
+    memory mapped (`from_vst(..., mmap=True)`) instead of read.
+"""
+from __future__ import annotations
+
+import io
+import itertools
+import mmap
+import struct
+import typing
+import warnings
+from pickle import UnpicklingError  # nosec
+
+import dill  # nosec
+import torch
+
+from .exceptions import PayloadFormatError
+from .streams import CHUNK_SIZE, PayloadWriter, copy_stream
+from .timings import TimingReport
+from .types import (  # noqa: F401 (defined in the lightweight types module, re-exported here)
+    DEFAULT_PAYLOAD_FORMAT,
+    PAYLOAD_FORMATS,
+    UNCOMPRESSED_PAYLOAD_FORMATS,
+    PayloadFormat,
+)
+
+ALIGNMENT = 4096  # a memory page on most systems
+
+# 'mmap' payload starts with: pickle length, offset of the tensor data (relative to the start of the payload)
+MMAP_PREFIX = struct.Struct("Q Q")
+
+# ("storage", index, dtype or None for untyped storages, size in bytes, optionally: offset in the tensor data)
+StorageId = tuple[str, int, torch.dtype | None, int] | tuple[str, int, torch.dtype | None, int, int]
+
+
+class CudaUnpickler(dill.Unpickler):  # type: ignore
+    """
+    Custom unpickler that deals with cuda being possibly available or missing.
+    """
+
+    def __init__(
+        self,
+        filelike: typing.BinaryIO,
+        *a: typing.Any,
+        device: str = "cpu",
+        timings: TimingReport | None = None,
+        **kw: typing.Any,
+    ):
+        """
+        You can choose a device to load the model onto (cpu, cuda).
+
+        Moving tensor data to another device is measured in `timings` (if the payload format supports it).
+        """
+        self.device = device
+        self.timings = timings or TimingReport()
+        super().__init__(filelike, *a, **kw)
+
+    def find_class(self, module: str, name: str) -> typing.Any:  # pragma: no cover
+        """
+        Custom unpickling behavior.
+        """
+        if module == "torch.storage" and name == "_load_from_bytes":
+            return lambda b: torch.load(io.BytesIO(b), map_location=self.device)
+        else:
+            return super().find_class(module, name)
+
+    @classmethod
+    def loads(cls, data: bytes, device: str = "cpu") -> typing.Any:
+        """
+        Shortcut for creating an instance and calling .load on it.
+        """
+        return cls(io.BytesIO(data), device=device).load()
+
+
+def align(position: int, alignment: int = ALIGNMENT) -> int:
+    """
+    Round position up to the next multiple of alignment.
+    """
+    return -(-position // alignment) * alignment
+
+
+def storage_as_array(storage: torch.UntypedStorage) -> typing.Any:
+    """
+    Get a (writable) numpy view of the raw bytes of a cpu storage, without copying it.
+    """
+    return torch.empty(0, dtype=torch.uint8).set_(storage).numpy()
+
+
+def write_storages(
+    file: typing.BinaryIO | PayloadWriter,
+    storages: typing.Iterable[torch.UntypedStorage],
+    offsets: typing.Iterable[int | None] = None,
+    timings: TimingReport | None = None,
+) -> None:
+    """
+    Write the raw bytes of each storage (in order) to the file, per chunk.
+
+    If offsets are given, the storages are padded with zeroes to start at these offsets (relative to the first one).
+    Copying storages of other devices to the cpu is measured as 'device move' in `timings`.
+    """
+    timings = timings or TimingReport()
+    position = 0
+    for storage, offset in zip(storages, offsets or itertools.repeat(None)):
+        if offset is not None:
+            file.write(bytes(offset - position))
+            position = offset
+
+        if storage.device.type != "cpu":
+            with timings.stage("device move") as stage:
+                storage = storage.cpu()  # type: ignore[no-untyped-call]
+                stage.bytes += storage.nbytes()
+
+        view = memoryview(storage_as_array(storage))
+        for start in range(0, view.nbytes, CHUNK_SIZE):
+            file.write(view[start : start + CHUNK_SIZE])
+        position += view.nbytes
+
+
+def _skip(file: typing.BinaryIO | io.BufferedIOBase, amount: int) -> None:
+    if amount and len(file.read(amount)) != amount:
+        raise UnpicklingError("Tensor data is truncated.")
+
+
+def read_storages(
+    file: io.BufferedIOBase,
+    storages: typing.Iterable[torch.UntypedStorage],
+    offsets: typing.Iterable[int | None] = None,
+    timings: TimingReport | None = None,
+) -> None:
+    """
+    Fill each storage (in order) with raw bytes from the file.
+
+    If offsets are given, the padding before each storage is skipped (see `write_storages`).
+    Cpu storages are filled in place, other devices get their data via a temporary cpu storage \
+        (measured as 'device move' in `timings`).
+    """
+    timings = timings or TimingReport()
+    position = 0
+    for storage, offset in zip(storages, offsets or itertools.repeat(None)):
+        if offset is not None:
+            _skip(file, offset - position)
+            position = offset
+
+        position += storage.nbytes()
+        target = (
+            storage
+            if storage.device.type == "cpu"
+            else torch.UntypedStorage(storage.nbytes())  # type: ignore[no-untyped-call]
+        )
+
+        view = memoryview(storage_as_array(target))
+        filled = 0
+        while filled < view.nbytes:
+            if not (read := file.readinto(view[filled:])):
+                raise UnpicklingError("Tensor data is truncated.")
+            filled += read
+
+        if target is not storage:
+            with timings.stage("device move") as stage:
+                storage.copy_(target)
+                stage.bytes += target.nbytes()
+
+
+class TensorPickler(dill.Pickler):  # type: ignore
+    """
+    Dill pickler that stores a reference to torch storages instead of their data.
+
+    After `dump`, the collected storages can be written with `dump_storages`.
+    If an alignment is passed, every storage gets an aligned offset (which is stored in its reference).
+    """
+
+    storages: list[torch.UntypedStorage]
+    offsets: list[int]
+    data_size: int
+
+    def __init__(
+        self,
+        file: typing.BinaryIO | PayloadWriter,
+        *a: typing.Any,
+        alignment: int = 0,
+        timings: TimingReport | None = None,
+        **kw: typing.Any,
+    ) -> None:
+        """
+        Same signature as dill.Pickler, with an optional alignment for the storages.
+
+        Moving tensor data from another device to the cpu is measured in `timings`.
+        """
+        super().__init__(file, *a, **kw)
+        self._file = file
+        self.alignment = alignment
+        self.timings = timings or TimingReport()
+        self.storages = []
+        self.offsets = []
+        self.data_size = 0
+        self._storage_indices: dict[int, int] = {}
+
+    def persistent_id(self, obj: typing.Any) -> StorageId | None:
+        """
+        Replace (typed or untyped) storages with a reference to their index in `self.storages`.
+
+        Storages that are shared between tensors are only stored once.
+        """
+        if isinstance(obj, torch.storage.TypedStorage):
+            storage, dtype = obj._untyped_storage, obj.dtype
+        elif isinstance(obj, torch.UntypedStorage):
+            storage, dtype = obj, None
+        else:
+            return None
+
+        nbytes = storage.nbytes()
+        index = self._storage_indices.setdefault(storage._cdata, len(self.storages))
+        if index == len(self.storages):
+            self.storages.append(storage)
+            offset = align(self.data_size, self.alignment) if self.alignment else self.data_size
+            self.offsets.append(offset)
+            self.data_size = offset + nbytes
+
+        if self.alignment:
+            return "storage", index, dtype, nbytes, self.offsets[index]
+
+        return "storage", index, dtype, nbytes
+
+    def dump_storages(self, file: typing.BinaryIO | PayloadWriter | None = None) -> None:
+        """
+        Write the data of all storages that were referenced in the pickle (by default: right after it).
+        """
+        write_storages(file or self._file, self.storages, self.offsets if self.alignment else None, self.timings)
+
+
+class TensorUnpickler(CudaUnpickler):
+    """
+    Counterpart of TensorPickler: allocates the referenced storages and fills them after unpickling.
+
+    The storage data is read from `data_file`, which defaults to the file that is unpickled.
+    """
+
+    storages: dict[int, torch.UntypedStorage]
+    offsets: dict[int, int]
+
+    def __init__(
+        self,
+        filelike: typing.BinaryIO,
+        *a: typing.Any,
+        device: str = "cpu",
+        data_file: io.BufferedIOBase = None,
+        **kw: typing.Any,
+    ):
+        """
+        You can choose a device to load the model onto (cpu, cuda).
+        """
+        super().__init__(filelike, *a, device=device, **kw)
+        self._data_file = data_file or typing.cast(io.BufferedIOBase, filelike)
+        self.storages = {}
+        self.offsets = {}
+
+    def allocate(self, index: int, nbytes: int) -> torch.UntypedStorage:  # noqa: ARG002
+        """
+        Create an (empty) storage on the right device, to be filled by `fill_storages`.
+        """
+        return torch.UntypedStorage(nbytes, device=self.device)  # type: ignore[no-untyped-call]
+
+    def persistent_load(self, pid: StorageId) -> torch.UntypedStorage | torch.storage.TypedStorage:
+        """
+        Get the storage for every reference in the pickle.
+        """
+        typename, index, dtype, nbytes, *offset = pid
+        if typename != "storage":
+            raise UnpicklingError(f"Unsupported persistent id '{typename}'.")
+
+        if index not in self.storages:
+            if offset:
+                self.offsets[index] = offset[0]
+            self.storages[index] = self.allocate(index, nbytes)
+
+        storage = self.storages[index]
+        if dtype is None:
+            return storage
+
+        return torch.storage.TypedStorage(  # type: ignore[no-untyped-call]
+            wrap_storage=storage, dtype=dtype, _internal=True
+        )
+
+    def fill_storages(self) -> None:
+        """
+        Read the storage data that follows the pickle.
+        """
+        indices = sorted(self.storages)
+        offsets = [self.offsets[index] for index in indices] if self.offsets else None
+        read_storages(self._data_file, (self.storages[index] for index in indices), offsets, self.timings)
+
+    def load(self) -> typing.Any:
+        """
+        Unpickle the object and fill its storages.
+        """
+        result = super().load()
+        self.fill_storages()
+        return result
+
+
+class MappedTensorUnpickler(TensorUnpickler):
+    """
+    Unpickler for the 'mmap' payload format: storages are views on a (memory mapped) buffer, nothing is read.
+    """
+
+    def __init__(
+        self, filelike: typing.BinaryIO, *a: typing.Any, buffer: typing.Any, data_start: int, **kw: typing.Any
+    ):
+        """
+        'buffer' contains the whole file and the tensor data starts at position 'data_start'.
+        """
+        super().__init__(filelike, *a, **kw)
+        self.buffer = buffer
+        self.data_start = data_start
+
+    def allocate(self, index: int, nbytes: int) -> torch.UntypedStorage:
+        """
+        Create a storage that shares its memory with the buffer.
+        """
+        if not nbytes:
+            return torch.UntypedStorage(0)  # type: ignore[no-untyped-call]
+
+        offset = self.data_start + self.offsets[index]
+        return torch.frombuffer(self.buffer, dtype=torch.uint8, count=nbytes, offset=offset).untyped_storage()
+
+    def fill_storages(self) -> None:
+        """
+        Nothing to do, the data is paged in on first access.
+        """
+
+
+def _write_mmap_header(file: typing.BinaryIO | PayloadWriter, pickled: bytes | memoryview, position: int) -> None:
+    """
+    Write the prefix, the pickle and the padding that aligns the tensor data, for a payload starting at position.
+    """
+    header_size = MMAP_PREFIX.size + len(pickled)
+    data_offset = align(position + header_size) - position
+
+    file.write(MMAP_PREFIX.pack(len(pickled), data_offset))
+    file.write(pickled)
+    file.write(bytes(data_offset - header_size))
+
+
+def _dump_mmap(
+    obj: typing.Any, file: typing.BinaryIO | PayloadWriter, position: int, timings: TimingReport | None = None
+) -> None:
+    # the pickle itself (without tensor data) is small, so it's kept in memory to calculate the data offset:
+    pickler = TensorPickler(pickled := io.BytesIO(), alignment=ALIGNMENT, timings=timings)
+    pickler.dump(obj)
+
+    _write_mmap_header(file, pickled.getbuffer(), position)
+    pickler.dump_storages(file)
+
+
+def copy_mmap_payload(
+    source: typing.BinaryIO, target: typing.BinaryIO | PayloadWriter, length: int, position: int
+) -> None:
+    """
+    Copy an 'mmap' payload of `length` bytes that starts at source.tell() to `position` in another file.
+
+    The padding is recalculated, so the tensor data stays page-aligned at its new position.
+    """
+    pickle_length, data_offset = MMAP_PREFIX.unpack(source.read(MMAP_PREFIX.size))
+    pickled = source.read(pickle_length)
+    _skip(source, data_offset - MMAP_PREFIX.size - pickle_length)
+
+    _write_mmap_header(target, pickled, position)
+    copy_stream(source, target, length - data_offset)
+
+
+def dump_payload(
+    obj: typing.Any,
+    file: typing.BinaryIO | PayloadWriter,
+    payload_format: PayloadFormat,
+    position: int = 0,
+    timings: TimingReport | None = None,
+) -> None:
+    """
+    Pickle an object to a (compressing) file-like object in the chosen payload format.
+
+    Position is where the payload starts in the output file, which is required to align the 'mmap' format.
+    """
+    if payload_format == "mmap":
+        _dump_mmap(obj, file, position, timings)
+    elif payload_format == "tensors":
+        pickler = TensorPickler(file, timings=timings)
+        pickler.dump(obj)
+        pickler.dump_storages()
+    else:
+        dill.dump(obj, file)
+
+
+def _as_buffer(file: typing.BinaryIO) -> typing.Any:
+    """
+    Get the full contents of a file as a buffer without reading it: via mmap or (for BytesIO) its internal buffer.
+    """
+    try:
+        # copy-on-write: pages are shared with the page cache (and other processes) until they are modified.
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (AttributeError, OSError, ValueError):
+        if isinstance(file, io.BytesIO):
+            return file.getbuffer()
+
+    return None
+
+
+def load_mmap_payload(
+    file: typing.BinaryIO, device: str, use_mmap: bool = False, timings: TimingReport | None = None
+) -> typing.Any:
+    """
+    Load an 'mmap' payload that starts at the current position of file.
+
+    With use_mmap, the storages share memory with a memory map of the file, otherwise they are read into memory.
+    """
+    payload_start = file.tell()
+    pickle_length, data_offset = MMAP_PREFIX.unpack(file.read(MMAP_PREFIX.size))
+    pickled = io.BytesIO(file.read(pickle_length))
+
+    if use_mmap and device != "cpu":
+        warnings.warn(f"mmap=True is only supported for device='cpu', not '{device}'. Loading normally.")
+    elif use_mmap and (buffer := _as_buffer(file)) is not None:
+        return MappedTensorUnpickler(pickled, buffer=buffer, data_start=payload_start + data_offset).load()
+    elif use_mmap:
+        warnings.warn("mmap=True is only supported for actual files. Loading normally.")
+
+    _skip(file, data_offset - MMAP_PREFIX.size - pickle_length)
+    data_file = typing.cast(io.BufferedIOBase, file)
+    return TensorUnpickler(pickled, device=device, data_file=data_file, timings=timings).load()
+
+
+UNPICKLERS: dict[str, typing.Type[CudaUnpickler]] = {
+    "dill": CudaUnpickler,
+    "tensors": TensorUnpickler,
+}
+
+
+def get_unpickler(payload_format: str) -> typing.Type[CudaUnpickler]:
+    """
+    Find the right unpickler for a payload format (stored in the metadata).
+
+    Raises PayloadFormatError for unknown formats ('mmap' payloads are read with load_mmap_payload instead).
+    """
+    if payload_format not in UNPICKLERS:
+        raise PayloadFormatError(
+            f"Unknown payload format {payload_format!r} (supported: {', '.join(UNPICKLERS)}), "
+            "the file may have been written by a newer version of verysimpletransformers."
+        )
+    return UNPICKLERS[payload_format]
@@ -0,0 +1,343 @@
+"""
+Serve many models from one process: a pool of the `.vst` files in a directory, loaded on first use.
+
+Running one `vst serve` per model duplicates the Python runtime, torch and everything else that is shared between
+models. A ModelPool instead loads `<directory>/<name>.vst` when `/models/<name>/predict` is requested for the first
+time and keeps it for the next requests. The loaded models are bounded by a memory budget: before a model is loaded,
+the least recently used models are evicted to make room for it, estimated by its file size and checked again with its
+actual size after the load. Models that are handling a request and the most recently used model are never evicted, so
+the budget can be exceeded while all of them are busy or by a model that alone is bigger than the budget.
+When several requests need a model that is still loading, it's loaded only once and all of them wait for that load.
+
+Every model has its own inference worker (see MicroBatcher) and, when the server has a cache, its own prediction cache.
+With a warmup, every model is warmed up when it's loaded, before the requests that wait for it are predicted.
+
+Usage:
+    vst serve ./models/ --memory-budget 4GB
+    curl 'http://localhost:8000/models/customer-a/predict?query=...'
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import os
+import re
+import threading
+import typing
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+from .batching import DEFAULT_MAX_WAIT, MicroBatcher, Prediction
+from .exceptions import UnknownModelException
+from .prefork import model_tensors
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .cache import PredictionCache
+    from .metrics import ServerMetrics
+    from .warmup import Warmup
+
+MODELS_PATH = "/models"
+PREDICT_PATH = "/predict"
+MODEL_NAME = re.compile(r"\w[\w.-]*")
+
+
+def split_model_path(path: str) -> tuple[str | None, str]:
+    """
+    Split '/models/<name>/predict?query=...' into the model name and the path within that model ('/predict?query=...').
+
+    Other paths are returned as-is, without a name.
+    """
+    if not path.startswith(MODELS_PATH + "/"):
+        return None, path
+
+    name, _, rest = path[len(MODELS_PATH) + 1 :].partition("/")
+    return name, "/" + rest
+
+
+def model_memory(model: typing.Any, filename: str | Path) -> int:
+    """
+    Approximate memory usage of a loaded model in bytes: the size of its tensors, or of its file if it has none.
+    """
+    storages = {storage.data_ptr(): storage.nbytes() for storage in (t.untyped_storage() for t in model_tensors(model))}
+    return sum(storages.values()) or os.path.getsize(filename)
+
+
+class PooledModel:
+    """
+    A loaded model of the pool, with its own inference worker (and cache).
+    """
+
+    def __init__(
+        self,
+        pool: ModelPool,
+        name: str,
+        model: typing.Any,
+        size: int,
+        batcher: MicroBatcher,
+        cache: PredictionCache | None = None,
+    ) -> None:
+        """
+        Size is the (approximate) memory usage in bytes, which counts towards the budget of the pool.
+        """
+        self.pool = pool
+        self.name = name
+        self.model = model
+        self.size = size
+        self.batcher = batcher
+        self.cache = cache
+        self.users = 0  # requests that are using this model right now
+
+    def predict(self, inputs: list[str], deadline: float | None = None, bounded: bool = True) -> list[Prediction]:
+        """
+        Get the outputs for some inputs from the cache or the inference worker (see MicroBatcher.submit).
+        """
+        if self.cache is not None:
+            predict = functools.partial(self.batcher.predict, deadline=deadline, bounded=bounded)
+            return self.cache.predict(inputs, predict)
+        return self.batcher.predict(inputs, deadline, bounded)
+
+    def release(self) -> None:
+        """
+        Give the model back to its pool after use.
+        """
+        self.pool.release(self)
+
+
+class ModelPool:
+    """
+    Load the models of a directory on first use and keep the recently used ones, within a memory budget.
+
+    Usage:
+        pool = ModelPool("models/", memory_budget=4 * 1024**3)
+        with pool.using("customer-a") as model:
+            model.predict(["some input"])
+
+    Thread-safe: requests can use (and load) models concurrently.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        memory_budget: int | None = None,
+        max_batch: int = 1,
+        max_wait_ms: float = DEFAULT_MAX_WAIT * 1000,
+        cache: PredictionCache | None = None,
+        metrics: ServerMetrics | None = None,
+        load: typing.Callable[[str], typing.Any] | None = None,
+        max_queue: int | None = None,
+        warmup: Warmup | None = None,
+    ) -> None:
+        """
+        Without a memory budget, models are never evicted.
+
+        Every model gets a worker that batches like `MicroBatcher(max_batch, max_wait_ms, max_queue=max_queue)` and, \
+            with a cache, an empty cache with the same limits. `load` loads a model from a filename (default: \
+            simple_load). With `warmup`, every model is warmed up after it's loaded.
+        """
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.cache = cache
+        self.metrics = metrics
+        self.load = load or self._simple_load
+        self.max_queue = max_queue
+        self.warmup = warmup
+        self._models: OrderedDict[str, PooledModel] = OrderedDict()  # least recently used first
+        self._loading: dict[str, Future[PooledModel]] = {}
+        self._reserved: dict[str, int] = {}  # estimated memory of the models that are loading
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _simple_load(filename: str) -> typing.Any:
+        from .core import simple_load
+
+        return simple_load(filename)[0]
+
+    @property
+    def bytes(self) -> int:
+        """
+        Memory usage of the loaded models.
+        """
+        return sum(model.size for model in self._models.values())
+
+    def _reserve(self, name: str) -> list[PooledModel]:
+        """
+        Count the file size of a model that is about to be loaded towards the budget, returns the models to evict \
+            to make room for it (with the lock held).
+        """
+        self._reserved[name] = os.path.getsize(self.path_of(name))
+        return self._evict()
+
+    def available(self) -> list[str]:
+        """
+        Names of the models in the directory (loaded or not).
+        """
+        return sorted(path.stem for path in self.directory.glob("*.vst") if MODEL_NAME.fullmatch(path.stem))
+
+    def path_of(self, name: str) -> Path:
+        """
+        The file of a model, raises UnknownModelException if there is none.
+        """
+        path = self.directory / f"{name}.vst"
+        if not MODEL_NAME.fullmatch(name) or not path.is_file():
+            raise UnknownModelException(f"Unknown model {name!r}.")
+        return path
+
+    def _load(self, name: str) -> PooledModel:
+        path = self.path_of(name)
+        model = self.load(str(path))
+
+        from .serve import predict_with
+
+        if self.warmup is not None:
+            self.warmup.run(functools.partial(predict_with, model))
+
+        batcher = MicroBatcher(
+            lambda inputs: predict_with(model, inputs),
+            max_batch=self.max_batch,
+            max_wait=self.max_wait_ms / 1000,
+            metrics=self.metrics,
+            max_queue=self.max_queue,
+        )
+        cache = None
+        if self.cache is not None:
+            from .cache import PredictionCache
+
+            cache = PredictionCache(self.cache.max_entries, self.cache.max_bytes, self.cache.ttl)
+
+        return PooledModel(self, name, model, model_memory(model, path), batcher, cache)
+
+    def acquire(self, name: str) -> PooledModel:
+        """
+        Get a model, loading it if needed (only once, also when other threads need it at the same time).
+
+        The model is not evicted until it's released again.
+        """
+        while True:
+            with self._lock:
+                if (model := self._models.get(name)) is not None:
+                    self._models.move_to_end(name)
+                    model.users += 1
+                    return model
+
+                loading = self._loading.get(name)
+                if loading is None:
+                    loading = self._loading[name] = Future()
+                    break
+
+            # another thread is loading it, wait for that (and try again, in case it was evicted since):
+            loading.result()
+
+        try:
+            with self._lock:
+                evicted = self._reserve(name)
+            self._close(evicted)
+            model = self._load(name)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[name]
+                self._reserved.pop(name, None)
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[name]
+            del self._reserved[name]
+            self._models[name] = model
+            model.users += 1
+            self.loads += 1
+            evicted = self._evict()
+        loading.set_result(model)
+
+        if self.memory_budget is not None and model.size > self.memory_budget:
+            warnings.warn(
+                f"Model {name!r} ({model.size} bytes) exceeds the memory budget of {self.memory_budget} bytes, "
+                "it's kept loaded until another model is used."
+            )
+
+        self._close(evicted)
+        return model
+
+    def release(self, model: PooledModel) -> None:
+        """
+        A request is done with a model, which can be evicted again (if the pool is over budget, it's evicted now).
+        """
+        with self._lock:
+            model.users -= 1
+            evicted = self._evict()
+
+        self._close(evicted)
+
+    @contextlib.contextmanager
+    def using(self, name: str) -> typing.Generator[PooledModel, None, None]:
+        """
+        Acquire a model for the duration of this block.
+        """
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def _evict(self) -> list[PooledModel]:
+        """
+        Remove the least recently used idle models until the pool fits within the budget (with the lock held).
+
+        Models that are loading count with their estimated size. The most recently used model is always kept (unless \
+            another model is loading, which will be the most recently used one), also when it alone exceeds the \
+            budget (otherwise it would be reloaded on every request).
+        """
+        evicted: list[PooledModel] = []
+        if self.memory_budget is None:
+            return evicted
+
+        total = self.bytes + sum(self._reserved.values())
+        candidates = list(self._models.items())
+        for name, model in candidates if self._reserved else candidates[:-1]:
+            if total <= self.memory_budget:
+                break
+            if model.users:
+                continue
+
+            del self._models[name]
+            total -= model.size
+            evicted.append(model)
+            self.evictions += 1
+
+        return evicted
+
+    @staticmethod
+    def _close(models: list[PooledModel]) -> None:
+        for model in models:
+            model.batcher.close()
+
+    def close(self) -> None:
+        """
+        Unload all models.
+        """
+        with self._lock:
+            models = list(self._models.values())
+            self._models.clear()
+
+        self._close(models)
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        The available and loaded models (least recently used first) and memory usage, e.g. for JSON.
+        """
+        with self._lock:
+            loaded = {name: {"bytes": model.size, "users": model.users} for name, model in self._models.items()}
+
+        return {
+            "available": self.available(),
+            "loaded": loaded,
+            "bytes": sum(model["bytes"] for model in loaded.values()),
+            "memory_budget": self.memory_budget,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,339 @@
+"""
+Pre-fork serving: load a model once, share its weights and fork worker processes behind one listening socket.
+
+A single Python process can't use more than a few cores for serving because of the GIL, but loading the model in N
+processes would need N times the memory. Instead, the model is loaded once in the parent process:
+
+- models saved with payload_format='mmap' are memory mapped, so their pages are shared via the page cache;
+- otherwise every parameter and buffer is moved to shared memory (`Tensor.share_memory_`).
+
+Then the listening socket is opened and N workers are forked. They inherit both, so the weights exist in memory only
+once and the kernel spreads the incoming connections over the workers. Every worker is pinned to its own slice of the
+cores (where supported) and uses that many torch threads, so workers don't compete for the same cores.
+
+Usage:
+    vst serve model.vst --workers 8
+
+Notes:
+    - forking requires a POSIX system and a model on the cpu (CUDA can't be used after a fork).
+    - don't run the model in the parent before forking: torch's thread pools don't survive a fork.
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import os
+import signal
+import socket
+import sys
+import time
+import typing
+from collections import deque
+
+from .batching import DEFAULT_MAX_WAIT
+from .exceptions import WorkersCrashingException
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import torch
+
+    from .cache import PredictionCache
+    from .pool import ModelPool
+    from .reload import ModelReloader
+    from .timings import TimingReport
+    from .types import AllSimpletransformersModels
+    from .warmup import Warmup
+
+RESTART_DELAY = 0.1  # seconds before the first restart of a crashed worker, doubled for every recent crash
+MAX_RESTART_DELAY = 10.0
+MAX_CRASHES = 5  # give up when more workers crash within CRASH_WINDOW seconds
+CRASH_WINDOW = 60.0
+
+
+def model_tensors(model: typing.Any) -> typing.Iterator[torch.Tensor]:
+    """
+    Find the tensors of a model: parameters and buffers of its torch modules and tensors stored as attributes.
+    """
+    import torch
+
+    seen: set[int] = set()
+    for value in getattr(model, "__dict__", {}).values():
+        if isinstance(value, torch.nn.Module):
+            candidates: typing.Iterable[typing.Any] = [*value.parameters(), *value.buffers()]
+        elif isinstance(value, dict):
+            candidates = value.values()
+        else:
+            candidates = [value]
+
+        for tensor in candidates:
+            if isinstance(tensor, torch.Tensor) and id(tensor) not in seen:
+                seen.add(id(tensor))
+                yield tensor
+
+
+def share_model_memory(model: typing.Any) -> int:
+    """
+    Move every tensor of the model to shared memory, so forked processes use the same memory.
+
+    Returns the amount of bytes that was moved.
+    """
+    moved = 0
+    for tensor in model_tensors(model):
+        if tensor.device.type != "cpu":
+            raise ValueError(f"Only models on the cpu can be shared between processes, not {tensor.device}.")
+
+        if not tensor.is_shared():  # type: ignore
+            tensor.share_memory_()  # type: ignore
+            moved += tensor.untyped_storage().nbytes()
+
+    return moved
+
+
+def cpu_slices(workers: int, cpus: typing.Sequence[int] | None = None) -> list[list[int]]:
+    """
+    Divide the available cores over the workers as evenly as possible (contiguous, so neighbouring cores stay together).
+
+    With more workers than cores, cores are shared.
+    """
+    if workers < 1:
+        raise ValueError(f"At least one worker is required, got {workers}.")
+
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+
+    if workers >= len(cpus):
+        return [[cpus[idx % len(cpus)]] for idx in range(workers)]
+
+    size, rest = divmod(len(cpus), workers)
+    slices, start = [], 0
+    for idx in range(workers):
+        end = start + size + (idx < rest)
+        slices.append(list(cpus[start:end]))
+        start = end
+    return slices
+
+
+def load_shared(
+    filename: str | AllSimpletransformersModels, timings: TimingReport | None = None
+) -> tuple[AllSimpletransformersModels, str]:
+    """
+    Load a model on the cpu so it can be shared with forked workers.
+
+    Files with the 'mmap' payload format are memory mapped, other models are moved into shared memory.
+    """
+    from .core import read_metadata, simple_load
+    from .types import UNCOMPRESSED_PAYLOAD_FORMATS
+
+    use_mmap = False
+    if isinstance(filename, str):
+        with open(filename, "rb") as f:
+            use_mmap = getattr(read_metadata(f).meta_header, "payload_format", None) in UNCOMPRESSED_PAYLOAD_FORMATS
+
+    model, name = simple_load(filename, timings=timings, device="cpu", mmap=use_mmap)
+    if not use_mmap:
+        share_model_memory(model)
+
+    return typing.cast("AllSimpletransformersModels", model), name
+
+
+class PreforkServer:
+    """
+    Fork N workers that serve the same model on one shared listening socket.
+
+    Usage:
+        PreforkServer(host, port, workers=8).serve_forever(model)
+
+    Every worker runs a MachineLearningModelServer (or AsyncModelServer with use_async) on the inherited socket. \
+        Workers that crash are restarted after a delay that grows with the amount of recent crashes; when more than \
+        max_crashes crash within crash_window seconds, the server gives up (WorkersCrashingException). \
+        Every worker has its own cache and metrics. \
+        With warmup, every worker warms up (after the fork, see the notes above) before it accepts predictions. \
+        With a pool (ModelPool), every worker loads the models it needs itself, within its own memory budget. \
+        With a reloader (ModelReloader), every worker loads new versions of the model itself (shared via the page \
+        cache for the 'mmap' format, otherwise every worker has its own copy). SIGHUP to the parent and \
+        POST /admin/reload to any worker reload all workers. \
+        With max_queue, every worker bounds its own inference queue.
+    """
+
+    def __init__(
+        self,
+        server_address: str,
+        port: int,
+        workers: int,
+        max_batch: int = 1,
+        max_wait_ms: float = DEFAULT_MAX_WAIT * 1000,
+        use_async: bool = False,
+        cache: PredictionCache | None = None,
+        warmup: Warmup | None = None,
+        pool: ModelPool | None = None,
+        reloader: ModelReloader | None = None,
+        max_queue: int | None = None,
+        max_crashes: int = MAX_CRASHES,
+        crash_window: float = CRASH_WINDOW,
+        restart_delay: float = RESTART_DELAY,
+    ) -> None:
+        """
+        An address (e.g. localhost), port (e.g. 8000) and the amount of worker processes are required.
+        """
+        if not hasattr(os, "fork"):  # pragma: no cover
+            raise OSError("Pre-fork workers require a POSIX system (os.fork).")
+
+        self.server_address = server_address
+        self.port = port
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.use_async = use_async
+        self.cache = cache  # every worker gets its own copy
+        self.warmup = warmup
+        self.pool = pool  # every worker gets its own copy
+        self.reloader = reloader  # every worker gets its own copy
+        self.max_queue = max_queue
+        self.max_crashes = max_crashes
+        self.crash_window = crash_window
+        self.restart_delay = restart_delay
+        self.crashes: deque[float] = deque()  # times of the recent crashes
+        self.cpu_slices = cpu_slices(workers)
+        self.sock: socket.socket | None = None
+        self.pids: dict[int, int] = {}  # pid -> worker index
+        self.stopping = False
+
+    def start(self, model: AllSimpletransformersModels | None) -> None:
+        """
+        Open the listening socket and fork the workers, then return (in the parent process).
+
+        The bound address is available as `self.sock.getsockname()` (useful with port 0).
+        """
+        if str(getattr(model, "device", "cpu")).startswith("cuda"):
+            raise ValueError("Pre-fork workers require a model on the cpu, CUDA can't be used after a fork.")
+
+        self.sock = socket.create_server((self.server_address, self.port), backlog=128 * self.workers)
+        for idx in range(self.workers):
+            self._fork(model, idx)
+
+    def _fork(self, model: AllSimpletransformersModels | None, idx: int) -> None:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if pid := os.fork():
+            self.pids[pid] = idx
+            return
+
+        # in the worker:
+        exit_code = 1
+        try:
+            self._run_worker(model, self.cpu_slices[idx])
+            exit_code = 0
+        except KeyboardInterrupt:
+            exit_code = 0
+        finally:
+            # never return into the code of the parent process:
+            os._exit(exit_code)
+
+    def _run_worker(self, model: AllSimpletransformersModels | None, cpus: list[int]) -> None:  # pragma: no cover
+        """
+        Pin this process to its cores and serve until stopped (runs in the forked process, so coverage misses it).
+        """
+        import torch
+
+        from .serve import AsyncModelServer, MachineLearningModelServer
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if self.reloader is not None and hasattr(signal, "SIGHUP"):
+            reloader = self.reloader
+            signal.signal(signal.SIGHUP, lambda *_: reloader.reload())
+            # a reload that is requested from one worker is done by all of them:
+            reloader.forward = functools.partial(os.kill, os.getppid(), signal.SIGHUP)
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(len(cpus))
+
+        options: dict[str, typing.Any] = dict(
+            max_batch=self.max_batch,
+            max_wait_ms=self.max_wait_ms,
+            sock=self.sock,
+            cache=self.cache,
+            warmup=self.warmup,
+            pool=self.pool,
+            reloader=self.reloader,
+            max_queue=self.max_queue,
+        )
+        if self.use_async:
+            AsyncModelServer(self.server_address, self.port, **options).run(model)
+        else:
+            MachineLearningModelServer(self.server_address, self.port, **options).serve_forever(model)
+
+    def wait(self, model: AllSimpletransformersModels | None) -> None:
+        """
+        Wait until all workers have stopped, restarting workers that crash (exit with a non-zero status).
+
+        Raises WorkersCrashingException when more than max_crashes workers crash within crash_window seconds.
+        """
+        while self.pids:
+            pid, status = os.wait()
+            idx = self.pids.pop(pid, None)
+            if idx is not None and status and not self.stopping:
+                delay = self._crashed()
+                print(
+                    f"Worker {idx} (pid {pid}) exited with status {status}, restarting in {delay:.1f}s.",
+                    file=sys.stderr,
+                )
+                time.sleep(delay)
+                self._fork(model, idx)
+
+    def _crashed(self) -> float:
+        """
+        Count a crash and get the delay before restarting the worker, or raise if workers crash too often.
+        """
+        now = time.monotonic()
+        self.crashes.append(now)
+        while self.crashes[0] < now - self.crash_window:
+            self.crashes.popleft()
+
+        if len(self.crashes) > self.max_crashes:
+            raise WorkersCrashingException(
+                f"{len(self.crashes)} workers crashed within {self.crash_window:.0f}s, not restarting them anymore."
+            )
+
+        return float(min(self.restart_delay * 2 ** (len(self.crashes) - 1), MAX_RESTART_DELAY))
+
+    def reload(self) -> None:
+        """
+        Let every worker load the current version of the model file (requires a reloader).
+        """
+        for pid in list(self.pids):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGHUP)
+
+    def stop(self) -> None:
+        """
+        Terminate all workers and wait for them, then close the listening socket.
+        """
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:  # pragma: no cover
+                self.pids.pop(pid)
+
+        for pid in list(self.pids):
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+            self.pids.pop(pid)
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def serve_forever(self, model: AllSimpletransformersModels | None) -> None:  # pragma: no cover
+        """
+        Serve the model with all workers, until interrupted.
+        """
+        if self.reloader is not None and hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *_: self.reload())
+
+        self.start(model)
+        try:
+            self.wait(model)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
@@ -0,0 +1,234 @@
+"""
+Hot reload: serve a new version of the model file without restarting the server (and without dropping requests).
+
+A reload is started by a change of the model file (it's checked every `watch_interval` seconds), by SIGHUP (with
+`vst serve --reload`) or by POST /admin/reload. The new version is loaded (and warmed up) in a background thread while
+the old one keeps serving. Then the inference worker swaps to the new model between two batches, the prediction cache
+is cleared and, once nothing predicts with it anymore (the running batch and the startup warmup are done), the memory
+of the old model is released. If loading fails, the old version keeps serving.
+
+Usage:
+    vst serve model.vst --reload
+    cp new-version.vst model.vst.tmp && mv model.vst.tmp model.vst
+    # or: kill -HUP <pid>, or: curl -X POST http://localhost:8000/admin/reload
+
+Note: write new versions to a temporary file and rename it, so a half-written file is never loaded. A file that is
+written in place is only loaded after it has stopped changing for one interval.
+"""
+from __future__ import annotations
+
+import functools
+import gc
+import os
+import sys
+import threading
+import time
+import traceback
+import typing
+
+from .prefork import model_tensors
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .batching import MicroBatcher
+    from .warmup import Readiness, Warmup
+
+RELOAD_PATH = "/admin/reload"
+WATCH_INTERVAL = 1.0  # seconds
+
+FileVersion = tuple[int, int, int]  # inode, size, modification time
+
+
+def file_version(filename: str) -> FileVersion | None:
+    """
+    Identify the current version of a file, or None if it does not exist (e.g. while it's being replaced).
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def release_model(model: typing.Any) -> None:
+    """
+    Free the memory of a model that is not used anymore.
+
+    Its tensors are replaced with empty ones, so the memory is released even if something still refers to the model. \
+        Only call this when nothing predicts with the model anymore.
+    """
+    import torch
+
+    for tensor in model_tensors(model):
+        tensor.data = torch.empty(0, dtype=tensor.dtype, device=tensor.device)
+
+    gc.collect()
+    if torch.cuda.is_available():  # pragma: no cover
+        torch.cuda.empty_cache()
+
+
+class ModelReloader:
+    """
+    Load new versions of a model file in the background and swap them into the inference worker of a server.
+
+    Usage:
+        server = MachineLearningModelServer(host, port, reloader=ModelReloader("model.vst"))
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        load: typing.Callable[[str], typing.Any] | None = None,
+        watch_interval: float | None = WATCH_INTERVAL,
+    ) -> None:
+        """
+        `load` loads a model from the filename (default: simple_load). Without a watch_interval, only explicit \
+            reloads (`request`) are done.
+        """
+        self.filename = filename
+        self.load = load or self._simple_load
+        self.watch_interval = watch_interval
+        self.version = file_version(filename)
+        self.model: typing.Any = None
+        self.batcher: MicroBatcher | None = None
+        self.warmup: Warmup | None = None
+        self.readiness: Readiness | None = None
+        self.on_swap: typing.Callable[[], None] | None = None
+        # called instead of reloading this process when a reload is requested (used by pre-forked workers):
+        self.forward: typing.Callable[[], None] | None = None
+        self.reloads = 0
+        self.error: str | None = None
+        self._loading: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+
+    @staticmethod
+    def _simple_load(filename: str) -> typing.Any:
+        from .core import simple_load
+
+        return simple_load(filename)[0]
+
+    def start(
+        self,
+        model: typing.Any,
+        batcher: MicroBatcher,
+        warmup: Warmup | None = None,
+        on_swap: typing.Callable[[], None] | None = None,
+        readiness: Readiness | None = None,
+    ) -> None:
+        """
+        Take over the model that the batcher is serving and start watching the file.
+
+        New versions are warmed up (with `warmup`) before the swap and `on_swap` is called right after it \
+            (e.g. to clear a cache). The memory of a previous version is only released after the startup warmup of \
+            `readiness` (which predicts with the first model directly) is done.
+        """
+        self.model = model
+        self.batcher = batcher
+        self.warmup = warmup
+        self.on_swap = on_swap
+        self.readiness = readiness
+        self._stop.clear()
+        if self.watch_interval:
+            self._watcher = threading.Thread(target=self._watch, name="vst-reload-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        """
+        Stop watching the file and wait for a reload that is in progress.
+        """
+        self._stop.set()
+        for thread in (self._watcher, self._loading):
+            if thread is not None:
+                thread.join()
+        self._watcher = None
+        self.batcher = None
+
+    @property
+    def reloading(self) -> bool:
+        """
+        Whether a new version is being loaded right now.
+        """
+        return self._loading is not None and self._loading.is_alive()
+
+    def request(self) -> None:
+        """
+        Ask for a reload, e.g. from a signal handler or the admin endpoint.
+        """
+        if self.forward is not None:
+            self.forward()
+        else:
+            self.reload()
+
+    def reload(self) -> bool:
+        """
+        Load the current version of the file in a background thread and swap it in when it's ready.
+
+        Returns False if a reload is already in progress (which then loads the file as it is by now).
+        """
+        with self._lock:
+            if self.reloading or self.batcher is None:
+                return False
+
+            self._loading = threading.Thread(target=self._reload, name="vst-reload", daemon=True)
+            self._loading.start()
+            return True
+
+    def _reload(self) -> None:
+        from .serve import predict_with
+
+        version = file_version(self.filename)
+        started = time.perf_counter()
+        try:
+            model = self.load(self.filename)
+            predict = functools.partial(predict_with, model)
+            if self.warmup is not None:
+                self.warmup.run(predict)
+        except Exception as e:
+            # keep serving the old version:
+            traceback.print_exc()
+            self.error = f"{type(e).__name__}: {e}"
+            self.version = version  # only try again when the file changes again
+            return
+
+        if self.batcher is None:  # pragma: no cover
+            # stopped while loading
+            return
+
+        # waits for the batch that is running with the previous model:
+        self.batcher.swap(predict)
+        if self.on_swap is not None:
+            self.on_swap()
+
+        previous, self.model = self.model, model
+        self.version = version
+        self.reloads += 1
+        self.error = None
+        print(f"Reloaded {self.filename} in {time.perf_counter() - started:.1f}s.", file=sys.stderr)
+        if previous is None:
+            return
+
+        if self.readiness is not None:
+            # the startup warmup predicts with the first model directly, not via the batcher:
+            self.readiness.join()
+        release_model(previous)
+
+    def _watch(self) -> None:
+        seen = self.version
+        while not self._stop.wait(self.watch_interval):
+            current = file_version(self.filename)
+            # only reload a new version once it has stopped changing (and exists):
+            if current is not None and current == seen and current != self.version:
+                self.reload()
+            seen = current
+
+    def status(self) -> dict[str, typing.Any]:
+        """
+        State of the reloader, e.g. for JSON.
+        """
+        return {
+            "filename": self.filename,
+            "reloads": self.reloads,
+            "reloading": self.reloading,
+            "error": self.error,
+        }
@@ -1,16 +1,54 @@
 """
-Simple HTTP web server.
+Simple HTTP web servers: a (threaded) http.server based one and an asyncio based one.
 """
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import http
 import http.server
 import json
+import math
+import socket
+import socketserver
+import time
 import typing
 from urllib.parse import parse_qs
 
 import numpy as np
 
+from .batching import DEFAULT_MAX_WAIT, MicroBatcher
+from .cache import PredictionCache
+from .exceptions import DeadlineExceededException, QueueFullException, UnknownModelException
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .metrics import ServerMetrics
+from .ndjson import (
+    LAST_CHUNK,
+    NDJSON_CONTENT_TYPE,
+    STREAM_PATH,
+    LineDecoder,
+    LineTooLong,
+    aiter_body,
+    batches,
+    chunk,
+    encode_lines,
+    error_line,
+    is_json_lines,
+    iter_body,
+    valid_inputs,
+)
+from .pool import PREDICT_PATH, ModelPool, PooledModel, split_model_path
+from .reload import RELOAD_PATH, ModelReloader
+from .warmup import Readiness, Warmup
+
+KEEP_ALIVE_TIMEOUT = 30  # seconds
+DEADLINE_HEADER = "X-Deadline-Ms"  # how many milliseconds the client still waits for the answer
+
+# predict(inputs, deadline, bounded), see MicroBatcher.submit:
+ModelPredict = typing.Callable[[list[str], float | None, bool], list[str | int]]
+
 if typing.TYPE_CHECKING:  # pragma: no cover
     import numpy.typing as npt
 
@@ -33,97 +71,570 @@ def _handle_predictions(
     return typing.cast(list[str | int], predictions)
 
 
+def predict_with(model: "AllSimpletransformersModels", inputs: list[str]) -> list[str | int]:
+    """
+    Get one output per input from the model.
+    """
+    return _handle_predictions(model.predict(inputs))
+
+
+class Response(typing.NamedTuple):
+    """
+    A response that is independent of the server that sends it.
+    """
+
+    data: typing.Any
+    status_code: int = 200
+    content_type: str = "application/json"
+    headers: tuple[tuple[str, str], ...] = ()  # extra headers, e.g. Retry-After
+
+    def encode(self) -> tuple[bytes, str]:
+        """
+        Get the body and the actual content type: strings are sent as-is, other data as json.
+        """
+        data, content_type = self.data, self.content_type
+        if not isinstance(data, str):
+            if content_type == "application/json":
+                data = json.dumps(data)
+            else:  # pragma: no cover
+                # todo: support more content types?
+                content_type = "text/plain"
+                data = str(data)
+
+        return data.encode(), content_type
+
+
+MISSING_QUERY = Response("Please include a ?query=... in your GET-request.", 400, "text/plain")
+MISSING_POST_DATA = Response("Missing POST data!", 400)
+INVALID_JSON = Response("Invalid JSON data", 400)
+NOT_READY = Response("The model is warming up, try again later.", 503, "text/plain")
+NO_DEFAULT_MODEL = Response("No model is served here, use /models/<name>/predict.", 404, "text/plain")
+
+
+def status_response(
+    path: str,
+    cache: PredictionCache | None = None,
+    metrics: ServerMetrics | None = None,
+    readiness: Readiness | None = None,
+    pool: ModelPool | None = None,
+) -> Response | None:
+    """
+    Response for GET requests to a status endpoint (instead of a prediction), or None for other paths.
+
+    /healthz: whether the server is alive, always 200.
+    /readyz: whether the model can be used (warmup is done), 503 until then.
+    /cache: the counters of the prediction cache.
+    /metrics: the metrics of the server, in the Prometheus text format.
+    /models: the available and loaded models of the pool.
+    """
+    match path.split("?", 1)[0]:
+        case "/models":
+            if pool is None:
+                return Response("Multi-model serving is disabled.", 404, "text/plain")
+            return Response(pool.stats())
+        case "/healthz":
+            return Response({"status": "ok"})
+        case "/readyz":
+            if readiness is None:
+                return Response({"status": "ready"})
+            return Response(readiness.status(), 200 if readiness.ready else 503)
+        case "/cache":
+            if cache is None:
+                return Response("The prediction cache is disabled.", 404, "text/plain")
+            return Response(cache.stats())
+        case "/metrics":
+            if metrics is None:
+                return Response("Metrics are disabled.", 404, "text/plain")
+            return Response(metrics.render(), 200, METRICS_CONTENT_TYPE)
+
+    return None
+
+
+def request_deadline(value: str | None, received: float) -> float | None:
+    """
+    The deadline of a request (in `time.monotonic()` seconds) from the value of its X-Deadline-Ms header, \
+        counted from when the request was received. None without a header.
+
+    Raises ValueError for values that are not a number of milliseconds.
+    """
+    if value is None:
+        return None
+
+    milliseconds = float(value)
+    if not math.isfinite(milliseconds):
+        raise ValueError(f"Invalid deadline {value!r}.")
+    return received + milliseconds / 1000
+
+
+def invalid_deadline(value: str | None) -> Response | None:
+    """
+    The response for a request with an invalid X-Deadline-Ms header, or None if it's valid (or missing).
+    """
+    try:
+        request_deadline(value, 0.0)
+    except ValueError:
+        return Response(f"The {DEADLINE_HEADER} header should be a number of milliseconds.", 400, "text/plain")
+    return None
+
+
+def shed_response(error: Exception) -> Response | None:
+    """
+    The response for a request that was shed instead of predicted, or None for other errors.
+
+    A full inference queue answers 503 with a Retry-After header, an expired deadline answers 504.
+    """
+    if isinstance(error, QueueFullException):
+        retry_after = str(math.ceil(error.retry_after))
+        return Response(str(error), 503, "text/plain", (("Retry-After", retry_after),))
+    if isinstance(error, DeadlineExceededException):
+        return Response(str(error), 504, "text/plain")
+    return None
+
+
+def unsupported_transfer_encoding(value: str | None) -> Response | None:
+    """
+    The response for a body with a transfer encoding other than chunked (its length is unknown), or None.
+    """
+    if value and "chunked" not in value.lower():
+        return Response(f"Unsupported Transfer-Encoding {value!r}", 501, "text/plain")
+    return None
+
+
+def not_ready(readiness: Readiness | None) -> Response | None:
+    """
+    The response for prediction requests while the model is not ready yet, or None when it is.
+    """
+    return NOT_READY if readiness is not None and not readiness.ready else None
+
+
+def admin_response(method: str, path: str, reloader: ModelReloader | None) -> Response | None:
+    """
+    Response for requests to the admin endpoint, or None for other paths.
+
+    GET /admin/reload: the state of the reloader.
+    POST /admin/reload: load the current version of the model file in the background and swap it in when it's ready.
+    """
+    if path.split("?", 1)[0] != RELOAD_PATH:
+        return None
+
+    if reloader is None:
+        return Response("Reloading is disabled.", 404, "text/plain")
+
+    if method == "POST":
+        reloader.request()
+        return Response(reloader.status(), 202)
+    return Response(reloader.status())
+
+
+def unroutable(name: str | None, path: str, has_default_model: bool, pool: ModelPool | None) -> Response | None:
+    """
+    The response for a prediction request that can't go to a model, or None if it can.
+
+    Without a name, the request is for the default model. With a name, it must be for /models/<name>/predict (or \
+        /predict/stream) and there must be a pool (whether the model exists is known when it's acquired).
+    """
+    if name is None:
+        return None if has_default_model else NO_DEFAULT_MODEL
+
+    if pool is None or path.split("?", 1)[0] not in (PREDICT_PATH, STREAM_PATH):
+        return Response("Not found.", 404, "text/plain")
+    return None
+
+
+def acquire_model(pool: ModelPool | None, name: str) -> PooledModel | Response:
+    """
+    Get a model of the pool (loading it if needed), or the error response if that fails.
+
+    The model must be released after use.
+    """
+    if pool is None:  # pragma: no cover
+        return Response("Multi-model serving is disabled.", 404, "text/plain")
+
+    try:
+        return pool.acquire(name)
+    except UnknownModelException as e:
+        return Response(str(e), 404, "text/plain")
+    except Exception as e:
+        return Response(f"{type(e).__name__}: {e}", 500, "text/plain")
+
+
+def model_batcher(
+    model: "AllSimpletransformersModels | None",
+    max_batch: int,
+    max_wait_ms: float,
+    metrics: ServerMetrics | None,
+    max_queue: int | None = None,
+) -> typing.ContextManager[MicroBatcher | None]:
+    """
+    The inference worker of the default model of a server, if there is one.
+    """
+    if model is None:
+        return contextlib.nullcontext()
+
+    predict = functools.partial(predict_with, model)
+    return MicroBatcher(
+        predict, max_batch=max_batch, max_wait=max_wait_ms / 1000, metrics=metrics, max_queue=max_queue
+    )
+
+
+def start_reloader(
+    reloader: ModelReloader | None,
+    model: "AllSimpletransformersModels | None",
+    batcher: MicroBatcher | None,
+    warmup: Warmup | None,
+    cache: PredictionCache | None,
+    readiness: Readiness | None = None,
+) -> None:
+    """
+    Let the reloader take over the default model of a server, new versions are warmed up and clear the cache.
+    """
+    if reloader is not None and batcher is not None:
+        reloader.start(model, batcher, warmup, cache.clear if cache is not None else None, readiness)
+
+
+def measure(metrics: ServerMetrics | None, stage: str) -> typing.ContextManager[None]:
+    """
+    Measure a stage of a request if there are metrics, otherwise do nothing.
+    """
+    return metrics.stage(stage) if metrics else contextlib.nullcontext()
+
+
+def query_inputs(path: str) -> list[str] | Response:
+    """
+    Get the inputs from ?query=... of a GET request, or the error response if there are none.
+    """
+    if "?" not in path:
+        return MISSING_QUERY
+
+    query_params = parse_qs(path.split("?", 1)[1])
+    return query_params.get("query") or MISSING_QUERY
+
+
+def body_inputs(content_type: str | None, post_data: bytes) -> list[str] | Response:
+    """
+    Get the inputs from the body of a POST request: a JSON value or list, or otherwise the raw text as single input.
+    """
+    if not post_data:
+        return MISSING_POST_DATA
+
+    try:
+        text = post_data.decode("utf-8")
+    except UnicodeDecodeError:
+        return Response("POST data should be UTF-8", 400)
+
+    if content_type != "application/json":
+        return [text]
+
+    try:
+        json_data = json.loads(text)
+    except json.JSONDecodeError:
+        return INVALID_JSON
+
+    if not json_data:
+        return MISSING_POST_DATA
+
+    return json_data if isinstance(json_data, list) else [json_data]
+
+
 class MachineLearningModelHandler(http.server.SimpleHTTPRequestHandler):
     """
     Handles GET and POST.
+
+    Speaks HTTP/1.1, so clients can keep their connection open for multiple requests. \
+        Idle connections are closed after `timeout` seconds. \
+        On a server that handles one connection at a time, every connection is closed after its response, \
+        since keeping it open would block all other clients.
     """
 
-    model: AllSimpletransformersModels
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    model: AllSimpletransformersModels | None
+    batcher: MicroBatcher | None
+    cache: PredictionCache | None
+    metrics: ServerMetrics | None
+    readiness: Readiness | None
+    pool: ModelPool | None
+    reloader: ModelReloader | None
 
-    def __init__(self, model: AllSimpletransformersModels, *a: typing.Any, **kw: typing.Any) -> None:
+    def __init__(
+        self,
+        model: AllSimpletransformersModels | None,
+        *a: typing.Any,
+        batcher: MicroBatcher | None = None,
+        cache: PredictionCache | None = None,
+        metrics: ServerMetrics | None = None,
+        readiness: Readiness | None = None,
+        pool: ModelPool | None = None,
+        reloader: ModelReloader | None = None,
+        **kw: typing.Any,
+    ) -> None:
         """
         Store the model when the handler is created for user on request.
+
+        With a batcher, predictions are done by its worker thread (which merges concurrent requests into one \
+            `model.predict` call) instead of on the thread of this connection.
+        With a cache, cached inputs are answered without the model and only the other inputs are predicted.
+        With metrics, requests are counted and timed (and served at GET /metrics).
+        With readiness, predictions are refused (503) until it is ready.
+        With a pool, /models/<name>/predict is answered by the models of the pool. The model may then be None, when \
+            there is no default model.
+        With a reloader, /admin/reload reloads the model file.
         """
         self.model = model
+        self.batcher = batcher
+        self.cache = cache
+        self.metrics = metrics
+        self.readiness = readiness
+        self.pool = pool
+        self.reloader = reloader
         super().__init__(*a, **kw)
 
-    def _predict(self, inputs: list[str]) -> list[str | int]:
+    def _predict(self, inputs: list[str], deadline: float | None = None, bounded: bool = True) -> list[str | int]:
         """
         Shortcut to get the outputs from the model based on the inputs.
+
+        Raises QueueFullException or DeadlineExceededException when the request is shed (see MicroBatcher.submit).
         """
-        predictions = self.model.predict(inputs)
+        if self.cache is not None:
+            return self.cache.predict(
+                inputs, functools.partial(self._predict_uncached, deadline=deadline, bounded=bounded)
+            )
+
+        return self._predict_uncached(inputs, deadline, bounded)
 
-        return _handle_predictions(predictions)
+    def _predict_uncached(
+        self, inputs: list[str], deadline: float | None = None, bounded: bool = True
+    ) -> list[str | int]:
+        if self.batcher:
+            return self.batcher.predict(inputs, deadline, bounded)
+
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceededException("The deadline passed before the request was predicted.")
+
+        started = time.perf_counter()
+        predictions = predict_with(self.model, inputs)
+        if self.metrics:
+            self.metrics.record_batch(len(inputs), time.perf_counter() - started)
+        return predictions
+
+    def send_response(self, code: int, message: str | None = None) -> None:
+        """
+        Count every response by status.
+        """
+        if self.metrics:
+            self.metrics.requests.inc(label=str(code))
+        super().send_response(code, message)
 
     def respond(
-        self, response_data: typing.Any, content_type: str = "application/json", status_code: int = 200
+        self,
+        response_data: typing.Any,
+        content_type: str = "application/json",
+        status_code: int = 200,
+        headers: typing.Iterable[tuple[str, str]] = (),
     ) -> None:
         """
         Send a HTTP response.
 
         Sends json back in most cases, because that's just the easiest.
         """
-        if not isinstance(response_data, str):
-            if content_type == "application/json":
-                response_data = json.dumps(response_data)
-            else:  # pragma: no cover
-                # todo: support more content types?
-                content_type = "text/plain"
-                response_data = str(response_data)
-
+        body, content_type = Response(response_data, status_code, content_type).encode()
         self.send_response(status_code)
         self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.close_connection or not isinstance(self.server, socketserver.ThreadingMixIn):
+            self.send_header("Connection", "close")
         self.end_headers()
-        self.wfile.write(response_data.encode())
+        self.wfile.write(body)
 
-    def do_GET(self) -> None:
+    def _stream(self, predict: ModelPredict) -> None:
         """
-        Parse ?query in GET requests.
+        Predict the lines of the body in batches while it arrives, sending every batch back as NDJSON right away.
+
+        The response uses chunked transfer encoding (HTTP/1.0 clients get the lines until the connection closes). \
+            A stream that has started is not shed: its batches are always queued (one at a time). \
+            The status is sent with the first results, so a body that is invalid before that gets an error response \
+            (413 for a line that is too long, 400 for invalid framing). Later, the stream ends with an error line.
         """
-        if "?" not in self.path:
-            return self.respond(
-                "Please include a ?query=... in your GET-request.", content_type="text/plain", status_code=400
-            )
+        if (response := unsupported_transfer_encoding(self.headers.get("Transfer-Encoding"))) is not None:
+            self.close_connection = True
+            return self._respond_with(response)
 
-        query_params = parse_qs(self.path.split("?")[1])
+        decoder = LineDecoder(is_json_lines(self.headers.get("Content-Type")))
+        chunked = self.request_version != "HTTP/1.0"
+        started = False
 
-        if "query" not in query_params:
-            return self.respond(
-                "Please include a ?query=... in your GET-request.", content_type="text/plain", status_code=400
-            )
+        def write(lines: bytes) -> None:
+            nonlocal started
+            if not started:
+                started = True
+                self.send_response(200)
+                self.send_header("Content-Type", NDJSON_CONTENT_TYPE)
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                if not chunked or not isinstance(self.server, socketserver.ThreadingMixIn):
+                    self.send_header("Connection", "close")
+                self.end_headers()
+            if lines:
+                self.wfile.write(chunk(lines) if chunked else lines)
+
+        def send(items: list[typing.Any]) -> None:
+            for batch in batches(items):
+                inputs = valid_inputs(batch)
+                write(encode_lines(batch, predict(inputs, None, False) if inputs else []))
+
+        try:
+            for data in iter_body(self.rfile, self.headers):
+                send(decoder.feed(data))
+            send(decoder.finish())
+        except ValueError as e:
+            # the rest of the body is not read, so the connection can't be reused:
+            self.close_connection = True
+            if not started:
+                return self.respond(str(e), "text/plain", 413 if isinstance(e, LineTooLong) else 400)
+            write(error_line(e))
+
+        write(b"")
+        if chunked:
+            self.wfile.write(LAST_CHUNK)
+
+    def _respond_with(
+        self, inputs: list[str] | Response, predict: ModelPredict | None = None, deadline: float | None = None
+    ) -> None:
+        if isinstance(inputs, Response):
+            return self.respond(inputs.data, inputs.content_type, inputs.status_code, inputs.headers)
+
+        try:
+            predictions = (predict or self._predict)(inputs, deadline, True)
+        except (QueueFullException, DeadlineExceededException) as e:
+            return self._respond_with(typing.cast(Response, shed_response(e)))
+
+        with measure(self.metrics, "serialize"):
+            self.respond(predictions)
+
+    def _with_model(self, name: str | None, use: typing.Callable[[ModelPredict], None]) -> None:
+        """
+        Call `use` with the predict function of the default model, or of a model of the pool (acquired meanwhile).
+        """
+        if name is None:
+            return use(self._predict)
+
+        model = acquire_model(self.pool, name)
+        if isinstance(model, Response):
+            self.close_connection = True  # a streaming body is not read
+            return self._respond_with(model)
+
+        try:
+            use(model.predict)
+        finally:
+            model.release()
+
+    def _read_body(self) -> bytes | Response:
+        """
+        Read the whole body, sent with a Content-Length or chunked.
 
-        response_message = self._predict(query_params["query"])
-        self.respond(response_message)
+        If the body can't be read completely (malformed framing or an unsupported transfer encoding), the error \
+            response is returned and the connection is closed, since the next request would start at an unknown place.
+        """
+        if (response := unsupported_transfer_encoding(self.headers.get("Transfer-Encoding"))) is not None:
+            self.close_connection = True
+            return response
+
+        try:
+            return b"".join(iter_body(self.rfile, self.headers))
+        except ValueError:
+            self.close_connection = True
+            return Response("Invalid Content-Length or chunk size", 400, "text/plain")
+
+    @contextlib.contextmanager
+    def _in_flight(self) -> typing.Generator[None, None, None]:
+        if not self.metrics:
+            yield
+            return
+
+        self.metrics.in_flight.inc()
+        try:
+            yield
+        finally:
+            self.metrics.in_flight.dec()
+
+    def do_GET(self) -> None:
+        """
+        Parse ?query in GET requests, or respond with the status of the server.
+        """
+        received = time.monotonic()
+        if self.headers.get("Content-Length", "0") != "0" or self.headers.get("Transfer-Encoding"):
+            # the body of a GET request is not read, so the connection can't be reused:
+            self.close_connection = True
+
+        with self._in_flight():
+            name, path = split_model_path(self.path)
+            with measure(self.metrics, "parse"):
+                inputs = (
+                    admin_response("GET", self.path, self.reloader)
+                    or status_response(self.path, self.cache, self.metrics, self.readiness, self.pool)
+                    or not_ready(self.readiness)
+                    or unroutable(name, path, self.model is not None, self.pool)
+                    or invalid_deadline(self.headers.get(DEADLINE_HEADER))
+                    or query_inputs(path)
+                )
+
+            if isinstance(inputs, Response):
+                return self._respond_with(inputs)
+            deadline = request_deadline(self.headers.get(DEADLINE_HEADER), received)
+            self._with_model(name, functools.partial(self._respond_with, inputs, deadline=deadline))
 
     def do_POST(self) -> None:
         """
         Either parse the JSON body or use the raw data as input.
+
+        POST /predict/stream predicts the body line by line instead, see `ndjson.py`.
         """
-        content_type = self.headers.get("Content-Type")
-        content_length = int(self.headers.get("Content-Length", 0))
+        received = time.monotonic()
+        with self._in_flight():
+            if self.path.split("?", 1)[0] == RELOAD_PATH:
+                # read the body before acting, so an invalid request does not reload:
+                body = self._read_body()
+                response = body if isinstance(body, Response) else admin_response("POST", self.path, self.reloader)
+                return self._respond_with(typing.cast(Response, response))
 
-        post_data = self.rfile.read(content_length)
-        if not post_data:
-            return self.respond("Missing POST data!", status_code=400)
+            name, path = split_model_path(self.path)
+            response = not_ready(self.readiness) or unroutable(name, path, self.model is not None, self.pool)
+            if response is not None:
+                # the body is not read, so the connection can't be reused:
+                self.close_connection = True
+                return self._respond_with(response)
 
-        print(content_type, post_data)
-        if content_type == "application/json":
-            try:
-                json_data = json.loads(post_data.decode("utf-8"))
-                if not json_data:
-                    return self.respond("Missing POST data!", status_code=400)
-                if not isinstance(json_data, list):
-                    json_data = [json_data]
-                response_data = self._predict(json_data)
-                self.respond(response_data)
-            except json.JSONDecodeError:
-                self.respond("Invalid JSON data", status_code=400)
-        else:
-            response_message = self._predict([post_data.decode("utf-8")])
-            self.respond(response_message)
+            if path.split("?", 1)[0] == STREAM_PATH:
+                return self._with_model(name, self._stream)
+
+            with measure(self.metrics, "parse"):
+                post_data = self._read_body()
+                inputs = (
+                    post_data
+                    if isinstance(post_data, Response)
+                    else invalid_deadline(self.headers.get(DEADLINE_HEADER))
+                    or body_inputs(self.headers.get("Content-Type"), post_data)
+                )
+
+            if isinstance(inputs, Response):
+                return self._respond_with(inputs)
+            deadline = request_deadline(self.headers.get(DEADLINE_HEADER), received)
+            self._with_model(name, functools.partial(self._respond_with, inputs, deadline=deadline))
 
     @classmethod
-    def bind(cls, model: "AllSimpletransformersModels") -> typing.Callable[..., "MachineLearningModelHandler"]:
+    def bind(
+        cls,
+        model: "AllSimpletransformersModels | None",
+        batcher: MicroBatcher | None = None,
+        cache: PredictionCache | None = None,
+        metrics: ServerMetrics | None = None,
+        readiness: Readiness | None = None,
+        pool: ModelPool | None = None,
+        reloader: ModelReloader | None = None,
+    ) -> typing.Callable[..., "MachineLearningModelHandler"]:
         """
         The http.server.HTTPServer needs a callable that returns an instance, but we also want to pass model.
 
@@ -131,29 +642,612 @@ class MachineLearningModelHandler(http.server.SimpleHTTPRequestHandler):
         """
 
         def wrapper(*args: typing.Any, **kwargs: typing.Any) -> "MachineLearningModelHandler":
-            return MachineLearningModelHandler(model, *args, **kwargs)
+            return MachineLearningModelHandler(
+                model,
+                *args,
+                batcher=batcher,
+                cache=cache,
+                metrics=metrics,
+                readiness=readiness,
+                pool=pool,
+                reloader=reloader,
+                **kwargs,
+            )
 
         return wrapper
 
 
-class MachineLearningModelServer:  # pragma: no cover
+class MachineLearningModelServer:
     """
     Shortcut that combines HTTPServer and MachineLearningModelHandler.
 
     Usage:
         MachineLearningModelServer(host, port).serve_forever(model)
+
+    Connections are handled on their own thread, while a single inference worker thread owns the model: slow clients \
+        don't block the model or other clients, and the model never runs concurrently with itself. \
+        With max_batch > 1, the worker predicts the inputs of concurrent requests together in batches of up to \
+        max_batch inputs, waiting at most max_wait_ms for a batch to fill up. \
+        threaded=False handles one connection at a time, as the plain HTTPServer does. \
+        With a cache (PredictionCache), repeated inputs are answered without the model. \
+        Metrics are always recorded (in `self.metrics`) and served at GET /metrics. \
+        With warmup, the model first predicts some batches in the background, predictions are refused (503) until \
+        that's done. GET /healthz and GET /readyz report liveness and readiness (see `warmup.py`). \
+        With a pool (ModelPool), the models of a directory are served at /models/<name>/predict (see `pool.py`), \
+        next to the default model (if any). \
+        With a reloader (ModelReloader), new versions of the model file are swapped in without downtime \
+        (see `reload.py`). \
+        With max_queue, at most that many inputs wait for the inference worker: other requests are answered 503 \
+        with Retry-After right away. Requests with an X-Deadline-Ms header that expires while they wait are answered \
+        504 without being predicted.
     """
 
-    def __init__(self, server_address: str, port: int) -> None:
+    def __init__(
+        self,
+        server_address: str,
+        port: int,
+        max_batch: int = 1,
+        max_wait_ms: float = DEFAULT_MAX_WAIT * 1000,
+        threaded: bool = True,
+        sock: socket.socket | None = None,
+        cache: PredictionCache | None = None,
+        metrics: ServerMetrics | None = None,
+        warmup: Warmup | None = None,
+        pool: ModelPool | None = None,
+        reloader: ModelReloader | None = None,
+        max_queue: int | None = None,
+    ) -> None:
         """
         An address (e.g. localhost) and port (e.g. 8000) are required.
+
+        An already listening socket can be passed as `sock` (e.g. shared by pre-forked workers), \
+            then the address and port are ignored.
         """
         self.server_address = server_address
         self.port = port
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.threaded = threaded
+        self.sock = sock
+        self.cache = cache
+        self.metrics = metrics or ServerMetrics()
+        self.warmup = warmup
+        self.readiness = Readiness()
+        self.pool = pool
+        if pool is not None and pool.metrics is None:
+            pool.metrics = self.metrics
+        self.reloader = reloader
+        self.max_queue = max_queue
+
+    @contextlib.contextmanager
+    def running(
+        self, model: "AllSimpletransformersModels | None"
+    ) -> typing.Generator[http.server.HTTPServer, None, None]:
+        """
+        Start the inference worker and bind the server, without handling requests yet. The warmup starts right away.
 
-    def serve_forever(self, model: "AllSimpletransformersModels") -> None:
+        The model can be None when only the models of the pool are served, these are unloaded afterwards. \
+            The bound address is available as `server.server_address` (useful with port 0).
+        """
+        server_class = http.server.ThreadingHTTPServer if self.threaded else http.server.HTTPServer
+        with (
+            model_batcher(model, self.max_batch, self.max_wait_ms, self.metrics, self.max_queue) as batcher,
+            server_class(
+                (self.server_address, self.port),
+                MachineLearningModelHandler.bind(
+                    model, batcher, self.cache, self.metrics, self.readiness, self.pool, self.reloader
+                ),
+                bind_and_activate=self.sock is None,
+            ) as httpd,
+        ):
+            if self.sock is not None:
+                httpd.socket.close()
+                httpd.socket = self.sock
+                httpd.server_address = self.sock.getsockname()
+            self.readiness.start(functools.partial(predict_with, model), self.warmup if model is not None else None)
+            start_reloader(self.reloader, model, batcher, self.warmup, self.cache, self.readiness)
+            try:
+                yield httpd
+            finally:
+                if self.reloader is not None:
+                    self.reloader.stop()
+                if self.pool is not None:
+                    self.pool.close()
+
+    def serve_forever(self, model: "AllSimpletransformersModels | None") -> None:  # pragma: no cover
         """
         Serve the model!
         """
-        with http.server.HTTPServer((self.server_address, self.port), MachineLearningModelHandler.bind(model)) as httpd:
+        with self.running(model) as httpd:
             httpd.serve_forever()
+
+
+class HttpRequest(typing.NamedTuple):
+    """
+    A parsed HTTP/1.x request.
+    """
+
+    method: str
+    path: str
+    version: str
+    headers: dict[str, str]  # lowercase names
+    body: bytes
+    # for streaming requests, the body is not read up front but set when the handler has consumed it:
+    body_read: asyncio.Event | None = None
+
+    @property
+    def keep_alive(self) -> bool:
+        """
+        HTTP/1.1 keeps the connection open unless the client asks to close it, HTTP/1.0 the other way around.
+        """
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class BadRequest(ValueError):
+    """
+    The client sent something that is not valid HTTP.
+    """
+
+
+MAX_HEADERS = 100
+PIPELINE_DEPTH = 16  # requests read ahead per connection
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    body = bytearray()
+    while True:
+        size_line = await reader.readuntil(b"\r\n")
+        try:
+            size = int(size_line.split(b";", 1)[0], 16)
+        except ValueError as e:
+            raise BadRequest("Invalid chunk size") from e
+
+        if not size:
+            # skip trailers:
+            while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                pass
+            return bytes(body)
+
+        body += await reader.readexactly(size)
+        await reader.readexactly(2)  # \r\n after every chunk
+
+
+async def read_request(reader: asyncio.StreamReader) -> HttpRequest | None:
+    """
+    Read one request from the stream, or None if the client closed the connection before sending a new request.
+
+    The body of streaming requests is left in the stream (see HttpRequest.body_read).
+
+    Raises BadRequest for malformed requests.
+    """
+    try:
+        request_line = await reader.readuntil(b"\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise BadRequest("Incomplete request line") from e
+
+    try:
+        method, path, version = request_line.decode("latin-1").split()
+    except ValueError as e:
+        raise BadRequest("Invalid request line") from e
+
+    if not version.startswith("HTTP/1."):
+        raise BadRequest(f"Unsupported HTTP version {version}")
+
+    headers: dict[str, str] = {}
+    while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+        name, sep, value = line.decode("latin-1").partition(":")
+        if not sep or len(headers) >= MAX_HEADERS:
+            raise BadRequest("Invalid headers")
+        headers[name.strip().lower()] = value.strip()
+
+    if method.upper() == "POST" and split_model_path(path)[1].split("?", 1)[0] == STREAM_PATH:
+        return HttpRequest(method.upper(), path, version, headers, b"", asyncio.Event())
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = await _read_chunked(reader)
+    else:
+        try:
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+        except ValueError as e:
+            raise BadRequest("Invalid Content-Length") from e
+
+    return HttpRequest(method.upper(), path, version, headers, body)
+
+
+def encode_head(
+    status_code: int,
+    content_type: str,
+    content_length: int | None = None,
+    keep_alive: bool = True,
+    headers: typing.Iterable[tuple[str, str]] = (),
+) -> bytes:
+    """
+    Build the status line and headers of a HTTP/1.1 response, without a content_length the body is chunked.
+    """
+    status = http.HTTPStatus(status_code)
+    head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}"]
+    if content_length is None:
+        head.append("Transfer-Encoding: chunked")
+    else:
+        head.append(f"Content-Length: {content_length}")
+    if not keep_alive:
+        head.append("Connection: close")
+    head.extend(f"{name}: {value}" for name, value in headers)
+
+    return "\r\n".join([*head, "", ""]).encode("latin-1")
+
+
+def encode_response(response: Response, keep_alive: bool = True) -> bytes:
+    """
+    Build the raw HTTP/1.1 response, including the headers.
+    """
+    body, content_type = response.encode()
+    return encode_head(response.status_code, content_type, len(body), keep_alive, response.headers) + body
+
+
+class AsyncModelServer:
+    """
+    HTTP server built on asyncio streams, with the same GET ?query= and POST semantics as MachineLearningModelHandler.
+
+    Every connection is a cheap coroutine (so thousands of idle keep-alive connections are fine) and the model runs on \
+        the inference worker thread, optionally batching concurrent requests (see MicroBatcher). \
+        Pipelined requests are answered in order. When a client disconnects, its pending prediction is cancelled. \
+        With a cache (PredictionCache), repeated inputs are answered without the model. \
+        Metrics are always recorded (in `self.metrics`) and served at GET /metrics. \
+        With warmup, the model first predicts some batches in the background, predictions are refused (503) until \
+        that's done. GET /healthz and GET /readyz report liveness and readiness (see `warmup.py`). \
+        With a pool (ModelPool), the models of a directory are served at /models/<name>/predict (see `pool.py`), \
+        next to the default model (if any). \
+        With a reloader (ModelReloader), new versions of the model file are swapped in without downtime \
+        (see `reload.py`). \
+        With max_queue, at most that many inputs wait for the inference worker: other requests are answered 503 \
+        with Retry-After right away. Requests with an X-Deadline-Ms header that expires while they wait are answered \
+        504 without being predicted.
+
+    Usage:
+        AsyncModelServer(host, port).run(model)
+
+        # or within a running event loop:
+        async with AsyncModelServer(host, port).running(model) as server:
+            ...
+    """
+
+    def __init__(
+        self,
+        server_address: str,
+        port: int,
+        max_batch: int = 1,
+        max_wait_ms: float = DEFAULT_MAX_WAIT * 1000,
+        keep_alive_timeout: float = KEEP_ALIVE_TIMEOUT,
+        sock: socket.socket | None = None,
+        cache: PredictionCache | None = None,
+        metrics: ServerMetrics | None = None,
+        warmup: Warmup | None = None,
+        pool: ModelPool | None = None,
+        reloader: ModelReloader | None = None,
+        max_queue: int | None = None,
+    ) -> None:
+        """
+        An address (e.g. localhost) and port (e.g. 8000) are required, unless an already listening `sock` is passed.
+        """
+        self.server_address = server_address
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.keep_alive_timeout = keep_alive_timeout
+        self.sock = sock
+        self.cache = cache
+        self.metrics = metrics or ServerMetrics()
+        self.warmup = warmup
+        self.readiness = Readiness()
+        self.pool = pool
+        if pool is not None and pool.metrics is None:
+            pool.metrics = self.metrics
+        self.reloader = reloader
+        self.max_queue = max_queue
+        self.batcher: MicroBatcher | None = None
+
+    @contextlib.asynccontextmanager
+    async def running(
+        self, model: "AllSimpletransformersModels | None"
+    ) -> typing.AsyncGenerator[asyncio.Server, None]:
+        """
+        Start the inference worker and start accepting connections. The warmup starts right away.
+
+        The model can be None when only the models of the pool are served, these are unloaded afterwards. \
+            The bound address is available via `server.sockets[0].getsockname()` (useful with port 0).
+        """
+        with model_batcher(model, self.max_batch, self.max_wait_ms, self.metrics, self.max_queue) as self.batcher:
+            if self.sock is None:
+                server = await asyncio.start_server(self.handle_connection, self.server_address, self.port)
+            else:
+                server = await asyncio.start_server(self.handle_connection, sock=self.sock)
+            self.readiness.start(functools.partial(predict_with, model), self.warmup if model is not None else None)
+            start_reloader(self.reloader, model, self.batcher, self.warmup, self.cache, self.readiness)
+            try:
+                async with server:
+                    yield server
+            finally:
+                if self.reloader is not None:
+                    self.reloader.stop()
+                self.batcher = None
+                if self.pool is not None:
+                    self.pool.close()
+
+    async def serve_forever(self, model: "AllSimpletransformersModels | None") -> None:
+        """
+        Serve the model until cancelled.
+        """
+        async with self.running(model) as server:
+            await server.serve_forever()
+
+    def run(self, model: "AllSimpletransformersModels | None") -> None:  # pragma: no cover
+        """
+        Serve the model in a new event loop.
+        """
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(self.serve_forever(model))
+
+    async def _read_requests(
+        self, reader: asyncio.StreamReader, pending: asyncio.Queue[HttpRequest | Response | None], gone: asyncio.Event
+    ) -> None:
+        """
+        Read (pipelined) requests from the connection until it's closed, a malformed request ends the connection.
+        """
+        try:
+            while request := await read_request(reader):
+                await pending.put(request)
+                if request.body_read is not None:
+                    # the handler reads the body, wait for it before reading the next request:
+                    await request.body_read.wait()
+                if not request.keep_alive:
+                    break
+        except BadRequest as e:
+            await pending.put(Response(str(e), 400, "text/plain"))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            gone.set()
+        else:
+            if request is None:
+                gone.set()
+        finally:
+            await pending.put(None)
+
+    async def _predict(
+        self,
+        inputs: list[str],
+        gone: asyncio.Event,
+        model: PooledModel | None = None,
+        deadline: float | None = None,
+        bounded: bool = True,
+    ) -> list[typing.Any] | None:
+        """
+        Wait for the outputs of the inference worker (of the default model, or of a model of the pool), \
+            or None if the client disconnected before they were ready.
+
+        Raises QueueFullException or DeadlineExceededException when the request is shed (see MicroBatcher.submit).
+        """
+        batcher, cache = (model.batcher, model.cache) if model else (self.batcher, self.cache)
+        if batcher is None:  # pragma: no cover
+            raise RuntimeError("Server is not running.")
+
+        generation = 0
+        if cache is not None:
+            results, todo, generation = cache.misses_of(inputs)
+            if not todo:
+                return results
+        else:
+            results, todo = [], inputs
+
+        prediction: asyncio.Future[typing.Any] = asyncio.wrap_future(batcher.submit(todo, deadline, bounded))
+        disconnected: asyncio.Future[typing.Any] = asyncio.ensure_future(gone.wait())
+        try:
+            await asyncio.wait({prediction, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnected.cancel()
+
+        if not prediction.done():
+            # cancels the request at the batcher too, if it has not started yet:
+            prediction.cancel()
+            return None
+
+        predictions = prediction.result()
+        if cache is None:
+            return typing.cast(list[typing.Any], predictions)
+
+        cache.store(todo, predictions, generation)
+        return cache.merge(inputs, results, todo, predictions)
+
+    async def _acquire(self, name: str | None) -> PooledModel | Response | None:
+        """
+        Get a model of the pool by name (loading it on a thread), the error response, or None for the default model.
+        """
+        return None if name is None else await asyncio.to_thread(acquire_model, self.pool, name)
+
+    async def _stream(
+        self, request: HttpRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, gone: asyncio.Event
+    ) -> bool:
+        """
+        Predict the lines of the body in batches while it arrives, sending every batch back as a NDJSON chunk.
+
+        Returns whether the connection can be used for the next request.
+        """
+        name, path = split_model_path(request.path)
+        response = (
+            not_ready(self.readiness)
+            or unroutable(name, path, self.batcher is not None, self.pool)
+            or unsupported_transfer_encoding(request.headers.get("transfer-encoding"))
+        )
+        model: PooledModel | None = None
+        if response is None:
+            if isinstance(acquired := await self._acquire(name), Response):
+                response = acquired
+            else:
+                model = acquired
+        if response is not None:
+            # the body is not read, so the connection can't be reused:
+            await self._send(writer, response, keep_alive=False)
+            return False
+
+        try:
+            return await self._stream_lines(request, reader, writer, gone, model)
+        finally:
+            if model is not None:
+                model.release()
+
+    async def _stream_lines(
+        self,
+        request: HttpRequest,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        gone: asyncio.Event,
+        model: PooledModel | None,
+    ) -> bool:
+        decoder = LineDecoder(is_json_lines(request.headers.get("content-type")))
+        started = False
+
+        async def write(lines: bytes) -> None:
+            nonlocal started
+            if not started:
+                # the status is only sent with the first results, so an invalid body can still get an error response
+                started = True
+                self.metrics.requests.inc(label="200")
+                writer.write(encode_head(200, NDJSON_CONTENT_TYPE, keep_alive=request.keep_alive))
+            if lines:
+                writer.write(chunk(lines))
+            await writer.drain()
+
+        async def send(items: list[typing.Any]) -> bool:
+            for batch in batches(items):
+                inputs = valid_inputs(batch)
+                if (predictions := await self._predict(inputs, gone, model, bounded=False) if inputs else []) is None:
+                    return False
+                await write(encode_lines(batch, predictions))
+            return True
+
+        try:
+            async for data in aiter_body(reader, request.headers):
+                if not await send(decoder.feed(data)):
+                    return False
+            if not await send(decoder.finish()):
+                return False
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return False
+        except ValueError as e:
+            # the rest of the body is not read, so the connection can't be reused:
+            if not started:
+                status = 413 if isinstance(e, LineTooLong) else 400
+                await self._send(writer, Response(str(e), status, "text/plain"), keep_alive=False)
+                return False
+            await write(error_line(e))
+            writer.write(LAST_CHUNK)
+            await writer.drain()
+            return False
+        except Exception:
+            # an incomplete chunked response tells the client something went wrong
+            return False
+
+        await write(b"")
+        writer.write(LAST_CHUNK)
+        await writer.drain()
+        return True
+
+    async def respond_to(self, request: HttpRequest, gone: asyncio.Event) -> Response | None:
+        """
+        Get the response for a request, like MachineLearningModelHandler would.
+        """
+        received = time.monotonic()
+        deadline_header = request.headers.get(DEADLINE_HEADER.lower())
+        name, path = split_model_path(request.path)
+        with self.metrics.stage("parse"):
+            if (response := admin_response(request.method, request.path, self.reloader)) is not None:
+                return response
+
+            match request.method:
+                case "GET":
+                    inputs = (
+                        status_response(request.path, self.cache, self.metrics, self.readiness, self.pool)
+                        or not_ready(self.readiness)
+                        or unroutable(name, path, self.batcher is not None, self.pool)
+                        or invalid_deadline(deadline_header)
+                        or query_inputs(path)
+                    )
+                case "POST":
+                    inputs = (
+                        not_ready(self.readiness)
+                        or unroutable(name, path, self.batcher is not None, self.pool)
+                        or invalid_deadline(deadline_header)
+                        or body_inputs(request.headers.get("content-type"), request.body)
+                    )
+                case _:
+                    return Response(f"Unsupported method ({request.method!r})", 501, "text/plain")
+
+        if isinstance(inputs, Response):
+            return inputs
+
+        if isinstance(model := await self._acquire(name), Response):
+            return model
+
+        try:
+            predictions = await self._predict(inputs, gone, model, request_deadline(deadline_header, received))
+        except Exception as e:
+            return shed_response(e) or Response(f"{type(e).__name__}: {e}", 500, "text/plain")
+        finally:
+            if model is not None:
+                model.release()
+
+        return None if predictions is None else Response(predictions)
+
+    async def _send(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool = True) -> None:
+        with self.metrics.stage("serialize"):
+            self.metrics.requests.inc(label=str(response.status_code))
+            writer.write(encode_response(response, keep_alive=keep_alive))
+        await writer.drain()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the requests of one connection in order, until it's closed or idle for keep_alive_timeout seconds.
+        """
+        pending: asyncio.Queue[HttpRequest | Response | None] = asyncio.Queue(PIPELINE_DEPTH)
+        gone = asyncio.Event()
+        reading = asyncio.create_task(self._read_requests(reader, pending, gone))
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(pending.get(), self.keep_alive_timeout)
+                except asyncio.TimeoutError:
+                    break
+
+                if request is None:
+                    break
+
+                if isinstance(request, Response):
+                    # malformed request:
+                    await self._send(writer, request, keep_alive=False)
+                    break
+
+                self.metrics.in_flight.inc()
+                try:
+                    if request.body_read is not None:
+                        try:
+                            reusable = await self._stream(request, reader, writer, gone)
+                        finally:
+                            request.body_read.set()
+                    elif reusable := (response := await self.respond_to(request, gone)) is not None:
+                        await self._send(writer, response, keep_alive=request.keep_alive)
+                finally:
+                    self.metrics.in_flight.dec()
+
+                if not (reusable and request.keep_alive):
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            reading.cancel()
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
@@ -0,0 +1,379 @@
+"""
+File-like wrappers to (de)compress the payload of a `.vst` file on the fly.
+
+This way the model never has to exist in memory as one big (compressed) bytestring.
+
+A payload is either a single compressed stream, or (since MetaHeader version 4) a series of independently compressed
+chunks that are (de)compressed on a thread pool. zlib, zstd and lz4 release the GIL, so this scales with the cores.
+Every chunk is prefixed with its compressed size (CHUNK_HEADER), which is the index to find the next chunk.
+"""
+from __future__ import annotations
+
+import io
+import os
+import struct
+import typing
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .compression import DEFAULT_CODEC, Codec, get_codec
+from .exceptions import CodecError
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+DEFAULT_CHUNK_SIZE = 4 * CHUNK_SIZE  # uncompressed size of an independently compressed chunk
+# uncompressed bytes a ChunkedWriter keeps in flight, independent of the amount of workers:
+MAX_PENDING_BYTES = 16 * DEFAULT_CHUNK_SIZE
+
+# compressed size of the chunk that follows
+CHUNK_HEADER = struct.Struct("<Q")
+
+
+def default_workers() -> int:
+    """
+    By default, use a thread for every core.
+    """
+    return os.cpu_count() or 1
+
+
+class PayloadWriter(typing.Protocol):
+    """
+    Write-only file-like object for the payload that keeps track of how many bytes went in and out.
+
+    'checksum' is the crc32 of all bytes that were written to the target.
+    """
+
+    bytes_in: int
+    bytes_out: int
+    chunk_count: int
+    checksum: int
+
+    def write(self, data: bytes | memoryview) -> int:
+        """
+        Write (and possibly compress) data.
+        """
+
+    def finish(self) -> int:
+        """
+        Finalize the payload and return the total amount of bytes that was written to the target.
+        """
+
+
+class CompressedWriter:
+    """
+    Write-only file-like object that compresses everything written to it before passing it on to `target`.
+
+    Usage:
+        writer = CompressedWriter(f_out, level=5)
+        dill.dump(model, writer)
+        writer.finish()
+    """
+
+    bytes_in: int
+    bytes_out: int
+    chunk_count = 0  # single stream
+    checksum: int
+
+    def __init__(self, target: typing.BinaryIO, level: int, codec: str | Codec = DEFAULT_CODEC) -> None:
+        """
+        Compressed bytes are written to 'target', using a codec (see `compression.py`) with compression 'level'.
+        """
+        self.target = target
+        self.codec = get_codec(codec)
+        self._compressor = self.codec.compressor(level)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.checksum = 0
+
+    def _emit(self, compressed: bytes | memoryview) -> None:
+        if size := memoryview(compressed).nbytes:
+            self.target.write(compressed)
+            self.bytes_out += size
+            self.checksum = zlib.crc32(compressed, self.checksum)
+
+    def write(self, data: bytes | memoryview) -> int:
+        """
+        Compress a piece of data and write the result (if any) to the target.
+        """
+        size = memoryview(data).nbytes
+        self.bytes_in += size
+        self._emit(self._compressor.compress(data))
+        return size
+
+    def finish(self) -> int:
+        """
+        Flush the remaining data out of the compressor and return the total amount of compressed bytes.
+
+        Don't write to this object after calling `finish`.
+        """
+        self._emit(self._compressor.flush())
+        return self.bytes_out
+
+
+class ChunkedWriter:
+    """
+    Write-only file-like object that splits everything written to it into chunks of `chunk_size` bytes.
+
+    The chunks are compressed independently on a pool of `workers` threads and written to `target` in order,
+    each prefixed with its compressed size. At most two chunks per worker and at most `max_pending_bytes` (but always
+    at least one chunk) are kept in memory, so memory usage does not grow with the amount of cores: with the defaults
+    that's 64 MB, which keeps up to 16 workers busy.
+    """
+
+    bytes_in: int
+    bytes_out: int
+    chunk_count: int
+    checksum: int
+
+    def __init__(
+        self,
+        target: typing.BinaryIO,
+        level: int,
+        codec: str | Codec = DEFAULT_CODEC,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int | None = None,
+        max_pending_bytes: int = MAX_PENDING_BYTES,
+    ) -> None:
+        """
+        Compressed chunks are written to 'target', using a codec (see `compression.py`) with compression 'level'.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"Chunk size should be positive, not {chunk_size}.")
+
+        self.target = target
+        self.codec = get_codec(codec)
+        self.level = self.codec.clamp(level)
+        self.chunk_size = chunk_size
+        self.workers = workers or default_workers()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.chunk_count = 0
+        self.checksum = 0
+        self.max_pending_bytes = max_pending_bytes
+        self._buffer = bytearray()
+        self._pending: deque[tuple[int, Future[bytes]]] = deque()  # (uncompressed size, compressed chunk)
+        self._pending_bytes = 0
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="vst-compress")
+
+    def _emit(self, compressed: bytes) -> None:
+        header = CHUNK_HEADER.pack(len(compressed))
+        self.target.write(header)
+        self.target.write(compressed)
+        self.bytes_out += CHUNK_HEADER.size + len(compressed)
+        self.chunk_count += 1
+        self.checksum = zlib.crc32(compressed, zlib.crc32(header, self.checksum))
+
+    def _emit_next(self) -> None:
+        size, compressed = self._pending.popleft()
+        self._pending_bytes -= size
+        self._emit(compressed.result())
+
+    def _submit(self, chunk: bytes) -> None:
+        self._pending.append((len(chunk), self._executor.submit(self.codec.compress, chunk, self.level)))
+        self._pending_bytes += len(chunk)
+        while len(self._pending) > 2 * self.workers or (
+            len(self._pending) > 1 and self._pending_bytes > self.max_pending_bytes
+        ):
+            self._emit_next()
+
+    def write(self, data: bytes | memoryview) -> int:
+        """
+        Add data to the current chunk and start compressing every chunk that is full.
+        """
+        view = memoryview(data).cast("B")
+        size = view.nbytes
+        self.bytes_in += size
+
+        if self._buffer:
+            missing = self.chunk_size - len(self._buffer)
+            self._buffer += view[:missing]
+            view = view[missing:]
+            if len(self._buffer) < self.chunk_size:
+                return size
+
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+
+        # large writes are chunked without going through the buffer:
+        while view.nbytes >= self.chunk_size:
+            self._submit(bytes(view[: self.chunk_size]))
+            view = view[self.chunk_size :]
+
+        self._buffer += view
+        return size
+
+    def finish(self) -> int:
+        """
+        Compress the last (partial) chunk, wait for all chunks to be written and return the total amount of bytes.
+
+        Don't write to this object after calling `finish`.
+        """
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+
+            while self._pending:
+                self._emit_next()
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+
+        return self.bytes_out
+
+
+class DecompressedReader(io.RawIOBase):
+    """
+    Read-only file-like object that decompresses the next `length` bytes of `source` while it is being read.
+
+    Wrap it in an `io.BufferedReader` (see `open_payload`) to get efficient `read` and `readline` for pickle.
+    Invalid or truncated data raises a CodecError.
+    """
+
+    def __init__(self, source: typing.BinaryIO, length: int, codec: str | Codec = DEFAULT_CODEC) -> None:
+        """
+        At most 'length' (compressed) bytes will be read from 'source'.
+        """
+        super().__init__()
+        self.source = source
+        self.remaining = length
+        self.codec = get_codec(codec)
+        self._decompressor = self.codec.decompressor()
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        """
+        This is a read-only stream.
+        """
+        return True
+
+    def _read_source(self) -> bytes:
+        data = self.source.read(min(CHUNK_SIZE, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def _decompress(self, data: bytes) -> bytes:
+        try:
+            return self._decompressor.decompress(data)
+        except self.codec.errors as e:
+            raise CodecError(f"Could not decompress {self.codec.name} data: {e}") from e
+
+    def readinto(self, buffer: typing.Any) -> int:
+        """
+        Decompress at most len(buffer) bytes into buffer and return how many bytes were written.
+
+        Returns 0 at the end of the compressed stream.
+        """
+        view = memoryview(buffer).cast("B")
+
+        while not self._pending:
+            if not (data := self._read_source()):
+                if not self._decompressor.eof:
+                    raise CodecError(f"Compressed {self.codec.name} data is truncated.")
+                return 0
+
+            self._pending = memoryview(self._decompress(data))
+
+        size = min(view.nbytes, self._pending.nbytes)
+        view[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class ChunkedReader(io.RawIOBase):
+    """
+    Read-only file-like object for a payload that was written by ChunkedWriter.
+
+    Chunks are read from `source` in order and decompressed ahead on a pool of `workers` threads.
+    Invalid or truncated data raises a CodecError.
+    """
+
+    def __init__(
+        self, source: typing.BinaryIO, length: int, codec: str | Codec = DEFAULT_CODEC, workers: int | None = None
+    ) -> None:
+        """
+        At most 'length' (compressed) bytes will be read from 'source'.
+        """
+        super().__init__()
+        self.source = source
+        self.remaining = length
+        self.codec = get_codec(codec)
+        self.workers = workers or default_workers()
+        self._pending: deque[Future[bytes]] = deque()
+        self._current = memoryview(b"")
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="vst-decompress")
+
+    def readable(self) -> bool:
+        """
+        This is a read-only stream.
+        """
+        return True
+
+    def _read_exact(self, size: int) -> bytes:
+        data = self.source.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        if len(data) != size:
+            raise CodecError(f"Chunked {self.codec.name} data is truncated.")
+        return data
+
+    def _schedule(self) -> None:
+        """
+        Read the next chunks from source and start decompressing them, until enough work is queued.
+        """
+        while self.remaining and len(self._pending) < 2 * self.workers:
+            (size,) = CHUNK_HEADER.unpack(self._read_exact(CHUNK_HEADER.size))
+            self._pending.append(self._executor.submit(self.codec.decompress, self._read_exact(size)))
+
+    def readinto(self, buffer: typing.Any) -> int:
+        """
+        Copy at most len(buffer) decompressed bytes into buffer and return how many bytes were written.
+
+        Returns 0 after the last chunk.
+        """
+        view = memoryview(buffer).cast("B")
+
+        while not self._current:
+            self._schedule()
+            if not self._pending:
+                return 0
+            self._current = memoryview(self._pending.popleft().result())
+
+        size = min(view.nbytes, self._current.nbytes)
+        view[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+    def close(self) -> None:
+        """
+        Stop decompressing chunks that are no longer needed.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        super().close()
+
+
+def copy_stream(source: typing.BinaryIO, target: typing.BinaryIO | PayloadWriter, length: int) -> None:
+    """
+    Copy the next `length` bytes of source to target, per chunk.
+
+    Raises an EOFError if source ends too soon.
+    """
+    while length:
+        if not (data := source.read(min(CHUNK_SIZE, length))):
+            raise EOFError(f"Unexpected end of file, {length} bytes are missing.")
+        target.write(data)
+        length -= len(data)
+
+
+def open_payload(
+    source: typing.BinaryIO,
+    length: int,
+    codec: str | Codec = DEFAULT_CODEC,
+    chunked: bool = False,
+    workers: int | None = None,
+) -> io.BufferedReader:
+    """
+    Get a buffered, decompressing file-like object for the payload of `length` bytes that starts at source.tell().
+
+    'chunked' payloads are decompressed on `workers` threads (default: one per core).
+    """
+    raw = ChunkedReader(source, length, codec, workers) if chunked else DecompressedReader(source, length, codec)
+    return io.BufferedReader(raw, buffer_size=CHUNK_SIZE)
@@ -3,20 +3,30 @@ Helper functionality.
 """
 from __future__ import annotations
 
-import io
 import os
 import select
 import sys
 import typing
+from pathlib import Path
 from types import TracebackType
 
-import torch
-from dill import Unpickler  # nosec
 from typing_extensions import Self
 
 devnull = open(os.devnull, "w")  # noqa: SIM115
 
 
+def __getattr__(name: str) -> typing.Any:
+    """
+    CudaUnpickler moved to `payload.py`, so importing this module does not require torch and dill.
+    """
+    if name == "CudaUnpickler":
+        from .payload import CudaUnpickler
+
+        return CudaUnpickler
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def write_bundle(output_file: typing.BinaryIO, *to_write: bytes) -> None:
     """
     Write all extra arguments to the output file.
@@ -26,35 +36,6 @@ def write_bundle(output_file: typing.BinaryIO, *to_write: bytes) -> None:
             f_out.write(element)
 
 
-class CudaUnpickler(Unpickler):  # type: ignore
-    """
-    Custom unpickler that deals with cuda being possibly available or missing.
-    """
-
-    def __init__(self, filelike: typing.BinaryIO, *a: typing.Any, device: str = "cpu", **kw: typing.Any):
-        """
-        You can choose a device to load the model onto (cpu, cuda).
-        """
-        self.device = device
-        super().__init__(filelike, *a, **kw)
-
-    def find_class(self, module: str, name: str) -> typing.Any:  # pragma: no cover
-        """
-        Custom unpickling behavior.
-        """
-        if module == "torch.storage" and name == "_load_from_bytes":
-            return lambda b: torch.load(io.BytesIO(b), map_location=self.device)
-        else:
-            return super().find_class(module, name)
-
-    @classmethod
-    def loads(cls, data: bytes, device: str = "cpu") -> typing.Any:
-        """
-        Shortcut for creating an instance and calling .load on it.
-        """
-        return cls(io.BytesIO(data), device=device).load()
-
-
 class DummyTqdm:  # pragma: no cover
     """
     Can be used in stead of a tqdm object but this does nothing.
@@ -145,3 +126,13 @@ def has_stdin() -> bool:  # pragma: no cover
             0.0,
         )[0]
     )
+
+
+def find_vst_files(paths: typing.Iterable[str | Path]) -> list[Path]:
+    """
+    Expand directories into all .vst files in them (recursively), files are kept as-is.
+    """
+    found: list[Path] = []
+    for path in map(Path, paths):
+        found.extend(sorted(path.rglob("*.vst")) if path.is_dir() else [path])
+    return found
@@ -0,0 +1,244 @@
+"""
+Per-stage timing of saving and loading a `.vst` file.
+
+Saving and loading are streaming pipelines (read -> decompress -> unpickle, pickle -> compress -> write), so the stages
+are interleaved instead of sequential. Every stage is measured by wrapping the file-like object between two stages:
+the time spent inside a call to the wrapper is attributed to that stage, minus the time spent in nested stages.
+
+Usage:
+    timings = TimingReport()
+    model = from_vst("model.vst", timings=timings)
+    print(timings.format())
+"""
+from __future__ import annotations
+
+import contextlib
+import time
+import typing
+
+from .support import TqdmProgress, dummy_tqdm
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .streams import PayloadWriter
+
+# the order in which stages are reported:
+STAGES = ("read", "decompress", "unpickle", "device move", "pickle", "compress", "write")
+
+MB = 1024 * 1024
+
+
+class Stage:
+    """
+    Total (exclusive) wall time and amount of bytes that went through one stage.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Start empty, values are added by `TimingReport.stage`.
+        """
+        self.name = name
+        self.seconds = 0.0
+        self.bytes = 0
+
+    @property
+    def throughput(self) -> float:
+        """
+        MB per second, 0 if nothing was measured.
+        """
+        return self.bytes / MB / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        """
+        Structured version of this stage, e.g. for JSON.
+        """
+        return {"seconds": self.seconds, "bytes": self.bytes, "mb_per_second": self.throughput}
+
+    def __repr__(self) -> str:
+        """
+        Show the measurements.
+        """
+        return f"Stage<{self.name}: {self.seconds:.3f}s, {self.bytes} bytes>"
+
+
+class TimingReport:
+    """
+    Collects the time and bytes per stage.
+
+    Stages can be nested: the time of a nested stage is not counted for its parent, so the stage times add up to \
+        the total. Stages are measured on the thread that saves or loads the model (work of (de)compression threads \
+        counts as the time spent waiting for it).
+    """
+
+    def __init__(self) -> None:
+        """
+        Start an empty report.
+        """
+        self.stages: dict[str, Stage] = {}
+        self._nested: list[float] = []  # time spent in nested stages, per active stage
+
+    def __getitem__(self, name: str) -> Stage:
+        """
+        Get (or create) a stage by name.
+        """
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> typing.Generator[Stage, None, None]:
+        """
+        Measure the time spent in this block for a stage, the amount of bytes can be added to the yielded stage.
+        """
+        current = self[name]
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            elapsed = time.perf_counter() - start
+            current.seconds += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    @property
+    def total(self) -> float:
+        """
+        Total measured wall time.
+        """
+        return sum(stage.seconds for stage in self.stages.values())
+
+    def ordered(self) -> list[Stage]:
+        """
+        The stages that were measured, in pipeline order.
+        """
+        order = {name: idx for idx, name in enumerate(STAGES)}
+        return sorted(self.stages.values(), key=lambda stage: order.get(stage.name, len(order)))
+
+    def as_dict(self) -> dict[str, dict[str, typing.Any]]:
+        """
+        Structured version of this report, e.g. for JSON.
+        """
+        return {stage.name: stage.as_dict() for stage in self.ordered()}
+
+    def format(self) -> str:
+        """
+        Plain text table with the time, share, bytes and throughput per stage.
+        """
+        total = self.total or 1.0
+        lines = [f"{'stage':<12} {'time':>9} {'share':>6} {'MB':>10} {'MB/s':>10}"]
+        lines.extend(
+            f"{stage.name:<12} {stage.seconds:>8.3f}s {stage.seconds / total:>6.1%} "
+            f"{stage.bytes / MB:>10.1f} {stage.throughput:>10.1f}"
+            for stage in self.ordered()
+        )
+        lines.append(f"{'total':<12} {self.total:>8.3f}s")
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        """
+        Show the total time.
+        """
+        return f"TimingReport<{self.total:.3f}s, {len(self.stages)} stages>"
+
+
+class TimedReader:
+    """
+    Read-only file-like wrapper that attributes the time of every read to a stage and counts the bytes read.
+
+    Every byte read also advances the progress bar.
+    """
+
+    bytes_read: int
+
+    def __init__(
+        self, source: typing.BinaryIO, report: TimingReport, stage: str, progress: TqdmProgress = dummy_tqdm
+    ) -> None:
+        """
+        Wrap 'source', measurements are stored in 'stage' of 'report'.
+        """
+        self.source = source
+        self.report = report
+        self.stage = stage
+        self.progress = progress
+        self.bytes_read = 0
+
+    def _count(self, stage: Stage, size: int) -> None:
+        stage.bytes += size
+        self.bytes_read += size
+        if size:
+            self.progress.update(size)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read from source.
+        """
+        with self.report.stage(self.stage) as stage:
+            data = self.source.read(size)
+            self._count(stage, len(data))
+        return data
+
+    def readinto(self, buffer: typing.Any) -> int:
+        """
+        Read from source into a buffer.
+        """
+        with self.report.stage(self.stage) as stage:
+            size = self.source.readinto(buffer)  # type: ignore
+            self._count(stage, size or 0)
+        return size or 0
+
+    def readline(self, size: int = -1) -> bytes:
+        """
+        Read a line from source.
+        """
+        with self.report.stage(self.stage) as stage:
+            data = self.source.readline(size)
+            self._count(stage, len(data))
+        return data
+
+    def peek(self, size: int = 0) -> bytes:
+        """
+        Peek into source (if it supports that), which does not count as read.
+        """
+        with self.report.stage(self.stage):
+            return typing.cast(bytes, getattr(self.source, "peek", lambda _: b"")(size))
+
+    def tell(self) -> int:
+        """
+        Position of the source.
+        """
+        return self.source.tell()
+
+
+class TimedWriter:
+    """
+    Write-only file-like wrapper that attributes the time of every write to a stage and counts the bytes written.
+
+    Every byte written also advances the progress bar.
+    """
+
+    def __init__(
+        self,
+        target: typing.BinaryIO | PayloadWriter,
+        report: TimingReport,
+        stage: str,
+        progress: TqdmProgress = dummy_tqdm,
+    ) -> None:
+        """
+        Wrap 'target', measurements are stored in 'stage' of 'report'.
+        """
+        self.target = target
+        self.report = report
+        self.stage = stage
+        self.progress = progress
+
+    def write(self, data: bytes | memoryview) -> int:
+        """
+        Write to target.
+        """
+        size = memoryview(data).nbytes
+        with self.report.stage(self.stage) as stage:
+            self.target.write(data)
+            stage.bytes += size
+        if size:
+            self.progress.update(size)
+        return size
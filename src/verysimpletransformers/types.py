@@ -7,9 +7,8 @@ import os
 import sys
 import typing
 
-import numpy as np
-
 if typing.TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
     import numpy.typing as npt
     from simpletransformers.classification import (
         ClassificationModel,
@@ -57,6 +56,8 @@ class DummyModel:
         """
         Dummy 'predict' just reverses the string for each input.
         """
+        import numpy as np
+
         return [_[::-1] for _ in to_predict], np.ndarray(0)
 
     def save_model(
@@ -88,6 +89,16 @@ class DummyModel:
         os.system(f"mkdir {output_dir}; " f"cd {output_dir}; " f"touch {' '.join(expected_files)}")  # nosec
 
 
+# ways to store the model data in a `.vst` file, see `payload.py` (defined here since that module imports torch).
+PayloadFormat = typing.Literal["dill", "tensors", "mmap"]
+
+PAYLOAD_FORMATS: tuple[PayloadFormat, ...] = typing.get_args(PayloadFormat)
+DEFAULT_PAYLOAD_FORMAT: PayloadFormat = "dill"
+
+# payload formats that are never compressed:
+UNCOMPRESSED_PAYLOAD_FORMATS: tuple[PayloadFormat, ...] = ("mmap",)
+
+
 @typing.runtime_checkable
 class SimpleTransformerProtocol(typing.Protocol):
     """
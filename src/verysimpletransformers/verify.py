@@ -0,0 +1,108 @@
+"""
+Verify the integrity of `.vst` files without loading (unpickling) the model.
+
+Since MetaHeader version 5, a crc32 checksum of the stored payload is saved in the metadata,
+so a file can be checked at disk speed: nothing has to be decompressed.
+Older files are checked by decompressing the payload (without unpickling it).
+"""
+from __future__ import annotations
+
+import io
+import typing
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from configuraptor.helpers import as_binaryio
+
+from .compression import DEFAULT_CODEC
+from .core import read_metadata
+from .exceptions import CodecError
+from .metadata_schema import Metadata
+from .streams import CHUNK_SIZE, default_workers, open_payload
+from .support import find_vst_files
+from .types import UNCOMPRESSED_PAYLOAD_FORMATS
+
+VerifyResult = tuple[bool, str]
+
+
+def _read_checksum(file: io.BufferedIOBase, length: int) -> tuple[int, int]:
+    """
+    Calculate the crc32 of the next 'length' bytes of a file, returns the checksum and the amount of bytes read.
+    """
+    checksum = size = 0
+    buffer = memoryview(bytearray(CHUNK_SIZE))
+    while size < length and (read := file.readinto(buffer[: min(CHUNK_SIZE, length - size)])):
+        checksum = zlib.crc32(buffer[:read], checksum)
+        size += read
+    return checksum, size
+
+
+def _truncated(size: int, metadata: Metadata) -> str:
+    return f"payload is truncated ({size} of {metadata.content_length} bytes)"
+
+
+def _read_decompressed(file: typing.BinaryIO, metadata: Metadata) -> VerifyResult:
+    """
+    Fallback for files without a checksum: decompress the whole payload, the codecs detect invalid data.
+    """
+    header = metadata.meta_header
+    if getattr(header, "payload_format", None) in UNCOMPRESSED_PAYLOAD_FORMATS:
+        _, size = _read_checksum(typing.cast(io.BufferedIOBase, file), metadata.content_length)
+        if size != metadata.content_length:
+            return False, _truncated(size, metadata)
+        return True, "no checksum, only the size could be checked"
+
+    codec = getattr(header, "codec", None) or DEFAULT_CODEC
+    chunked = bool(getattr(header, "chunk_size", 0))
+    try:
+        with open_payload(file, metadata.content_length, codec, chunked=chunked) as payload:
+            while payload.read(CHUNK_SIZE):
+                pass
+    except CodecError as e:
+        return False, str(e)
+
+    return True, "no checksum, decompressed to verify"
+
+
+def verify_vst(input_file: str | Path | typing.BinaryIO) -> VerifyResult:
+    """
+    Check whether the payload of a .vst file is intact, returns whether it is and a short description.
+    """
+    try:
+        with as_binaryio(input_file) as f:
+            metadata = read_metadata(f)
+            expected = getattr(metadata.meta_header, "checksum", None)
+
+            if expected is None:
+                result = _read_decompressed(f, metadata)
+            else:
+                checksum, size = _read_checksum(typing.cast(io.BufferedIOBase, f), metadata.content_length)
+                if size != metadata.content_length:
+                    return False, _truncated(size, metadata)
+                if checksum != expected:
+                    return False, f"checksum mismatch (expected {expected:08x}, got {checksum:08x})"
+                result = True, "checksum ok"
+
+            if result[0] and f.read(1):
+                return False, "unexpected data after the payload"
+
+            return result
+    except Exception as e:
+        return False, f"invalid file ({type(e).__name__}: {e})"
+
+
+def verify_files(
+    paths: typing.Iterable[str | Path], workers: int | None = None
+) -> typing.Iterator[tuple[Path, bool, str]]:
+    """
+    Verify many files concurrently, directories are searched for .vst files.
+
+    Yields (path, is_valid, description) in the order of the input.
+    """
+
+    def verify(path: Path) -> tuple[Path, bool, str]:
+        return (path, *verify_vst(path))
+
+    with ThreadPoolExecutor(workers or default_workers(), thread_name_prefix="vst-verify") as executor:
+        yield from executor.map(verify, find_vst_files(paths))
@@ -0,0 +1,130 @@
+"""
+Warmup and readiness of a model server.
+
+The first predictions of a freshly loaded model are several times slower than later ones: the allocator still has to
+grow, tokenizers are set up lazily and torch selects its kernels on first use. So before a server answers predictions,
+it runs a few warmup batches of typical sizes and lengths (in a background thread, while it already listens).
+
+Until the warmup is done, GET /readyz and prediction requests answer 503, so a load balancer only sends traffic to
+servers that are ready. GET /healthz answers as soon as the server listens. Neither endpoint touches the model.
+
+Usage:
+    vst serve model.vst --warmup-batch-size 1,32 --warmup-length 16,128 --warmup-rounds 2
+"""
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+import traceback
+import typing
+
+from .bench import DEFAULT_INPUT_LENGTHS, fit_inputs, synthetic_inputs
+
+
+class Warmup(typing.NamedTuple):
+    """
+    Which batches to predict before serving: every combination of batch size and input length (in words), `rounds` \
+        times.
+
+    Inputs are taken from `samples` (e.g. typical queries) or generated.
+    """
+
+    batch_sizes: tuple[int, ...] = (1,)
+    input_lengths: tuple[int, ...] = DEFAULT_INPUT_LENGTHS
+    rounds: int = 1
+    samples: tuple[str, ...] = ()
+
+    def batches(self) -> typing.Iterator[list[str]]:
+        """
+        The inputs of every warmup batch.
+        """
+        for batch_size, length in itertools.product(self.batch_sizes, self.input_lengths):
+            if self.samples:
+                inputs = fit_inputs(self.samples, batch_size, length)
+            else:
+                inputs = synthetic_inputs(batch_size, length or DEFAULT_INPUT_LENGTHS[0], seed=batch_size * length)
+
+            for _ in range(self.rounds):
+                yield inputs
+
+    def run(self, predict: typing.Callable[[list[str]], typing.Any]) -> float:
+        """
+        Predict all warmup batches, returns how long that took (in seconds).
+        """
+        start = time.perf_counter()
+        for inputs in self.batches():
+            predict(inputs)
+        return time.perf_counter() - start
+
+
+class Readiness:
+    """
+    Whether a server is ready to predict: after its warmup is done (or right away without warmup).
+    """
+
+    def __init__(self) -> None:
+        """
+        Not ready until `start` is called.
+        """
+        self._ready = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.error: str | None = None
+        self.warmup_seconds: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether predictions can be served.
+        """
+        return self._ready.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until ready, returns whether it is.
+        """
+        return self._ready.wait(timeout)
+
+    def join(self, timeout: float | None = None) -> None:
+        """
+        Wait until the warmup is done, also when it fails (unlike `wait`).
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def start(
+        self, predict: typing.Callable[[list[str]], typing.Any], warmup: Warmup | None = None
+    ) -> threading.Thread | None:
+        """
+        Run the warmup in a background thread and become ready when it's done, or become ready now without warmup.
+
+        If the warmup fails, the server never becomes ready and the error is shown at /readyz.
+        """
+        self._ready.clear()
+        self.error = None
+        if warmup is None:
+            self._ready.set()
+            return None
+
+        def run() -> None:
+            try:
+                self.warmup_seconds = warmup.run(predict)
+            except Exception as e:
+                traceback.print_exc()
+                self.error = f"{type(e).__name__}: {e}"
+            else:
+                self._ready.set()
+
+        thread = self._thread = threading.Thread(target=run, name="vst-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict[str, typing.Any]:
+        """
+        Readiness as shown by /readyz.
+        """
+        if self.ready:
+            return {"status": "ready", "warmup_seconds": self.warmup_seconds}
+        if self.error:
+            return {"status": "warmup failed", "error": self.error}
+        return {"status": "warming up"}
@@ -1,4 +1,5 @@
 import io
+import time
 import typing
 import zlib
 from pathlib import Path
@@ -75,7 +76,7 @@ def _get_v1_dummy(fp: Path):
         # Train the model
         model.train_model(train_df)
 
-    to_vst(model, fp, compression="zero") # illegal but should automatically be changed to 0 (int)
+    to_vst(model, fp, compression=0)
 
     return model
 
@@ -94,3 +95,14 @@ def _get_corrupted_vst(reason: typing.Literal["pickling", "compression"]):
     write_bundle(output_file, hashbang, metadata, pickled)
 
     return as_binaryio(file, "rb")
+
+
+class RecordingPredict:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls: list[list[str]] = []
+
+    def __call__(self, inputs: list[str]) -> list[str]:
+        self.calls.append(list(inputs))
+        time.sleep(self.delay)
+        return [text[::-1] for text in inputs]
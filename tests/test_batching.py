@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from src.verysimpletransformers.batching import MicroBatcher
+from src.verysimpletransformers.exceptions import DeadlineExceededException, QueueFullException
+from src.verysimpletransformers.metrics import ServerMetrics
+from tests.helpers_for_test import RecordingPredict
+
+
+def test_single_request():
+    predict = RecordingPredict()
+    with MicroBatcher(predict, max_batch=8, max_wait=0) as batcher:
+        assert batcher.predict(["abc", "def"]) == ["cba", "fed"]
+        assert batcher.predict([]) == []
+
+    assert predict.calls == [["abc", "def"]]
+
+
+def test_concurrent_requests_are_merged():
+    predict = RecordingPredict()
+    results: dict[int, list] = {}
+
+    with MicroBatcher(predict, max_batch=64, max_wait=0.5) as batcher:
+
+        def request(idx: int) -> None:
+            results[idx] = batcher.predict([f"{idx}-a", f"{idx}-b"])
+
+        threads = [threading.Thread(target=request, args=(idx,)) for idx in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # every request gets its own slice back:
+    assert results == {idx: [f"{idx}-a"[::-1], f"{idx}-b"[::-1]] for idx in range(16)}
+    # 16 requests of 2 inputs fill one batch of 32 (well within max_wait):
+    assert len(predict.calls) < 16
+    assert sum(map(len, predict.calls)) == 32
+
+
+def test_max_batch():
+    predict = RecordingPredict(delay=0.05)
+
+    with MicroBatcher(predict, max_batch=3, max_wait=0.2) as batcher:
+        futures = [batcher.submit([str(idx)]) for idx in range(7)]
+        big = batcher.submit(["x"] * 5)
+        assert [future.result() for future in futures] == [[str(idx)] for idx in range(7)]
+        assert big.result() == ["x"] * 5
+
+    assert all(len(call) <= 3 for call in predict.calls[:-1])
+    # a request bigger than max_batch is not split:
+    assert predict.calls[-1] == ["x"] * 5
+
+
+def test_errors():
+    def broken(_: list[str]) -> list[str]:
+        raise RuntimeError("model on fire")
+
+    with MicroBatcher(broken, max_wait=0) as batcher, pytest.raises(RuntimeError):
+        batcher.predict(["abc"])
+
+    with MicroBatcher(lambda inputs: inputs[1:], max_wait=0) as batcher, pytest.raises(ValueError):
+        batcher.predict(["abc", "def"])
+
+    with pytest.raises(ValueError):
+        MicroBatcher(broken, max_batch=0)
+
+
+def test_cancelled_requests_are_skipped():
+    predict = RecordingPredict(delay=0.1)
+
+    with MicroBatcher(predict, max_batch=1, max_wait=0) as batcher:
+        first = batcher.submit(["first"])
+        cancelled = batcher.submit(["cancelled"])
+        assert cancelled.cancel()
+        last = batcher.submit(["last"])
+        assert first.result() == ["tsrif"]
+        assert last.result() == ["tsal"]
+
+    assert predict.calls == [["first"], ["last"]]
+
+
+def test_swap_between_batches():
+    old = RecordingPredict(delay=0.2)
+    with MicroBatcher(old, max_batch=4, max_wait=0) as batcher:
+        running = batcher.submit(["abc"])
+        while not old.calls:
+            pass
+
+        # the running batch finishes with the old function:
+        assert batcher.swap(lambda inputs: [text.upper() for text in inputs]) is old
+        assert running.done()
+        assert running.result() == ["cba"]
+        assert batcher.predict(["abc"]) == ["ABC"]
+
+
+def test_bounded_queue():
+    predict = RecordingPredict(delay=0.2)
+    metrics = ServerMetrics()
+
+    with MicroBatcher(predict, max_batch=1, max_wait=0, metrics=metrics, max_queue=2) as batcher:
+        running = batcher.submit(["running"])
+        while not predict.calls:
+            pass
+
+        # the running batch is not queued anymore:
+        queued = [batcher.submit(["a"]), batcher.submit(["b"])]
+        assert batcher.full
+        with pytest.raises(QueueFullException) as e:
+            batcher.predict(["rejected"])
+        assert e.value.retry_after >= 1
+
+        # a stream that was already accepted is not bounded:
+        unbounded = batcher.submit(["c"], bounded=False)
+        assert [future.result() for future in (running, *queued, unbounded)] == [["gninnur"], ["a"], ["b"], ["c"]]
+
+        # a request that is bigger than the whole queue is accepted when nothing else waits:
+        assert batcher.predict(["x", "y", "z"]) == ["x", "y", "z"]
+
+    assert predict.calls == [["running"], ["a"], ["b"], ["c"], ["x", "y", "z"]]
+    assert metrics.rejected.get("queue_full") == 1
+    assert metrics.queued.get() == 0
+
+    with pytest.raises(ValueError):
+        MicroBatcher(predict, max_queue=0)
+
+
+def test_expired_requests_are_dropped():
+    predict = RecordingPredict(delay=0.2)
+    metrics = ServerMetrics()
+
+    with MicroBatcher(predict, max_batch=1, max_wait=0, metrics=metrics) as batcher:
+        first = batcher.submit(["first"])
+        expires = batcher.submit(["expires"], deadline=time.monotonic() + 0.05)
+        patient = batcher.submit(["patient"], deadline=time.monotonic() + 5)
+        expired = batcher.submit(["expired"], deadline=time.monotonic() - 1)
+
+        assert first.result() == ["tsrif"]
+        assert patient.result() == ["tneitap"]
+        for future in (expires, expired):
+            with pytest.raises(DeadlineExceededException):
+                future.result()
+
+    # expired requests never reach the model:
+    assert predict.calls == [["first"], ["patient"]]
+    assert metrics.rejected.get("deadline") == 2
@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+
+import pytest
+
+from src.verysimpletransformers.bench import (
+    BenchModel,
+    BenchResult,
+    PeakMemory,
+    PredictResult,
+    all_compressions,
+    bench_predict,
+    current_rss,
+    default_compressions,
+    fit_inputs,
+    format_results,
+    parse_size,
+    percentile,
+    read_samples,
+    run_benchmark,
+    synthetic_inputs,
+    write_csv,
+    write_json,
+)
+from src.verysimpletransformers.compression import available_codecs
+from src.verysimpletransformers.types import DummyModel
+
+
+def test_parse_size():
+    assert parse_size("10MB") == 10 * 1024 * 1024
+    assert parse_size(" 1.5kb ") == 1536
+    assert parse_size("5GB") == 5 * 1024**3
+    assert parse_size("1024") == parse_size("1024B") == parse_size(1024) == 1024
+
+    with pytest.raises(ValueError):
+        parse_size("ten MB")
+
+
+def test_bench_model():
+    model = BenchModel(150 * 1024 * 1024)
+    assert model.nbytes == 150 * 1024 * 1024
+    assert len(model.weights) == 3  # split like layers
+    assert model.predict(["abc"])[0] == ["cba"]
+
+
+def test_compressions():
+    assert "zlib:1" in default_compressions()
+    assert "zlib:9" in all_compressions()
+    assert len(all_compressions()) > len(default_compressions())
+    assert {c.split(":")[0] for c in default_compressions()} == set(available_codecs())
+
+
+def test_peak_memory():
+    assert current_rss() > 0
+
+    with PeakMemory() as memory:
+        data = bytearray(64 * 1024 * 1024)
+        data[::4096] = b"x" * len(data[::4096])  # touch every page
+
+    assert memory.peak >= memory.start
+    assert memory.delta >= 32 * 1024 * 1024
+    del data
+
+
+def test_run_benchmark(tmp_path):
+    results = list(
+        run_benchmark(
+            sizes=["1MB"],
+            payload_formats=["dill", "tensors", "mmap"],
+            compressions=["zlib:1", "none"],
+            directory=tmp_path,
+            workers=2,
+        )
+    )
+
+    # mmap is always uncompressed, so it only runs once:
+    assert [(r.payload_format, r.codec) for r in results] == [
+        ("dill", "zlib"),
+        ("dill", "none"),
+        ("tensors", "zlib"),
+        ("tensors", "none"),
+        ("mmap", "none"),
+    ]
+    for result in results:
+        assert result.model_size == 1024 * 1024
+        assert result.file_size > 0
+        assert result.save_seconds > 0
+        assert result.load_seconds > 0
+        assert result.save_mb_per_second > 0
+
+    # temporary files are cleaned up:
+    assert not list(tmp_path.iterdir())
+
+    output = io.StringIO()
+    write_csv(results, output)
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+    assert len(rows) == len(results)
+    assert list(rows[0]) == list(BenchResult._fields)
+
+    output = io.StringIO()
+    write_json(results, output)
+    assert json.loads(output.getvalue())[-1]["payload_format"] == "mmap"
+
+
+def test_percentile():
+    values = [float(_) for _ in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values[::-1], 100) == 100
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_inputs(tmp_path):
+    generated = synthetic_inputs(4, 10)
+    assert len(generated) == 4
+    assert all(len(text.split()) == 10 for text in generated)
+    assert synthetic_inputs(4, 10) == generated  # seeded
+
+    samples_file = tmp_path / "samples.txt"
+    samples_file.write_text("short one\n\n  a somewhat longer sample  \n")
+    samples = read_samples(samples_file)
+    assert samples == ["short one", "a somewhat longer sample"]
+
+    assert fit_inputs(samples, 3) == ["short one", "a somewhat longer sample", "short one"]
+    assert fit_inputs(samples, 2, length=3) == ["short one short", "a somewhat longer"]
+
+    with pytest.raises(ValueError):
+        fit_inputs([], 1)
+
+
+class CountingModel(DummyModel):
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, to_predict):
+        self.calls.append(list(to_predict))
+        return super().predict(to_predict)
+
+
+def test_bench_predict():
+    model = CountingModel()
+    results = list(bench_predict(model, batch_sizes=[1, 4], input_lengths=[8], iterations=5, warmup=2))
+
+    assert [(r.batch_size, r.input_length, r.iterations) for r in results] == [(1, 8, 5), (4, 8, 5)]
+    # warmup iterations are not measured, but do call the model:
+    assert len(model.calls) == 2 * (5 + 2)
+    assert [len(batch) for batch in model.calls] == [1] * 7 + [4] * 7
+
+    for result in results:
+        assert result.p50_ms <= result.p95_ms <= result.p99_ms
+        assert result.items_per_second > 0
+
+    samples = list(bench_predict(model, batch_sizes=[2], input_lengths=[0], samples=["as is"], iterations=1))
+    assert samples[0].input_length == 0
+    assert model.calls[-1] == ["as is", "as is"]
+
+    with pytest.raises(ValueError):
+        list(bench_predict(model, iterations=0))
+
+    table = format_results(results)
+    assert table.splitlines()[0].split() == list(PredictResult._fields)
+    assert len(table.splitlines()) == 3
+    assert format_results([]) == ""
+
+    output = io.StringIO()
+    write_json(results, output)
+    assert json.loads(output.getvalue())[1]["batch_size"] == 4
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from src.verysimpletransformers.batching import MicroBatcher
+from src.verysimpletransformers.cache import MISSING, PredictionCache, normalize
+from tests.helpers_for_test import RecordingPredict
+
+
+def test_normalize():
+    assert normalize("  hello \n  world ") == "hello world"
+    assert normalize("café") == normalize("café")
+    assert normalize("Hello") != normalize("hello")
+
+
+def test_only_misses_are_predicted():
+    predict = RecordingPredict()
+    cache = PredictionCache(max_entries=10)
+
+    assert cache.predict(["abc", "def"], predict) == ["cba", "fed"]
+    # cached (after normalization) and duplicate inputs are not predicted again:
+    assert cache.predict(["abc ", "ghi", "ghi", " def"], predict) == ["cba", "ihg", "ihg", "fed"]
+    assert predict.calls == [["abc", "def"], ["ghi"]]
+
+    assert cache.stats() == {
+        "entries": 3,
+        "bytes": cache.bytes,
+        "hits": 2,
+        "misses": 4,
+        "evictions": 0,
+        "hit_rate": 2 / 6,
+    }
+
+    cache.clear()
+    assert not len(cache)
+    assert cache.bytes == 0
+    assert cache.lookup(["abc"]) == [MISSING]
+
+
+def test_lru_eviction():
+    cache = PredictionCache(max_entries=2)
+    cache.store(["a", "b"], ["A", "B"])
+    assert cache.lookup(["a"]) == ["A"]  # 'b' is now least recently used
+    cache.store(["c"], ["C"])
+
+    assert cache.lookup(["a", "b", "c"]) == ["A", MISSING, "C"]
+    assert cache.evictions == 1
+
+    small = PredictionCache(max_bytes=300)
+    small.store(["x" * 10, "y" * 10, "z" * 10], ["1", "2", "3"])
+    assert small.bytes <= 300
+    assert small.lookup(["z" * 10]) == ["3"]
+    assert small.evictions
+
+    # entries bigger than the whole cache are not stored:
+    small.store(["huge"], ["h" * 1000])
+    assert small.lookup(["huge"]) == [MISSING]
+
+
+def test_ttl():
+    cache = PredictionCache(ttl=0.05)
+    cache.store(["a"], ["A"])
+    assert cache.lookup(["a"]) == ["A"]
+    time.sleep(0.1)
+    assert cache.lookup(["a"]) == [MISSING]
+    assert not len(cache)
+
+
+def test_clear_drops_running_predictions():
+    cache = PredictionCache()
+    started, release, cleared = threading.Event(), threading.Event(), threading.Event()
+
+    def old_model(inputs: list[str]) -> list[str]:
+        started.set()
+        release.wait(5)
+        return [f"old:{text}" for text in inputs]
+
+    def predict(inputs: list[str]) -> list[str]:
+        outputs = batcher.predict(inputs)
+        cleared.wait(5)  # the old batch is only stored after the reload cleared the cache
+        return outputs
+
+    def reload() -> None:
+        batcher.swap(lambda inputs: [f"new:{text}" for text in inputs])
+        cache.clear()
+        cleared.set()
+
+    with MicroBatcher(old_model) as batcher:
+        results: list[list[str]] = []
+        requester = threading.Thread(target=lambda: results.append(cache.predict(["abc"], predict)))
+        requester.start()
+        assert started.wait(5)
+        reloader = threading.Thread(target=reload)
+        reloader.start()
+        release.set()
+        requester.join(5)
+        reloader.join(5)
+
+        assert results == [["old:abc"]]
+        assert cache.lookup(["abc"]) == [MISSING]
+        assert cache.predict(["abc"], batcher.predict) == ["new:abc"]
+        assert cache.generation == 1
@@ -0,0 +1,46 @@
+from src.verysimpletransformers.catalog import format_catalog, format_size, scan
+from src.verysimpletransformers.cli import list_catalog
+from src.verysimpletransformers.core import to_vst
+from src.verysimpletransformers.types import DummyModel
+from tests.helpers_for_test import _get_v0_dummy
+
+
+def test_scan(tmp_path, capsys, monkeypatch):
+    to_vst(DummyModel(), tmp_path / "zlib.vst")
+    to_vst(DummyModel(), tmp_path / "mmap.vst", payload_format="mmap")
+    (tmp_path / "old").mkdir()
+    _get_v0_dummy(tmp_path / "old" / "v0.vst")
+    (tmp_path / "broken.vst").write_bytes(b"not a vst file")
+
+    entries = scan([tmp_path], workers=2)
+    by_name = {entry.path.name: entry for entry in entries}
+    assert sorted(by_name) == ["broken.vst", "mmap.vst", "v0.vst", "zlib.vst"]
+
+    assert by_name["broken.vst"].metadata is None
+    assert by_name["broken.vst"].error
+    assert by_name["v0.vst"].metadata.meta_version == 0
+
+    zlib_entry = by_name["zlib.vst"]
+    assert zlib_entry.file_size == (tmp_path / "zlib.vst").stat().st_size
+    assert zlib_entry.metadata.meta_header.codec == "zlib"
+    assert zlib_entry.metadata.content_length < zlib_entry.file_size
+
+    lines = format_catalog(entries).splitlines()
+    assert len(lines) == 5
+    assert lines[0].startswith("file")
+    # all columns are aligned:
+    assert len({line.index(" v5 ") for line in lines if " v5 " in line}) == 1
+
+    monkeypatch.chdir(tmp_path)
+    list_catalog(["."])
+    captured = capsys.readouterr().out
+    assert "zlib.vst" in captured
+    assert "invalid" in captured
+    assert "4 files" in captured
+
+
+def test_format_size():
+    assert format_size(12) == "12 B"
+    assert format_size(2048) == "2.0 KB"
+    assert format_size(5 * 1024**3) == "5.0 GB"
+    assert format_size(3 * 1024**4) == "3.0 TB"
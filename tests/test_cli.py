@@ -45,6 +45,18 @@ def test_show_info(capsys):
 
     assert "error:" not in captured
     assert "verysimpletransformers_version" in captured
+    # only the header is read by default:
+    assert "model loaded properly" not in captured
+
+    show_info("pytest1.vst", load=True)
+    captured = capsys.readouterr().out
+
+    assert "model loaded properly: True" in captured
+
+    show_info("pytest1.vst", load=True, timings=True)
+    captured = capsys.readouterr()
+    assert "unpickle" in captured.err
+    assert "total" in captured.err
 
     file = _get_corrupted_vst(reason="compression")
 
@@ -52,6 +64,13 @@ def test_show_info(capsys):
         show_info(f)
     captured = capsys.readouterr().out
 
+    # without loading, corruption of the model can not be noticed:
+    assert "error:" not in captured
+
+    with _get_corrupted_vst(reason="compression") as f:
+        show_info(f, load=True)
+    captured = capsys.readouterr().out
+
     assert "error:" in captured
     assert "verysimpletransformers_version" in captured
 
@@ -1,28 +1,41 @@
 import io
 import logging
+import struct
 import zlib
 from pathlib import Path
 
+import dill
 import pandas as pd
 import pytest
 import torch.cuda
 from configuraptor import asbytes
 from simpletransformers.classification import ClassificationArgs, ClassificationModel
 
+from src.verysimpletransformers.compression import CODECS, available_codecs, get_codec, parse_compression
 from src.verysimpletransformers.core import (
     _from_vst,
     from_vst,
     from_vst_with_metadata,
+    read_metadata,
+    recompress,
     run_metadata_checks,
     simple_load,
     to_vst,
     upgrade_metadata,
     write_bundle, dump_to_disk,
 )
-from src.verysimpletransformers.exceptions import CorruptedModelException, custom_excepthook
+from src.verysimpletransformers.exceptions import (
+    CodecError,
+    CorruptedModelException,
+    PayloadFormatError,
+    custom_excepthook,
+)
 from src.verysimpletransformers.metadata import compare_versions, get_metadata
-from src.verysimpletransformers.metadata_schema import Metadata, Version
+from src.verysimpletransformers.metadata_schema import Metadata, MetaHeader, Version
+from src.verysimpletransformers.streams import ChunkedReader, ChunkedWriter
 from src.verysimpletransformers.types import DummyModel, SimpleTransformerProtocol
+from src.verysimpletransformers.verify import verify_vst
+from src.verysimpletransformers.versioning import get_version
 from tests.helpers_for_test import _get_v0_dummy, _get_corrupted_vst, _get_v1_dummy
 
 logging.basicConfig(level=logging.INFO)
@@ -33,7 +46,7 @@ transformers_logger.setLevel(logging.WARNING)
 def test_metadata():
     meta = get_metadata(0, 0, "cpu")
 
-    assert repr(meta).startswith("Metadata<v1")
+    assert repr(meta).startswith("Metadata<v5")
 
     valid_meta = meta.meta_header
 
@@ -233,6 +246,137 @@ def test_upgrade():
         assert not upgrade_metadata(upgraded, io.BytesIO())
 
 
+def _downgrade(data: bytes, version: int) -> bytes:
+    """
+    Rewrite the header of a .vst file in an older MetaHeader version, keeping the payload.
+    """
+    source = io.BytesIO(data)
+    metadata = read_metadata(source)
+    payload = source.read()
+
+    old_header = get_version(MetaHeader, version)()
+    for field in old_header._fields:
+        setattr(old_header, field, getattr(metadata.meta_header, field))
+
+    metadata.meta_version = version
+    metadata.meta_length = old_header._get_length()
+    metadata.meta_header = old_header
+
+    return data[: data.index(b"\n") + 1] + metadata._pack() + payload
+
+
+@pytest.mark.parametrize("payload_format", ["dill", "mmap"])
+def test_upgrade_header_only(payload_format, tmp_path, monkeypatch):
+    original = io.BytesIO()
+    to_vst(DummyModel(), original, compression="zlib:5", payload_format=payload_format, chunk_size=64)
+    original.seek(0)
+    original_header = read_metadata(original).meta_header
+    old_data = _downgrade(original.getvalue(), 4)
+
+    fp = tmp_path / "model.vst"
+    fp.write_bytes(old_data)
+    fp.chmod(0o755)
+
+    def fail(*_, **__):
+        raise AssertionError("a header-only upgrade should not load the model")
+
+    monkeypatch.setattr("src.verysimpletransformers.core.to_vst", fail)
+    monkeypatch.setattr("src.verysimpletransformers.core.load_compressed_stream", fail)
+
+    # in place:
+    assert upgrade_metadata(fp, fp)
+    monkeypatch.undo()
+
+    assert fp.stat().st_mode & 0o777 == 0o755
+    assert [p.name for p in tmp_path.iterdir()] == ["model.vst"]
+
+    with fp.open("rb") as f:
+        metadata = read_metadata(f)
+        payload = f.read()
+
+    assert metadata.meta_version == 5
+    for field in ("payload_format", "codec", "compression_level", "chunk_size", "chunk_count"):
+        assert getattr(metadata.meta_header, field) == getattr(original_header, field)
+    assert metadata.content_length == len(payload)
+    assert verify_vst(fp) == (True, "checksum ok")
+
+    if payload_format == "dill":
+        # compressed payload is copied byte for byte:
+        assert old_data.endswith(payload)
+        assert metadata.meta_header.chunk_count > 1
+
+    model, _, valid_meta = from_vst_with_metadata(fp)
+    assert valid_meta
+    assert model.predict(["something"])[0][0] == "gnihtemos"
+
+    # truncated payload:
+    with pytest.raises(CorruptedModelException):
+        upgrade_metadata(io.BytesIO(old_data[:-10]), io.BytesIO())
+
+    # full upgrade still re-saves the model with a different compression:
+    full = io.BytesIO()
+    assert upgrade_metadata(io.BytesIO(old_data), full, compression="none", full=True)
+    full.seek(0)
+    assert read_metadata(full).meta_header.codec == "none"
+
+
+@pytest.mark.parametrize("compression", available_codecs() + ["zlib:9"])
+@pytest.mark.parametrize("chunk_size", [0, 64])
+def test_recompress(compression, chunk_size, monkeypatch):
+    original = io.BytesIO()
+    to_vst(DummyModel(), original, compression="zlib:1", payload_format="tensors")
+
+    def fail(*_, **__):
+        raise AssertionError("recompress should not (un)pickle the model")
+
+    monkeypatch.setattr("src.verysimpletransformers.payload.dump_payload", fail)
+    monkeypatch.setattr("src.verysimpletransformers.payload.get_unpickler", fail)
+
+    output = io.BytesIO()
+    metadata = recompress(io.BytesIO(original.getvalue()), output, compression=compression, chunk_size=chunk_size)
+    monkeypatch.undo()
+
+    codec, level = parse_compression(compression)
+    assert metadata.meta_header.codec == codec.name
+    assert metadata.meta_header.compression_level == level
+    assert metadata.meta_header.chunk_size == chunk_size
+    assert metadata.meta_header.payload_format == "tensors"
+
+    data = output.getvalue()
+    assert verify_vst(io.BytesIO(data)) == (True, "checksum ok")
+
+    model, new_metadata, valid_meta = from_vst_with_metadata(io.BytesIO(data))
+    assert valid_meta
+    assert new_metadata.content_length == metadata.content_length
+    assert model.predict(["something"])[0][0] == "gnihtemos"
+
+
+def test_recompress_file(tmp_path):
+    fp = tmp_path / "model.vst"
+    _get_v0_dummy(fp)
+
+    # old header is upgraded along the way, in place:
+    metadata = recompress(fp, fp, compression=9, chunk_size=0)
+    assert metadata.meta_version == 5
+    assert [p.name for p in tmp_path.iterdir()] == ["model.vst"]
+
+    with fp.open("rb") as f:
+        assert read_metadata(f).meta_header.compression_level == 9
+
+    assert from_vst(fp).predict(["something"])[0][0] == "gnihtemos"
+
+    with pytest.raises(ValueError):
+        recompress(fp, tmp_path / "other.vst", chunk_size=-1)
+
+    mmap = io.BytesIO()
+    to_vst(DummyModel(), mmap, payload_format="mmap")
+    with pytest.raises(ValueError):
+        recompress(io.BytesIO(mmap.getvalue()), io.BytesIO())
+
+    with _get_corrupted_vst(reason="compression") as f, pytest.raises(CorruptedModelException):
+        recompress(f, io.BytesIO())
+
+
 def remove_everything(path: Path):
     if path.is_dir():
         for child in path.iterdir():
@@ -266,4 +410,226 @@ def test_custom_excepthook(capsys):
 
     assert "" in captured.out
     assert "ValueError:" in captured.err
-    assert "catch" in captured.err
\ No newline at end of file
+    assert "catch" in captured.err
+
+
+def test_streaming_write():
+    model = DummyModel()
+
+    output = io.BytesIO()
+    to_vst(model, output, compression=5, chunk_size=0)
+
+    data = output.getvalue()
+    hashbang, rest = data.split(b"\n", 1)
+    assert hashbang == b"#!/usr/bin/env verysimpletransformers"
+
+    _, meta_length, content_length = struct.unpack("H H Q", rest[:16])
+    payload = rest[16 + meta_length :]
+
+    # content length was patched in after streaming and the payload is still one zlib stream:
+    assert content_length == len(payload)
+    assert zlib.decompress(payload) == dill.dumps(model)
+
+    new_model = from_vst(output)
+    assert new_model.predict(["streaming"])[0][0] == "gnimaerts"
+
+
+def test_streaming_load():
+    model = DummyModel()
+    model.weights = torch.rand(1024, 1024)  # 4 MB, so multiple chunks are needed
+
+    output = io.BytesIO()
+    to_vst(model, output, compression=1)
+
+    new_model = from_vst(output)
+    assert torch.equal(new_model.weights, model.weights)
+
+    truncated = io.BytesIO(output.getvalue()[:-1024])
+    with pytest.raises(CorruptedModelException) as e:
+        from_vst(truncated)
+
+    assert e.value.reason == "compression"
+
+
+def test_chunked_payload():
+    model = DummyModel()
+    model.weights = torch.rand(1024, 1024)  # 4 MB
+
+    output = io.BytesIO()
+    to_vst(model, output, compression="zlib:1", chunk_size=1024 * 1024, workers=4)
+
+    _, meta, _ = from_vst_with_metadata(output, workers=2)
+    assert meta.meta_header.chunk_size == 1024 * 1024
+    assert meta.meta_header.chunk_count == 5
+
+    # every chunk is an independent zlib stream, prefixed with its size:
+    payload = io.BytesIO(output.getvalue()[-meta.content_length :])
+    chunks = []
+    while size_bytes := payload.read(8):
+        (size,) = struct.unpack("<Q", size_bytes)
+        chunks.append(zlib.decompress(payload.read(size)))
+
+    assert len(chunks) == 5
+    assert all(len(chunk) == 1024 * 1024 for chunk in chunks[:-1])
+    assert b"".join(chunks) == dill.dumps(model)
+
+    new_model = from_vst(output, workers=3)
+    assert torch.equal(new_model.weights, model.weights)
+
+    truncated = io.BytesIO(output.getvalue()[:-1024])
+    with pytest.raises(CorruptedModelException) as e:
+        from_vst(truncated)
+
+    assert e.value.reason == "compression"
+
+    with pytest.raises(ValueError):
+        to_vst(model, io.BytesIO(), chunk_size=-1)
+
+
+def test_chunked_writer_memory_is_bounded():
+    data = bytes(range(256)) * 256  # 64 KB
+    output = io.BytesIO()
+    writer = ChunkedWriter(output, 1, chunk_size=1024, workers=32, max_pending_bytes=4096)
+    peak = 0
+    for start in range(0, len(data), 1000):
+        writer.write(data[start : start + 1000])
+        peak = max(peak, writer._pending_bytes)
+    writer.finish()
+
+    # 32 workers would allow 64 pending chunks, the byte limit keeps it at 4:
+    assert peak <= 4096
+    assert writer.chunk_count == 64
+    assert ChunkedReader(io.BytesIO(output.getvalue()), writer.bytes_out).read() == data
+
+
+def test_tensor_payload():
+    model = DummyModel()
+    model.weights = torch.rand(512, 1024)
+    model.tied = model.weights  # shared storage should only be stored once
+    model.view = model.weights[1:3]
+    model.untyped = torch.arange(10, dtype=torch.int64).untyped_storage()
+
+    output = io.BytesIO()
+    to_vst(model, output, compression=1, payload_format="tensors")
+
+    new_model, metadata, valid_meta = from_vst_with_metadata(output)
+    assert valid_meta
+    assert metadata.meta_header.payload_format == "tensors"
+
+    assert torch.equal(new_model.weights, model.weights)
+    assert new_model.tied is new_model.weights
+    assert new_model.view.untyped_storage().data_ptr() == new_model.weights.untyped_storage().data_ptr()
+    assert torch.equal(new_model.view, model.view)
+    assert bytes(new_model.untyped) == bytes(model.untyped)
+
+    # the tensor data is not pickled, so it should only be there once:
+    legacy = io.BytesIO()
+    to_vst(model, legacy, compression=0, payload_format="dill")
+    uncompressed = io.BytesIO()
+    to_vst(model, uncompressed, compression=0, payload_format="tensors")
+    assert len(uncompressed.getvalue()) < len(legacy.getvalue())
+
+
+def test_unknown_payload_format():
+    output = io.BytesIO()
+    to_vst(DummyModel(), output, payload_format="tensors")
+
+    # e.g. a file written by a newer version:
+    written = output.getvalue().replace(b"tensors", b"arrow\0\0", 1)
+    with pytest.raises(PayloadFormatError, match="Unknown payload format 'arrow'"):
+        from_vst(io.BytesIO(written))
+
+
+def test_mmap_payload(tmp_path: Path):
+    model = DummyModel()
+    model.weights = torch.rand(256, 1024)
+    model.bias = torch.rand(7)
+    model.empty = torch.empty(0)
+
+    fp = tmp_path / "mmap.vst"
+    to_vst(model, fp, compression=9, payload_format="mmap")
+
+    mapped, metadata, _ = from_vst_with_metadata(fp, device="cpu", mmap=True)
+    assert metadata.meta_header.payload_format == "mmap"
+    assert metadata.meta_header.compression_level == 0  # mmap payload is never compressed
+
+    assert torch.equal(mapped.weights, model.weights)
+    assert torch.equal(mapped.bias, model.bias)
+    assert mapped.empty.numel() == 0
+    # tensor data is page aligned in the file (and the memory map starts at a page):
+    assert mapped.weights.data_ptr() % 4096 == 0
+    assert mapped.bias.data_ptr() % 4096 == 0
+
+    # copy-on-write: changing the model does not change the file
+    mapped.weights.zero_()
+    assert torch.equal(from_vst(fp, mmap=True).weights, model.weights)
+
+    # regular load (without mmap) also works:
+    assert torch.equal(from_vst(fp).bias, model.bias)
+
+    # in-memory file uses the buffer of the BytesIO:
+    in_memory = io.BytesIO(fp.read_bytes())
+    assert torch.equal(from_vst(in_memory, device="cpu", mmap=True).weights, model.weights)
+
+    with pytest.warns(UserWarning):
+        from_vst("pytest1.vst", mmap=True)
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib:9", "7", "zstd", "zstd:19", "lz4", "lz4:16"])
+def test_codecs(compression):
+    if not CODECS.get(compression.partition(":")[0], get_codec("none")).available:
+        pytest.skip(f"{compression} is not installed")
+
+    model = DummyModel()
+    model.weights = torch.zeros(256, 1024)
+
+    output = io.BytesIO()
+    to_vst(model, output, compression=compression, payload_format="tensors")
+
+    codec, level = parse_compression(compression)
+
+    new_model, metadata, valid_meta = from_vst_with_metadata(output)
+    assert valid_meta
+    assert metadata.meta_header.codec == codec.name
+    assert metadata.meta_header.compression_level == level
+    assert torch.equal(new_model.weights, model.weights)
+
+    if codec.name == "none":
+        # stored as-is: at least the size of the tensor
+        assert metadata.content_length > 256 * 1024 * 4
+    else:
+        assert metadata.content_length < 256 * 1024
+
+
+def test_parse_compression():
+    assert parse_compression(5) == (get_codec("zlib"), 5)
+    assert parse_compression(True) == (get_codec("zlib"), 1)
+    assert parse_compression(42) == (get_codec("zlib"), 9)
+    assert parse_compression("ZSTD:99") == (get_codec("zstd"), 22)
+    assert parse_compression("none") == (get_codec("none"), 0)
+
+    assert parse_compression("zstd:") == (get_codec("zstd"), 3)
+
+    # invalid values are rejected instead of falling back to another compression:
+    for invalid in ("zero", "zsdt", "zstd:abc", "zlib:-1"):
+        with pytest.raises(CodecError):
+            parse_compression(invalid)
+
+    with pytest.raises(CodecError):
+        get_codec("zero")
+
+    assert "zlib" in available_codecs()
+
+
+def test_corrupted_codec():
+    pytest.importorskip("zstandard")
+    model = DummyModel()
+
+    output = io.BytesIO()
+    to_vst(model, output, compression="zstd")
+
+    truncated = io.BytesIO(output.getvalue()[:-10])
+    with pytest.raises(CorruptedModelException) as e:
+        from_vst(truncated)
+
+    assert e.value.reason == "compression"
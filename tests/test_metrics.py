@@ -0,0 +1,77 @@
+import time
+
+from src.verysimpletransformers.metrics import Counter, Gauge, Histogram, Registry, ServerMetrics
+
+
+def test_counter_and_gauge():
+    counter = Counter("requests_total", "Requests.", "status")
+    counter.inc(label="200")
+    counter.inc(2, label="200")
+    counter.inc(label="404")
+    assert counter.get("200") == 3
+    assert counter.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{status="200"} 3\n'
+        'requests_total{status="404"} 1'
+    )
+
+    gauge = Gauge("in_flight", "In flight.")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.render().endswith("\nin_flight 1")
+    assert Gauge("computed", "Computed.", lambda: 2.5).get() == 2.5
+
+
+def test_histogram():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), label="stage")
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value, "predict")
+
+    assert histogram.count("predict") == 4
+    assert histogram.sum("predict") == 5.65
+    assert histogram.samples() == [
+        'latency_seconds_bucket{stage="predict",le="0.1"} 2',
+        'latency_seconds_bucket{stage="predict",le="1"} 3',
+        'latency_seconds_bucket{stage="predict",le="+Inf"} 4',
+        'latency_seconds_sum{stage="predict"} 5.65',
+        'latency_seconds_count{stage="predict"} 4',
+    ]
+
+    registry = Registry()
+    registry.register(histogram)
+    registry.register(Counter("other_total", "Other."))
+    assert registry.render().endswith("other_total 0\n")
+
+
+def test_server_metrics():
+    metrics = ServerMetrics()
+    metrics.record_batch(8, 0.01)
+    metrics.record_batch(2, 0.02)
+    with metrics.stage("parse"):
+        time.sleep(0.001)
+
+    assert metrics.items.get() == 10
+    assert metrics.batch_size.count() == 2
+    assert metrics.stages.count("predict") == 2
+    assert metrics.stages.sum("parse") >= 0.001
+    assert metrics.recent_rate() > 0
+    assert metrics.rss.get() > 0
+
+    rendered = metrics.render()
+    for name in ("vst_requests_total", "vst_request_stage_seconds_bucket", "vst_batch_size_count",
+                 "vst_predicted_items_per_second", "process_resident_memory_bytes", "vst_requests_in_flight"):
+        assert name in rendered
+
+
+def test_recent_batches_are_bounded():
+    metrics = ServerMetrics(rate_window=0.05)
+    for _ in range(10):
+        metrics.record_batch(1, 0.001)
+    time.sleep(0.1)
+
+    # without any scrape, old batches are dropped when new ones are recorded:
+    metrics.record_batch(1, 0.001)
+    assert len(metrics._recent) == 1
+    assert metrics.items.get() == 11
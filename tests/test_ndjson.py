@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from src.verysimpletransformers.ndjson import (
+    InvalidLine,
+    LineDecoder,
+    LineTooLong,
+    batches,
+    chunk,
+    encode_lines,
+    is_json_lines,
+    iter_body,
+    valid_inputs,
+)
+
+
+def test_line_decoder():
+    decoder = LineDecoder(json_lines=True)
+    assert decoder.feed(b'"first"\n"sec') == ["first"]
+    second, invalid = decoder.feed(b'ond"\n\n{bad\n')
+    assert second == "second"
+    assert isinstance(invalid, InvalidLine)
+    assert invalid.error.startswith("Invalid JSON")
+    assert decoder.feed(b'"last"') == []
+    assert decoder.finish() == ["last"]
+    assert decoder.finish() == []
+
+    text = LineDecoder(json_lines=False)
+    assert text.feed(b"plain text\r\nmore") == ["plain text"]
+    assert text.finish() == ["more"]
+
+    # lines are bounded, also when they arrive in many small blocks:
+    bounded = LineDecoder(json_lines=False, max_line=10)
+    assert bounded.feed(b"0123456789\n01234") == ["0123456789"]
+    with pytest.raises(LineTooLong):
+        bounded.feed(b"56789x")
+    with pytest.raises(LineTooLong):
+        LineDecoder(json_lines=False, max_line=10).feed(b"a\n" + b"x" * 11 + b"\nb")
+
+    assert is_json_lines("application/x-ndjson; charset=utf-8")
+    assert not is_json_lines("text/plain")
+    assert not is_json_lines(None)
+
+
+def test_encode():
+    items = ["a", InvalidLine("broken"), "b"]
+    assert valid_inputs(items) == ["a", "b"]
+    assert encode_lines(items, ["A", "B"]) == b'"A"\n{"error": "broken"}\n"B"\n'
+    assert list(batches(list("abcde"), 2)) == [["a", "b"], ["c", "d"], ["e"]]
+    assert chunk(b"x" * 26) == b"1A\r\n" + b"x" * 26 + b"\r\n"
+
+
+def test_iter_body():
+    body = io.BufferedReader(io.BytesIO(b"4\r\nabcd\r\n3;ext=1\r\nefg\r\n0\r\nTrailer: x\r\n\r\nnext request"))
+    assert b"".join(iter_body(body, {"Transfer-Encoding": "chunked"})) == b"abcdefg"
+    assert body.read() == b"next request"
+
+    body = io.BufferedReader(io.BytesIO(b"0123456789"))
+    assert b"".join(iter_body(body, {"Content-Length": "4"})) == b"0123"
+    assert list(iter_body(body, {})) == []
@@ -0,0 +1,179 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import torch
+
+from src.verysimpletransformers.exceptions import UnknownModelException
+from src.verysimpletransformers.pool import ModelPool, model_memory, split_model_path
+from src.verysimpletransformers.types import DummyModel
+from src.verysimpletransformers.warmup import Warmup
+
+
+class NamedModel(DummyModel):
+    def __init__(self, filename: str):
+        self.name = Path(filename).stem
+        self.predicted: list[str] = []
+
+    def predict(self, to_predict):
+        self.predicted.extend(to_predict)
+        outputs, probabilities = super().predict(to_predict)
+        return [f"{self.name}:{output}" for output in outputs], probabilities
+
+
+class RecordingLoad:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls: list[str] = []
+
+    def __call__(self, filename: str) -> NamedModel:
+        self.calls.append(Path(filename).stem)
+        time.sleep(self.delay)
+        if "broken" in filename:
+            raise ValueError("corrupted")
+        return NamedModel(filename)
+
+
+@pytest.fixture()
+def models_dir(tmp_path: Path) -> Path:
+    # without tensors, the file size is used as memory usage:
+    for name in ("a", "b", "c", "broken"):
+        (tmp_path / f"{name}.vst").write_bytes(b"x" * 100)
+    (tmp_path / "notes.txt").write_text("not a model")
+    return tmp_path
+
+
+def test_split_model_path():
+    assert split_model_path("/models/a/predict?query=x/y") == ("a", "/predict?query=x/y")
+    assert split_model_path("/models/a/predict/stream") == ("a", "/predict/stream")
+    assert split_model_path("/models/a") == ("a", "/")
+    assert split_model_path("/models") == (None, "/models")
+    assert split_model_path("/?query=x") == (None, "/?query=x")
+
+
+def test_model_memory(tmp_path: Path):
+    model = DummyModel()
+    model.model = torch.nn.Linear(10, 10)
+    shared = torch.zeros(25)
+    model.weights = {"first": shared, "view": shared[5:]}  # same storage, counted once
+    assert model_memory(model, "unused") == (100 + 10 + 25) * 4
+
+    (tmp_path / "empty.vst").write_bytes(b"x" * 42)
+    assert model_memory(DummyModel(), tmp_path / "empty.vst") == 42
+
+
+def test_pool_loads_on_first_use_and_evicts_lru(models_dir: Path):
+    load = RecordingLoad()
+    pool = ModelPool(models_dir, memory_budget=250, load=load)
+    assert pool.available() == ["a", "b", "broken", "c"]
+    assert pool.stats()["loaded"] == {}
+
+    with pool.using("a") as model:
+        assert model.predict(["abc"]) == ["a:cba"]
+    with pool.using("a"), pool.using("b"):
+        pass
+    assert load.calls == ["a", "b"]
+
+    # c exceeds the budget, a is the least recently used:
+    pool.acquire("a").release()
+    with pool.using("c"):
+        pass
+    assert list(pool.stats()["loaded"]) == ["a", "c"]
+    assert pool.evictions == 1
+    assert pool.bytes == 200
+
+    # models that are in use are never evicted, the budget is exceeded until they are released:
+    with pool.using("a"), pool.using("c"), pool.using("b"):
+        assert pool.bytes == 300
+    assert pool.bytes <= 250
+    assert load.calls == ["a", "b", "c", "b"]
+
+    pool.close()
+    assert pool.stats()["loaded"] == {}
+
+
+def test_pool_evicts_before_loading(models_dir: Path):
+    loaded_during_load: list[list[str]] = []
+
+    def load(filename: str) -> NamedModel:
+        loaded_during_load.append(list(pool.stats()["loaded"]))
+        return NamedModel(filename)
+
+    pool = ModelPool(models_dir, memory_budget=250, load=load)
+    for name in ("a", "b", "c"):
+        pool.acquire(name).release()
+
+    # a was unloaded before c was loaded (by its file size), so the budget was never exceeded:
+    assert loaded_during_load == [[], ["a"], ["b"]]
+    assert list(pool.stats()["loaded"]) == ["b", "c"]
+    pool.close()
+
+
+def test_pool_deduplicates_loads(models_dir: Path):
+    load = RecordingLoad(delay=0.2)
+    pool = ModelPool(models_dir, load=load)
+
+    results = []
+
+    def use():
+        with pool.using("a") as model:
+            results.append(model)
+
+    threads = [threading.Thread(target=use) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert load.calls == ["a"]
+    assert len(results) == 5
+    assert len(set(map(id, results))) == 1
+    assert pool.stats()["loaded"] == {"a": {"bytes": 100, "users": 0}}
+    pool.close()
+
+
+def test_pool_errors(models_dir: Path):
+    load = RecordingLoad()
+    pool = ModelPool(models_dir, load=load)
+
+    for name in ("missing", "../a", ".hidden", "notes"):
+        with pytest.raises(UnknownModelException):
+            pool.acquire(name)
+
+    # a failed load is not cached, the next request tries again:
+    for _ in range(2):
+        with pytest.raises(ValueError, match="corrupted"):
+            pool.acquire("broken")
+    assert load.calls == ["broken", "broken"]
+    assert pool.stats()["loaded"] == {}
+
+
+def test_pool_keeps_model_over_budget(models_dir: Path):
+    load = RecordingLoad()
+    pool = ModelPool(models_dir, memory_budget=50, load=load)
+
+    # a alone exceeds the budget, but is kept as the most recently used model instead of reloading it every time:
+    with pytest.warns(UserWarning, match="exceeds the memory budget"):
+        pool.acquire("a").release()
+    pool.acquire("a").release()
+    assert load.calls == ["a"]
+    assert list(pool.stats()["loaded"]) == ["a"]
+
+    with pytest.warns(UserWarning), pool.using("b"):
+        pass
+    assert list(pool.stats()["loaded"]) == ["b"]
+    assert pool.evictions == 1
+    pool.close()
+
+
+def test_pool_warms_up_on_load(models_dir: Path):
+    pool = ModelPool(models_dir, load=RecordingLoad(), warmup=Warmup(batch_sizes=(1, 2), input_lengths=(3,)))
+
+    with pool.using("a") as model:
+        # warmed up (1 + 2 inputs) before the first request:
+        assert len(model.model.predicted) == 3
+        model.predict(["abc"])
+    with pool.using("a") as model:
+        assert len(model.model.predicted) == 4  # only when it's loaded
+    pool.close()
@@ -0,0 +1,91 @@
+import os
+import time
+
+import pytest
+import requests
+import torch
+
+from src.verysimpletransformers.exceptions import WorkersCrashingException
+from src.verysimpletransformers.prefork import PreforkServer, cpu_slices, load_shared, model_tensors, share_model_memory
+from src.verysimpletransformers.types import DummyModel
+
+
+class TorchModel(DummyModel):
+    def __init__(self):
+        self.model = torch.nn.Linear(8, 2)
+        self.weights = {"extra": torch.ones(4)}
+        self.name = "not a tensor"
+
+
+def test_cpu_slices():
+    assert cpu_slices(2, [0, 1, 2, 3]) == [[0, 1], [2, 3]]
+    assert cpu_slices(3, [0, 1, 2, 3]) == [[0, 1], [2], [3]]
+    assert cpu_slices(3, [4, 5]) == [[4], [5], [4]]
+
+    slices = cpu_slices(1)
+    assert len(slices) == 1
+    assert slices[0]
+
+    with pytest.raises(ValueError):
+        cpu_slices(0)
+
+
+def test_share_model_memory():
+    model = TorchModel()
+    assert len(list(model_tensors(model))) == 3  # weight, bias and extra
+
+    assert share_model_memory(model) == (8 * 2 + 2 + 4) * 4
+    assert all(tensor.is_shared() for tensor in model_tensors(model))
+    # already shared:
+    assert share_model_memory(model) == 0
+    assert share_model_memory(DummyModel()) == 0
+
+
+def test_load_shared():
+    model, name = load_shared("pytest1.vst")
+    assert name == "pytest1.vst"
+    assert all(tensor.is_shared() for tensor in model_tensors(model))
+
+    model, _ = load_shared(TorchModel())
+    assert all(tensor.is_shared() for tensor in model_tensors(model))
+
+
+def test_prefork_server():
+    server = PreforkServer("localhost", 0, workers=2)
+    server.start(TorchModel())
+    try:
+        assert len(server.pids) == 2
+        host, port = server.sock.getsockname()[:2]
+        for _ in range(4):
+            resp = requests.get(f"http://{host}:{port}?query=forked", timeout=5)
+            assert resp.json() == ["dekrof"]
+    finally:
+        pids = list(server.pids)
+        server.stop()
+
+    assert not server.pids
+    assert server.sock is None
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+class FailingServer(PreforkServer):
+    def _run_worker(self, *_):
+        raise ValueError("bad port")
+
+
+def test_prefork_server_gives_up_on_crash_loop():
+    server = FailingServer("localhost", 0, workers=2, max_crashes=3, restart_delay=0.05)
+    server.start(TorchModel())
+    started = time.monotonic()
+    try:
+        with pytest.raises(WorkersCrashingException):
+            server.wait(TorchModel())
+    finally:
+        server.stop()
+
+    # restarted with a growing delay (0.05 + 0.1 + 0.2), not in a tight loop, and not anymore after the 4th crash:
+    assert time.monotonic() - started >= 0.35
+    assert len(server.crashes) == 4
+    assert not server.pids
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import torch
+
+from src.verysimpletransformers.batching import MicroBatcher
+from src.verysimpletransformers.reload import ModelReloader, file_version, release_model
+from src.verysimpletransformers.serve import predict_with
+from src.verysimpletransformers.types import DummyModel
+from src.verysimpletransformers.warmup import Readiness, Warmup
+
+
+class VersionedModel(DummyModel):
+    def __init__(self, version: str):
+        self.version = version
+        self.weights = torch.ones(100)
+        self.predicted: list[str] = []
+
+    def predict(self, to_predict):
+        self.predicted.extend(to_predict)
+        outputs, probabilities = super().predict(to_predict)
+        return [f"{self.version}:{output}" for output in outputs], probabilities
+
+
+def load_version(filename: str) -> VersionedModel:
+    version = Path(filename).read_text()
+    if version == "broken":
+        raise ValueError("corrupted")
+    return VersionedModel(version)
+
+
+def wait_for(reloader: ModelReloader) -> None:
+    deadline = time.monotonic() + 5
+    while reloader.reloading and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_file_version(tmp_path: Path):
+    path = tmp_path / "model.vst"
+    assert file_version(str(path)) is None
+    path.write_text("v1")
+    first = file_version(str(path))
+    path.write_text("v22")
+    assert file_version(str(path)) != first
+
+
+def test_release_model():
+    model = VersionedModel("v1")
+    model.model = torch.nn.Linear(4, 4)
+    release_model(model)
+    assert model.weights.numel() == 0
+    assert all(parameter.numel() == 0 for parameter in model.model.parameters())
+
+
+def test_reload(tmp_path: Path):
+    path = tmp_path / "model.vst"
+    path.write_text("v1")
+    model = load_version(str(path))
+    swapped = threading.Event()
+
+    reloader = ModelReloader(str(path), load=load_version, watch_interval=None)
+    with MicroBatcher(lambda inputs: predict_with(model, inputs)) as batcher:
+        # not started yet:
+        assert not reloader.reload()
+
+        reloader.start(model, batcher, warmup=Warmup(input_lengths=(2,)), on_swap=swapped.set)
+        assert batcher.predict(["abc"]) == ["v1:cba"]
+
+        path.write_text("v2")
+        assert reloader.reload()
+        wait_for(reloader)
+        assert swapped.is_set()
+        assert batcher.predict(["abc"]) == ["v2:cba"]
+        assert reloader.model.predicted[-1] == "abc"
+        assert len(reloader.model.predicted) == 2  # one warmup input
+        # the memory of the old version was released:
+        assert model.weights.numel() == 0
+
+        # a version that can't be loaded keeps the current one serving:
+        path.write_text("broken")
+        reloader.request()
+        wait_for(reloader)
+        assert batcher.predict(["abc"]) == ["v2:cba"]
+        assert reloader.status() == {
+            "filename": str(path),
+            "reloads": 1,
+            "reloading": False,
+            "error": "ValueError: corrupted",
+        }
+
+        reloader.stop()
+
+
+def test_reload_waits_for_startup_warmup(tmp_path: Path):
+    path = tmp_path / "model.vst"
+    path.write_text("v1")
+    model = load_version(str(path))
+    unblock = threading.Event()
+
+    def blocked_predict(inputs: list[str]) -> list[str | int]:
+        unblock.wait(5)
+        return predict_with(model, inputs)
+
+    readiness = Readiness()
+    reloader = ModelReloader(str(path), load=load_version, watch_interval=None)
+    with MicroBatcher(lambda inputs: predict_with(model, inputs)) as batcher:
+        # the startup warmup still predicts with the first model:
+        readiness.start(blocked_predict, Warmup(input_lengths=(2,)))
+        reloader.start(model, batcher, readiness=readiness)
+
+        path.write_text("v2")
+        assert reloader.reload()
+        deadline = time.monotonic() + 5
+        while reloader.reloads < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # swapped, but the old version is not released while the warmup uses it:
+        assert batcher.predict(["abc"]) == ["v2:cba"]
+        assert reloader.reloading
+        assert model.weights.numel() == 100
+
+        unblock.set()
+        wait_for(reloader)
+        assert readiness.ready
+        assert model.weights.numel() == 0
+        reloader.stop()
+
+
+def test_watch(tmp_path: Path):
+    path = tmp_path / "model.vst"
+    path.write_text("v1")
+    model = load_version(str(path))
+
+    reloader = ModelReloader(str(path), load=load_version, watch_interval=0.02)
+    with MicroBatcher(lambda inputs: predict_with(model, inputs)) as batcher:
+        reloader.start(model, batcher)
+
+        # replaced atomically, like a deploy would:
+        (tmp_path / "model.vst.tmp").write_text("v2")
+        os.replace(tmp_path / "model.vst.tmp", path)
+
+        deadline = time.monotonic() + 5
+        while reloader.reloads < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert batcher.predict(["abc"]) == ["v2:cba"]
+        reloader.stop()
@@ -1,11 +1,35 @@
+import asyncio
+import functools
+import http.client
 import http.server
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 
 import pytest
 import requests
 
 from src.verysimpletransformers import from_vst
-from src.verysimpletransformers.serve import MachineLearningModelHandler
+from src.verysimpletransformers.batching import MicroBatcher
+from src.verysimpletransformers.cache import PredictionCache
+from src.verysimpletransformers.ndjson import LAST_CHUNK, MAX_LINE_BYTES, chunk
+from src.verysimpletransformers.pool import ModelPool
+from src.verysimpletransformers.reload import ModelReloader
+from src.verysimpletransformers.serve import (
+    DEADLINE_HEADER,
+    AsyncModelServer,
+    MachineLearningModelHandler,
+    MachineLearningModelServer,
+)
+from src.verysimpletransformers.types import DummyModel
+from src.verysimpletransformers.warmup import Warmup
+
+from tests.helpers_for_test import RecordingPredict
+from tests.test_pool import RecordingLoad
+from tests.test_reload import load_version, wait_for
 
 
 @pytest.fixture(scope="module")
@@ -56,3 +80,608 @@ def test_custom_server_response():
     resp = requests.post("http://localhost:8000?query=added", json="something", timeout=5)
     assert resp.status_code == 200
     assert resp.json()
+
+
+def test_batched_server():
+    predict = RecordingPredict()
+    with MicroBatcher(predict, max_batch=16, max_wait=0.2) as batcher:
+        handler = MachineLearningModelHandler.bind(DummyModel(), batcher)
+        httpd = http.server.ThreadingHTTPServer(("localhost", 0), handler)
+        url = f"http://localhost:{httpd.server_address[1]}"
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(lambda idx: requests.post(url, json=[f"{idx}", "abc"], timeout=5), range(8)))
+
+        httpd.shutdown()
+        server_thread.join()
+        httpd.server_close()
+
+    assert [resp.json() for resp in responses] == [[f"{idx}", "cba"] for idx in range(8)]
+    assert len(predict.calls) < 8
+
+
+class ThreadRecordingModel(DummyModel):
+    def __init__(self):
+        self.threads = set()
+
+    def predict(self, to_predict):
+        self.threads.add(threading.current_thread().name)
+        return super().predict(to_predict)
+
+
+def test_keep_alive_server():
+    model = ThreadRecordingModel()
+    with MachineLearningModelServer("localhost", 0).running(model) as httpd:
+        host, port = httpd.server_address[:2]
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+
+        # a slow client that never finishes its request does not block others:
+        slow = socket.create_connection((host, port))
+        slow.sendall(b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\nabc")
+
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        for text in ("abc", "def", "ghi"):
+            connection.request("POST", "/", body=text)
+            resp = connection.getresponse()
+            assert resp.status == 200
+            assert resp.getheader("Connection") != "close"
+            assert json.loads(resp.read()) == [text[::-1]]
+
+        # the same connection (and socket) was reused for every request:
+        assert connection.sock is not None
+        connection.close()
+        slow.close()
+
+        httpd.shutdown()
+        server_thread.join()
+
+    # the model only ran on the inference worker:
+    assert model.threads == {"vst-batcher"}
+
+
+def test_chunked_post_body():
+    with MachineLearningModelServer("localhost", 0).running(DummyModel()) as httpd:
+        host, port = httpd.server_address[:2]
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+
+        # a chunked body is read completely, so the connection can be reused for the next request:
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        connection.request("POST", "/", body=iter([b"ab", b"c"]), encode_chunked=True)
+        resp = connection.getresponse()
+        assert resp.status == 200
+        assert json.loads(resp.read()) == ["cba"]
+        connection.request("GET", "/?query=next")
+        assert json.loads(connection.getresponse().read()) == ["txen"]
+        connection.close()
+
+        # invalid framing closes the connection instead of parsing the rest of the body as a new request:
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.sendall(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\nGET /?query=x HTTP/1.1\r\n\r\n")
+            received = b""
+            while data := sock.recv(65536):
+                received += data
+        assert received.startswith(b"HTTP/1.1 400")
+        assert b"Connection: close" in received
+        assert received.count(b"HTTP/1.1") == 1
+
+        httpd.shutdown()
+        server_thread.join()
+
+
+class SlowModel(DummyModel):
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.inputs = []
+
+    def predict(self, to_predict):
+        self.inputs.extend(to_predict)
+        time.sleep(self.delay)
+        return super().predict(to_predict)
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, dict[str, str], bytes]:
+    status = int((await reader.readuntil(b"\r\n")).split()[1])
+    headers = {}
+    while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    return status, headers, await reader.readexactly(int(headers["content-length"]))
+
+
+def test_async_server():
+    async def scenario():
+        async with AsyncModelServer("localhost", 0).running(DummyModel()) as server:
+            host, port = server.sockets[0].getsockname()[:2]
+            url = f"http://{host}:{port}"
+
+            # same semantics as the http.server based handler:
+            get = functools.partial(asyncio.to_thread, requests.get, timeout=5)
+            post = functools.partial(asyncio.to_thread, requests.post, timeout=5)
+            assert (await get(url)).status_code == 400
+            assert (await get(f"{url}?something=else")).status_code == 400
+            assert (await post(url)).status_code == 400
+            assert (await post(url, json=[])).status_code == 400
+            assert (await post(url, data="{", headers={"Content-Type": "application/json"})).status_code == 400
+            assert (await post(url, data="False", headers={"Content-Type": "application/json"})).status_code == 400
+            assert (await get(f"{url}?query=added")).json() == ["dedda"]
+            assert (await post(url, data="something")).json() == ["gnihtemos"]
+            assert (await post(url, json="something")).json() == ["gnihtemos"]
+            assert (await post(url, json=["abc", "def"])).json() == ["cba", "fed"]
+            assert (await asyncio.to_thread(requests.put, url, timeout=5)).status_code == 501
+
+            # pipelined requests on one connection are answered in order:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(
+                b"GET /?query=first HTTP/1.1\r\nHost: x\r\n\r\n"
+                b"POST / HTTP/1.1\r\nContent-Length: 6\r\n\r\nsecond"
+                b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nthi\r\n2\r\nrd\r\n0\r\n\r\n"
+            )
+            responses = [await _read_response(reader) for _ in range(3)]
+            assert [json.loads(body) for _, _, body in responses] == [["tsrif"], ["dnoces"], ["driht"]]
+
+            # malformed requests get a 400 and the connection is closed:
+            writer.write(b"nonsense\r\n\r\n")
+            status, headers, _ = await _read_response(reader)
+            assert status == 400
+            assert headers["connection"] == "close"
+            assert await reader.read() == b""
+            writer.close()
+
+            # many idle connections are fine:
+            connections = [await asyncio.open_connection(host, port) for _ in range(200)]
+            assert (await get(f"{url}?query=still+fine")).json() == ["enif llits"]
+            for _, idle in connections:
+                idle.close()
+
+    asyncio.run(scenario())
+
+
+def test_async_server_cancels_on_disconnect():
+    model = SlowModel(delay=0.3)
+
+    async def scenario():
+        async with AsyncModelServer("localhost", 0).running(model) as server:
+            host, port = server.sockets[0].getsockname()[:2]
+
+            # keeps the inference worker busy:
+            busy_reader, busy_writer = await asyncio.open_connection(host, port)
+            busy_writer.write(b"GET /?query=busy HTTP/1.1\r\n\r\n")
+            await asyncio.sleep(0.1)
+
+            # queued behind 'busy', but the client is gone before its turn:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.write(b"GET /?query=gone HTTP/1.1\r\n\r\n")
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            writer.close()
+
+            status, _, body = await _read_response(busy_reader)
+            assert status == 200
+            assert json.loads(body) == ["ysub"]
+            busy_writer.close()
+            await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert model.inputs == ["busy"]
+
+
+def test_cached_servers():
+    model = SlowModel(delay=0)
+
+    with MachineLearningModelServer("localhost", 0, cache=PredictionCache(max_entries=100)).running(model) as httpd:
+        url = "http://{}:{}".format(*httpd.server_address[:2])
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+
+        assert requests.post(url, json=["abc", "def"], timeout=5).json() == ["cba", "fed"]
+        assert requests.post(url, json=["def", "ghi"], timeout=5).json() == ["fed", "ihg"]
+        assert requests.get(f"{url}?query=abc", timeout=5).json() == ["cba"]
+        stats = requests.get(f"{url}/cache", timeout=5).json()
+
+        httpd.shutdown()
+        server_thread.join()
+
+    assert model.inputs == ["abc", "def", "ghi"]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+
+    async def scenario():
+        model.inputs.clear()
+        async with AsyncModelServer("localhost", 0, cache=PredictionCache()).running(model) as server:
+            url = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+            post = functools.partial(asyncio.to_thread, requests.post, timeout=5)
+            assert (await post(url, json=["abc", "def"])).json() == ["cba", "fed"]
+            assert (await post(url, json=["def", "abc"])).json() == ["fed", "cba"]
+            stats = (await asyncio.to_thread(requests.get, f"{url}/cache", timeout=5)).json()
+            assert stats["hits"] == 2
+
+        async with AsyncModelServer("localhost", 0).running(model) as server:
+            url = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+            assert (await asyncio.to_thread(requests.get, f"{url}/cache", timeout=5)).status_code == 404
+
+    asyncio.run(scenario())
+    assert model.inputs == ["abc", "def"]
+
+
+def _stream_lines(host: str, port: int) -> None:
+    """
+    Send a chunked NDJSON body and check that results of the first chunk arrive before the body is complete.
+    """
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.sendall(
+            b"POST /predict/stream HTTP/1.1\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+        sock.sendall(chunk(b'"abc"\n"def"\n"unfin'))
+        reader = sock.makefile("rb")
+        assert reader.readline().startswith(b"HTTP/1.1 200")
+        headers = {}
+        while (line := reader.readline()) != b"\r\n":
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+        assert headers["transfer-encoding"] == "chunked"
+        assert headers["content-type"] == "application/x-ndjson"
+
+        def read_chunk() -> bytes:
+            size = int(reader.readline(), 16)
+            data = reader.read(size)
+            reader.readline()
+            return data
+
+        # first results, before the rest of the body was sent:
+        assert read_chunk() == b'"cba"\n"fed"\n'
+
+        sock.sendall(chunk(b'ished"\n{invalid\n' + b"".join(b'"%d"\n' % idx for idx in range(100))) + LAST_CHUNK)
+        lines = []
+        while data := read_chunk():
+            lines.extend(data.splitlines())
+
+        assert lines[0] == b'"dehsinifnu"'
+        assert json.loads(lines[1])["error"].startswith("Invalid JSON")
+        assert [json.loads(line) for line in lines[2:]] == [str(idx)[::-1] for idx in range(100)]
+
+
+def _invalid_streams(host: str, port: int) -> None:
+    """
+    Send stream bodies that can't be read: an error response before the first results, an error line after them.
+    """
+    url = f"http://{host}:{port}/predict/stream"
+    resp = requests.post(url, data=b"x" * (MAX_LINE_BYTES + 1), timeout=5)
+    assert resp.status_code == 413
+
+    head = b"POST /predict/stream HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.sendall(head + b"zz\r\n")
+        assert sock.makefile("rb").readline().startswith(b"HTTP/1.1 400")
+
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.sendall(head + chunk(b"abc\n"))
+        reader = sock.makefile("rb")
+        assert reader.readline().startswith(b"HTTP/1.1 200")
+        while reader.readline() != b"\r\n":
+            pass
+        assert reader.readline() == b"6\r\n"
+        assert reader.readline() == b'"cba"\n'
+
+        sock.sendall(b"zz\r\n")
+        reader.readline()  # \r\n after the chunk
+        size = int(reader.readline(), 16)
+        assert json.loads(reader.read(size)) == {"error": "Invalid chunk size"}
+        reader.readline()
+        assert reader.read() == LAST_CHUNK  # and the connection is closed
+
+
+def test_stream_endpoint():
+    with MachineLearningModelServer("localhost", 0).running(DummyModel()) as httpd:
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        host, port = httpd.server_address[:2]
+
+        _stream_lines(host, port)
+        _invalid_streams(host, port)
+
+        # plain text lines with a Content-Length:
+        resp = requests.post(f"http://{host}:{port}/predict/stream", data="abc\ndef\n", timeout=5)
+        assert resp.headers["Transfer-Encoding"] == "chunked"
+        assert [json.loads(line) for line in resp.iter_lines()] == ["cba", "fed"]
+
+        httpd.shutdown()
+        server_thread.join()
+
+    async def scenario():
+        async with AsyncModelServer("localhost", 0).running(DummyModel()) as server:
+            host, port = server.sockets[0].getsockname()[:2]
+            await asyncio.to_thread(_stream_lines, host, port)
+            await asyncio.to_thread(_invalid_streams, host, port)
+
+            # a normal request on the same connection after a stream still works:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(
+                b"POST /predict/stream HTTP/1.1\r\nContent-Length: 8\r\n\r\nabc\ndef\n"
+                b"GET /?query=after HTTP/1.1\r\n\r\n"
+            )
+            assert (await reader.readuntil(b"\r\n\r\n")).startswith(b"HTTP/1.1 200")
+            assert int(await reader.readline(), 16) == 12
+            assert await reader.readexactly(12) == b'"cba"\n"fed"\n'
+            assert await reader.readuntil(b"\r\n0\r\n\r\n") == b"\r\n0\r\n\r\n"
+            _, _, body = await _read_response(reader)
+            assert json.loads(body) == ["retfa"]
+            writer.close()
+
+    asyncio.run(scenario())
+
+
+def _parse_metrics(text: str) -> dict[str, float]:
+    return {
+        name: float(value)
+        for line in text.splitlines()
+        if line and not line.startswith("#")
+        for name, value in [line.rsplit(" ", 1)]
+    }
+
+
+def test_metrics_endpoint():
+    server = MachineLearningModelServer("localhost", 0)
+    with server.running(DummyModel()) as httpd:
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        url = "http://{}:{}".format(*httpd.server_address[:2])
+
+        requests.post(url, json=["abc", "def"], timeout=5)
+        requests.get(f"{url}?query=abc", timeout=5)
+        requests.get(url, timeout=5)
+        resp = requests.get(f"{url}/metrics", timeout=5)
+
+        httpd.shutdown()
+        server_thread.join()
+
+    assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    metrics = _parse_metrics(resp.text)
+    assert metrics['vst_requests_total{status="200"}'] == 2
+    assert metrics['vst_requests_total{status="400"}'] == 1
+    assert metrics["vst_predicted_items_total"] == 3
+    assert metrics["vst_batch_size_count"] == 2
+    assert metrics['vst_request_stage_seconds_count{stage="predict"}'] == 2
+    assert metrics['vst_request_stage_seconds_count{stage="queue"}'] == 2
+    assert metrics['vst_request_stage_seconds_count{stage="serialize"}'] == 2
+    # the /metrics request itself is rendered before its parse stage is recorded:
+    assert metrics['vst_request_stage_seconds_count{stage="parse"}'] == 3
+    assert metrics["vst_requests_in_flight"] == 1  # the /metrics request itself
+    assert metrics["process_resident_memory_bytes"] > 0
+
+    async def scenario():
+        async with AsyncModelServer("localhost", 0).running(DummyModel()) as server:
+            url = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+            await asyncio.to_thread(requests.post, url, json=["abc"], timeout=5)
+            await asyncio.to_thread(requests.put, url, timeout=5)
+            return (await asyncio.to_thread(requests.get, f"{url}/metrics", timeout=5)).text
+
+    metrics = _parse_metrics(asyncio.run(scenario()))
+    assert metrics['vst_requests_total{status="200"}'] == 1
+    assert metrics['vst_requests_total{status="501"}'] == 1
+    assert metrics["vst_predicted_items_total"] == 1
+    assert metrics['vst_request_stage_seconds_count{stage="serialize"}'] == 2
+
+
+class GatedModel(DummyModel):
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict(self, to_predict):
+        self.release.wait(5)
+        return super().predict(to_predict)
+
+
+def test_warmup_and_health_endpoints():
+    model = GatedModel()
+    server = MachineLearningModelServer("localhost", 0, warmup=Warmup(batch_sizes=(1, 2), rounds=1))
+    with server.running(model) as httpd:
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        url = "http://{}:{}".format(*httpd.server_address[:2])
+
+        # the warmup is blocked, but health checks don't touch the model:
+        assert requests.get(f"{url}/healthz", timeout=1).json() == {"status": "ok"}
+        resp = requests.get(f"{url}/readyz", timeout=1)
+        assert resp.status_code == 503
+        assert resp.json() == {"status": "warming up"}
+        assert requests.get(f"{url}?query=abc", timeout=1).status_code == 503
+        resp = requests.post(f"{url}/predict/stream", data=b"abc\n", timeout=1)
+        assert resp.status_code == 503
+        assert resp.headers["Connection"] == "close"
+
+        model.release.set()
+        assert server.readiness.wait(5)
+        resp = requests.get(f"{url}/readyz", timeout=1)
+        assert resp.status_code == 200
+        assert resp.json()["status"] == "ready"
+        assert requests.get(f"{url}?query=abc", timeout=1).json() == ["cba"]
+
+        httpd.shutdown()
+        server_thread.join()
+
+    async def scenario():
+        model = GatedModel()
+        server = AsyncModelServer("localhost", 0, warmup=Warmup())
+        async with server.running(model) as running:
+            url = "http://{}:{}".format(*running.sockets[0].getsockname()[:2])
+            healthz = await asyncio.to_thread(requests.get, f"{url}/healthz", timeout=1)
+            readyz = await asyncio.to_thread(requests.get, f"{url}/readyz", timeout=1)
+            refused = await asyncio.to_thread(requests.post, url, json=["abc"], timeout=1)
+            stream = await asyncio.to_thread(requests.post, f"{url}/predict/stream", data=b"abc\n", timeout=1)
+
+            model.release.set()
+            await asyncio.to_thread(server.readiness.wait, 5)
+            ready = await asyncio.to_thread(requests.get, f"{url}/readyz", timeout=1)
+            predicted = await asyncio.to_thread(requests.post, url, json=["abc"], timeout=1)
+        return healthz, readyz, refused, stream, ready, predicted
+
+    healthz, readyz, refused, stream, ready, predicted = asyncio.run(scenario())
+    assert healthz.status_code == 200
+    assert (readyz.status_code, refused.status_code, stream.status_code) == (503, 503, 503)
+    assert ready.status_code == 200
+    assert predicted.json() == ["cba"]
+
+
+def test_models_directory(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / f"{name}.vst").write_bytes(b"x" * 100)
+
+    load = RecordingLoad()
+    server = MachineLearningModelServer("localhost", 0, pool=ModelPool(tmp_path, memory_budget=150, load=load))
+    with server.running(None) as httpd:
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        url = "http://{}:{}".format(*httpd.server_address[:2])
+
+        assert requests.get(f"{url}/models/a/predict?query=abc", timeout=5).json() == ["a:cba"]
+        assert requests.post(f"{url}/models/b/predict", json=["abc", "de"], timeout=5).json() == ["b:cba", "b:ed"]
+        resp = requests.post(f"{url}/models/a/predict/stream", data=b"abc\nde\n", timeout=5)
+        assert resp.text == '"a:cba"\n"a:ed"\n'
+
+        stats = requests.get(f"{url}/models", timeout=5).json()
+        assert stats["available"] == ["a", "b"]
+        assert list(stats["loaded"]) == ["a"]  # b was evicted to stay within the budget
+
+        assert requests.get(f"{url}/models/c/predict?query=abc", timeout=5).status_code == 404
+        assert requests.get(f"{url}/models/a/other?query=abc", timeout=5).status_code == 404
+        assert requests.get(f"{url}/?query=abc", timeout=5).status_code == 404  # no default model
+        assert requests.get(f"{url}/healthz", timeout=5).status_code == 200
+
+        httpd.shutdown()
+        server_thread.join()
+
+    assert load.calls == ["a", "b", "a"]
+    assert server.pool.stats()["loaded"] == {}  # unloaded when the server stopped
+
+    async def scenario():
+        server = AsyncModelServer("localhost", 0, pool=ModelPool(tmp_path, load=RecordingLoad()))
+        # the default model is served next to the pool:
+        async with server.running(DummyModel()) as running:
+            url = "http://{}:{}".format(*running.sockets[0].getsockname()[:2])
+            # one client thread, the server loads models on the default executor as well:
+            return await asyncio.to_thread(
+                lambda: [
+                    requests.get(f"{url}/models/a/predict?query=abc", timeout=5),
+                    requests.post(f"{url}/models/b/predict", json=["abc"], timeout=5),
+                    requests.post(f"{url}/models/b/predict/stream", data=b"abc\n", timeout=5),
+                    requests.get(f"{url}/?query=abc", timeout=5),
+                    requests.get(f"{url}/models/c/predict?query=abc", timeout=5),
+                    requests.post(f"{url}/models/c/predict/stream", data=b"abc\n", timeout=5),
+                ]
+            )
+
+    a, b, stream, default, missing, missing_stream = asyncio.run(scenario())
+    assert a.json() == ["a:cba"]
+    assert b.json() == ["b:cba"]
+    assert stream.text == '"b:cba"\n'
+    assert default.json() == ["cba"]
+    assert (missing.status_code, missing_stream.status_code) == (404, 404)
+
+
+def test_reload_endpoint(tmp_path):
+    path = tmp_path / "model.vst"
+    path.write_text("v1")
+
+    reloader = ModelReloader(str(path), load=load_version, watch_interval=None)
+    cache = PredictionCache()
+    server = MachineLearningModelServer("localhost", 0, cache=cache, reloader=reloader)
+    with server.running(load_version(str(path))) as httpd:
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        url = "http://{}:{}".format(*httpd.server_address[:2])
+
+        assert requests.get(f"{url}?query=abc", timeout=5).json() == ["v1:cba"]
+        path.write_text("v2")
+        resp = requests.post(f"{url}/admin/reload", timeout=5)
+        assert resp.status_code == 202
+        wait_for(reloader)
+
+        # the cache was cleared on the swap:
+        assert requests.get(f"{url}?query=abc", timeout=5).json() == ["v2:cba"]
+        assert requests.get(f"{url}/admin/reload", timeout=5).json()["reloads"] == 1
+
+        httpd.shutdown()
+        server_thread.join()
+
+    async def scenario():
+        reloader = ModelReloader(str(path), load=load_version, watch_interval=None)
+        async with AsyncModelServer("localhost", 0, reloader=reloader).running(load_version(str(path))) as server:
+            url = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+            path.write_text("v3")
+            accepted = await asyncio.to_thread(requests.post, f"{url}/admin/reload", timeout=5)
+            await asyncio.to_thread(wait_for, reloader)
+            predicted = await asyncio.to_thread(requests.get, f"{url}?query=abc", timeout=5)
+
+        async with AsyncModelServer("localhost", 0).running(DummyModel()) as server:
+            url = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+            disabled = await asyncio.to_thread(requests.post, f"{url}/admin/reload", timeout=5)
+        return accepted, predicted, disabled
+
+    accepted, predicted, disabled = asyncio.run(scenario())
+    assert accepted.status_code == 202
+    assert predicted.json() == ["v3:cba"]
+    assert disabled.status_code == 404
+
+
+def _shed_load(url: str) -> dict[str, float]:
+    """
+    Overload a server with max_queue=1 and a model that takes 0.3s per batch, returns its metrics afterwards.
+    """
+    with ThreadPoolExecutor(2) as executor:
+        busy = executor.submit(requests.get, f"{url}?query=busy", timeout=5)
+        time.sleep(0.1)
+        queued = executor.submit(requests.get, f"{url}?query=queued", timeout=5)
+        time.sleep(0.1)
+
+        # the queue is full, so this one is rejected right away:
+        full = requests.get(f"{url}?query=full", timeout=5)
+        assert full.status_code == 503
+        assert full.headers["Retry-After"] == "1"
+        assert busy.result().json() == ["ysub"]
+        assert queued.result().json() == ["deueuq"]
+
+        # waits behind 'busy' for longer than its deadline, so it's dropped before the model sees it:
+        busy = executor.submit(requests.get, f"{url}?query=busy", timeout=5)
+        time.sleep(0.1)
+        late = requests.post(url, data="late", headers={DEADLINE_HEADER: "50"}, timeout=5)
+        assert late.status_code == 504
+        assert busy.result().status_code == 200
+
+    assert requests.get(f"{url}?query=abc", headers={DEADLINE_HEADER: "soon"}, timeout=5).status_code == 400
+    assert requests.get(f"{url}?query=abc", headers={DEADLINE_HEADER: "5000"}, timeout=5).json() == ["cba"]
+    return _parse_metrics(requests.get(f"{url}/metrics", timeout=5).text)
+
+
+def test_load_shedding():
+    model = SlowModel(delay=0.3)
+    with MachineLearningModelServer("localhost", 0, max_queue=1).running(model) as httpd:
+        server_thread = Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        metrics = _shed_load("http://{}:{}".format(*httpd.server_address[:2]))
+
+        httpd.shutdown()
+        server_thread.join()
+
+    assert model.inputs == ["busy", "queued", "busy", "abc"]
+    assert metrics['vst_requests_total{status="503"}'] == 1
+    assert metrics['vst_requests_total{status="504"}'] == 1
+    assert metrics['vst_rejected_requests_total{reason="queue_full"}'] == 1
+    assert metrics['vst_rejected_requests_total{reason="deadline"}'] == 1
+    assert metrics["vst_queued_inputs"] == 0
+
+    model = SlowModel(delay=0.3)
+
+    async def scenario():
+        async with AsyncModelServer("localhost", 0, max_queue=1).running(model) as server:
+            url = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+            # a single thread for the client, the server needs the default executor too:
+            return await asyncio.to_thread(_shed_load, url)
+
+    metrics = asyncio.run(scenario())
+    assert model.inputs == ["busy", "queued", "busy", "abc"]
+    assert metrics['vst_rejected_requests_total{reason="queue_full"}'] == 1
+    assert metrics['vst_rejected_requests_total{reason="deadline"}'] == 1
@@ -0,0 +1,86 @@
+import json
+import subprocess  # nosec
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.verysimpletransformers.metadata import _package_version, get_simpletransformers_version
+from tests.helpers_for_test import _get_v1_dummy
+
+ROOT = Path(__file__).parent.parent
+
+# these take seconds to import, and should only be loaded when a model is actually (un)pickled:
+HEAVY_MODULES = ("torch", "transformers", "simpletransformers", "numpy", "dill", "tqdm", "questionary")
+
+BENCHMARK = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in sys.modules if name.split(".")[0] in {heavy})
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def _benchmark(code: str) -> tuple[float, list[str]]:
+    script = BENCHMARK.format(code=code, heavy=HEAVY_MODULES)
+    result = subprocess.run(  # nosec
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["elapsed"], data["heavy"]
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import src.verysimpletransformers",
+        "import src.verysimpletransformers.cli",
+        "from src.verysimpletransformers.cli import show_help; show_help()",
+    ],
+)
+def test_import_time(code):
+    elapsed, heavy = _benchmark(code)
+
+    assert not heavy
+    # generous limit for slow CI machines, importing torch alone takes longer than this:
+    assert elapsed < 1.0
+
+
+def test_show_time():
+    _get_v1_dummy(ROOT / "pytest-startup.vst")
+
+    try:
+        elapsed, heavy = _benchmark(
+            "from src.verysimpletransformers.cli import show_info, list_catalog\n"
+            "show_info('pytest-startup.vst')\n"
+            "list_catalog(['pytest-startup.vst'])"
+        )
+    finally:
+        (ROOT / "pytest-startup.vst").unlink()
+
+    assert not heavy
+    assert elapsed < 2.0
+
+
+def test_recompress_without_torch():
+    _get_v1_dummy(ROOT / "pytest-recompress.vst")
+
+    try:
+        _, heavy = _benchmark(
+            "from src.verysimpletransformers.core import recompress\n"
+            "recompress('pytest-recompress.vst', 'pytest-recompress.vst', compression=9, chunk_size=0)"
+        )
+    finally:
+        (ROOT / "pytest-recompress.vst").unlink()
+
+    assert not heavy
+
+
+def test_version_cache():
+    _package_version.cache_clear()
+
+    version = get_simpletransformers_version()
+    assert repr(get_simpletransformers_version()) == repr(version)
+    assert _package_version.cache_info().hits >= 1
@@ -0,0 +1,87 @@
+import io
+import time
+
+import pytest
+import torch
+
+from src.verysimpletransformers.core import from_vst, read_metadata, to_vst
+from src.verysimpletransformers.timings import TimedReader, TimedWriter, TimingReport
+from src.verysimpletransformers.types import DummyModel
+
+
+class ProgressCounter:
+    def __init__(self):
+        self.total = 0
+
+    def update(self, num: int) -> None:
+        self.total += num
+
+
+def test_nested_stages():
+    report = TimingReport()
+
+    with report.stage("unpickle") as outer:
+        time.sleep(0.02)
+        with report.stage("read") as inner:
+            time.sleep(0.02)
+            inner.bytes += 2 * 1024 * 1024
+        outer.bytes += 1
+
+    # time of the nested stage is not counted twice:
+    assert report["read"].seconds == pytest.approx(0.02, abs=0.015)
+    assert report["unpickle"].seconds == pytest.approx(0.02, abs=0.015)
+    assert report.total == pytest.approx(0.04, abs=0.02)
+    assert report["read"].throughput == pytest.approx(2 / report["read"].seconds)
+
+    # pipeline order:
+    assert list(report.as_dict()) == ["read", "unpickle"]
+    assert report.format().splitlines()[1].startswith("read")
+    assert "TimingReport<" in repr(report)
+    assert "Stage<read" in repr(report["read"])
+
+
+def test_timed_file_wrappers():
+    report = TimingReport()
+    progress = ProgressCounter()
+
+    reader = TimedReader(io.BytesIO(b"first line\nrest"), report, "read", progress)
+    assert reader.readline() == b"first line\n"
+    assert reader.read(2) == b"re"
+    buffer = bytearray(10)
+    assert reader.readinto(buffer) == 2
+    assert reader.peek() == b""
+    assert reader.tell() == 15
+    assert reader.bytes_read == report["read"].bytes == progress.total == 15
+
+    target = io.BytesIO()
+    writer = TimedWriter(target, report, "write", progress)
+    assert writer.write(memoryview(b"abc")) == 3
+    assert target.getvalue() == b"abc"
+    assert report["write"].bytes == 3
+    assert progress.total == 18
+
+
+@pytest.mark.parametrize("payload_format", ["dill", "tensors", "mmap"])
+def test_save_and_load_timings(payload_format):
+    model = DummyModel()
+    model.weights = torch.ones(256 * 1024)  # 1 MB
+
+    save_report = TimingReport()
+    output = io.BytesIO()
+    to_vst(model, output, payload_format=payload_format, timings=save_report)
+
+    assert set(save_report.stages) == {"pickle", "compress", "write"}
+    assert save_report["pickle"].bytes >= 1024 * 1024
+    output.seek(0)
+    assert save_report["write"].bytes == read_metadata(output).content_length
+
+    load_report = TimingReport()
+    loaded = from_vst(io.BytesIO(output.getvalue()), timings=load_report)
+    assert torch.equal(loaded.weights, model.weights)
+
+    assert {"read", "unpickle"} <= set(load_report.stages)
+    assert ("decompress" in load_report.stages) == (payload_format != "mmap")
+    assert "device move" not in load_report.stages  # only cpu
+    # the whole file is read:
+    assert load_report["read"].bytes == len(output.getvalue())
+    assert load_report.total > 0
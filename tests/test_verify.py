@@ -0,0 +1,81 @@
+import io
+from pathlib import Path
+
+import pytest
+import typer
+
+from src.verysimpletransformers.cli import verify
+from src.verysimpletransformers.core import to_vst
+from src.verysimpletransformers.types import DummyModel
+from src.verysimpletransformers.verify import verify_files, verify_vst
+from tests.helpers_for_test import _get_corrupted_vst, _get_v0_dummy
+
+
+def _valid_vst(**kw) -> bytes:
+    output = io.BytesIO()
+    to_vst(DummyModel(), output, **kw)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("kw", [{}, {"chunk_size": 0}, {"payload_format": "mmap"}])
+def test_verify_vst(kw):
+    data = _valid_vst(**kw)
+
+    assert verify_vst(io.BytesIO(data)) == (True, "checksum ok")
+
+    corrupted = bytearray(data)
+    corrupted[-10] ^= 0xFF
+    valid, description = verify_vst(io.BytesIO(bytes(corrupted)))
+    assert not valid
+    assert "checksum mismatch" in description
+
+    valid, description = verify_vst(io.BytesIO(data[:-10]))
+    assert not valid
+    assert "truncated" in description
+
+    valid, description = verify_vst(io.BytesIO(data + b"extra"))
+    assert not valid
+    assert "after the payload" in description
+
+    valid, description = verify_vst(io.BytesIO(b"not a vst file"))
+    assert not valid
+    assert "invalid file" in description
+
+
+def test_verify_without_checksum(tmp_path: Path):
+    fp = tmp_path / "v0.vst"
+    _get_v0_dummy(fp)
+
+    valid, description = verify_vst(fp)
+    assert valid
+    assert "no checksum" in description
+
+    fp.write_bytes(fp.read_bytes()[:-5])
+    valid, _ = verify_vst(fp)
+    assert not valid
+
+    with _get_corrupted_vst(reason="compression") as f:
+        assert not verify_vst(f)[0]
+
+
+def test_verify_files(tmp_path, capsys):
+    (tmp_path / "nested").mkdir()
+    for idx in range(3):
+        (tmp_path / "nested" / f"model{idx}.vst").write_bytes(_valid_vst())
+
+    (tmp_path / "broken.vst").write_bytes(_valid_vst()[:-1])
+    (tmp_path / "ignored.txt").write_text("not a model")
+
+    results = list(verify_files([tmp_path], workers=2))
+    assert [path.name for path, _, _ in results] == ["broken.vst", "model0.vst", "model1.vst", "model2.vst"]
+    assert [valid for _, valid, _ in results] == [False, True, True, True]
+
+    verify([str(tmp_path / "nested")])
+    assert "3/3 files are valid" in capsys.readouterr().out
+
+    with pytest.raises(typer.Exit):
+        verify([str(tmp_path)])
+
+    captured = capsys.readouterr().out
+    assert "FAILED" in captured
+    assert "3/4 files are valid" in captured
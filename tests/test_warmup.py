@@ -0,0 +1,48 @@
+import pytest
+
+from src.verysimpletransformers.warmup import Readiness, Warmup
+
+from tests.helpers_for_test import RecordingPredict
+
+
+def test_warmup_batches():
+    warmup = Warmup(batch_sizes=(1, 4), input_lengths=(3, 10), rounds=2)
+    batches = list(warmup.batches())
+    assert [len(batch) for batch in batches] == [1, 1, 1, 1, 4, 4, 4, 4]
+    assert [len(batch[0].split()) for batch in batches] == [3, 3, 10, 10, 3, 3, 10, 10]
+
+    # samples are used as-is with length 0:
+    warmup = Warmup(batch_sizes=(3,), input_lengths=(0,), samples=("a typical query", "another"))
+    assert list(warmup.batches()) == [["a typical query", "another", "a typical query"]]
+
+    predict = RecordingPredict()
+    assert Warmup(batch_sizes=(2,), input_lengths=(5,), rounds=3).run(predict) >= 0
+    assert [len(call) for call in predict.calls] == [2, 2, 2]
+
+
+def test_readiness():
+    readiness = Readiness()
+    assert not readiness.ready
+    assert readiness.start(RecordingPredict()) is None
+    assert readiness.ready
+    assert readiness.status()["status"] == "ready"
+
+    predict = RecordingPredict(delay=0.05)
+    thread = readiness.start(predict, Warmup(batch_sizes=(1,), input_lengths=(4,)))
+    assert not readiness.ready
+    assert readiness.status() == {"status": "warming up"}
+    assert readiness.wait(5)
+    thread.join()
+    assert readiness.status()["warmup_seconds"] >= 0.05
+    assert len(predict.calls) == 1
+
+
+def test_failed_warmup(capsys: pytest.CaptureFixture[str]):
+    def broken(_):
+        raise RuntimeError("out of memory")
+
+    readiness = Readiness()
+    readiness.start(broken, Warmup()).join()
+    assert not readiness.ready
+    assert readiness.status() == {"status": "warmup failed", "error": "RuntimeError: out of memory"}
+    assert "out of memory" in capsys.readouterr().err